@@ -0,0 +1,162 @@
+"""
+Counts the CA callbacks handled per second with a permanent "control"
+subscription per PV, compared with reading the control metadata on connection
+and refreshing it from a shared CAControlPoller.
+
+No IOC is needed: a fake context delivers every value change to each of the
+PV's subscriptions, as an IOC does for "time" and "control" monitors with the
+default event mask, and answers control reads immediately.
+
+Usage: python -m benchmarks.ca_control_callbacks [--pvs 1000] [--rate 10] [--seconds 10] [--refresh-period 60000]
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from caproto import ChannelType, ReadNotifyResponse, TimeStamp, timestamp_to_epics
+
+from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.ca_control_poller import CAControlPoller
+from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+
+_CONTROL_RESPONSE = SimpleNamespace(metadata=SimpleNamespace(units=b"mm"))
+
+
+class _NullProducer:
+    def produce(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+class _CountingSubscription:
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+
+class _CountingPV:
+    def __init__(self, connection_state_callback):
+        self._connection_state_callback = connection_state_callback
+        self.subscriptions = []
+        self.callback_count = 0
+
+    def connect(self):
+        self._connection_state_callback(self, "connected")
+
+    def subscribe(self, data_type):
+        subscription = _CountingSubscription()
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def read(self, data_type, wait, callback):
+        self.callback_count += 1
+        callback(_CONTROL_RESPONSE)
+
+    def post_update(self, response):
+        for subscription in self.subscriptions:
+            for callback in subscription.callbacks:
+                self.callback_count += 1
+                callback(subscription, response)
+
+    def unsubscribe_all(self):
+        pass
+
+
+class _CountingContext:
+    def __init__(self):
+        self.pvs = []
+
+    def get_pvs(self, *pv_names, connection_state_callback):
+        pvs = [_CountingPV(connection_state_callback) for _ in pv_names]
+        self.pvs.extend(pvs)
+        return pvs
+
+
+def _run(args, use_poller: bool):
+    context = _CountingContext()
+    poller = CAControlPoller(args.refresh_period) if use_poller else None
+    producer = _NullProducer()
+    handlers = []
+    for index in range(args.pvs):
+        name = f"SIM:PV:{index}"
+        handlers.append(
+            CAUpdateHandler(
+                context,  # type: ignore
+                name,
+                create_serialiser_list(
+                    producer,  # type: ignore
+                    name,
+                    "topic",
+                    "f144",
+                    EpicsProtocol.CA,
+                    include_connection_status=False,
+                ),
+                control_poller=poller,
+            )
+        )
+        # Connect straight away so that the read on connection is counted
+        context.pvs[-1].connect()
+
+    updates_per_pv = int(args.rate * args.seconds)
+    refreshes = int(args.seconds * 1000 / args.refresh_period)
+    start_time = time.time()
+    start = time.perf_counter()
+    for update_index in range(updates_per_pv):
+        response = ReadNotifyResponse(
+            np.array([float(update_index)]),
+            ChannelType.TIME_DOUBLE,
+            1,
+            1,
+            1,
+            metadata=(
+                0,
+                0,
+                TimeStamp(*timestamp_to_epics(start_time + update_index / args.rate)),
+            ),
+        )
+        for pv in context.pvs:
+            pv.post_update(response)
+        if poller is not None and refreshes:
+            if update_index % max(1, updates_per_pv // refreshes) == 0:
+                poller.refresh_all()
+    elapsed = time.perf_counter() - start
+
+    for handler in handlers:
+        handler.stop()
+    if poller is not None:
+        poller.stop()
+    callbacks = sum(pv.callback_count for pv in context.pvs)
+    return callbacks / args.seconds, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pvs", type=int, default=1000)
+    parser.add_argument(
+        "--rate", type=float, default=10, help="Updates per second per PV"
+    )
+    parser.add_argument("--seconds", type=float, default=10, help="Simulated duration")
+    parser.add_argument(
+        "--refresh-period", type=int, default=60_000, help="Control refresh period (ms)"
+    )
+    args = parser.parse_args()
+
+    monitor_rate, monitor_elapsed = _run(args, use_poller=False)
+    poller_rate, poller_elapsed = _run(args, use_poller=True)
+    print(
+        f"control subscription: {monitor_rate:.0f} callbacks/s ({monitor_elapsed:.2f} s to handle)"
+    )
+    print(
+        f"control poller: {poller_rate:.0f} callbacks/s ({poller_elapsed:.2f} s to handle)"
+    )
+    print(f"reduction: {100 * (1 - poller_rate / monitor_rate):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Times increments of a Counter from many threads at once, as from Kafka
+delivery callbacks, for the sharded Counter compared with a Counter which
+takes a lock for every increment.
+
+Usage: python -m benchmarks.counter_contention [--threads 16] [--increments 100000]
+"""
+import argparse
+import time
+from threading import Barrier, Lock, Thread
+
+from forwarder.utils import Counter
+
+
+class _LockedCounter:
+    def __init__(self):
+        self._lock = Lock()
+        self._count = 0
+
+    def increment(self, amount: int = 1):
+        with self._lock:
+            self._count += amount
+
+    @property
+    def value(self) -> int:
+        with self._lock:
+            return self._count
+
+
+def _time_increments(counter, threads: int, increments: int) -> float:
+    barrier = Barrier(threads + 1)
+
+    def _increment():
+        barrier.wait()
+        for _ in range(increments):
+            counter.increment()
+
+    workers = [Thread(target=_increment) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    assert counter.value == threads * increments
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--increments", type=int, default=100_000)
+    args = parser.parse_args()
+
+    total = args.threads * args.increments
+    for label, counter in (
+        ("locked counter", _LockedCounter()),
+        ("sharded counter", Counter()),
+    ):
+        elapsed = _time_increments(counter, args.threads, args.increments)
+        print(f"{label}: {elapsed:.2f} s, {elapsed / total * 1e9:.0f} ns per increment")
+
+
+if __name__ == "__main__":
+    main()
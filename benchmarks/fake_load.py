@@ -0,0 +1,109 @@
+"""
+Runs many fake PVs for a few seconds, with a timer thread per PV generating
+one random value at a time as the fake update handler used to, compared with
+one FakeLoad generating the values of all of them in NumPy batches. Reports
+the updates handled per second, against those requested, and the CPU time
+per update.
+
+Usage: python -m benchmarks.fake_load [--pvs 1000] [--rate 10] [--duration 3]
+"""
+import argparse
+import threading
+import time
+from random import randint
+
+from p4p.nt import NTScalar
+
+from forwarder.channel_policy import FakeProfile
+from forwarder.common import EpicsProtocol
+from forwarder.repeat_timer import RepeatTimer
+from forwarder.update_handlers.decoded_update import decode_pva_update
+from forwarder.update_handlers.fake_load import FakeLoad
+from forwarder.update_handlers.fake_update_handler import FakeUpdateHandler
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+
+
+class _CountingProducer:
+    def __init__(self):
+        self.messages = 0
+
+    def produce(self, *args, **kwargs):
+        self.messages += 1
+
+    def close(self):
+        pass
+
+
+def _trackers(producer, index: int):
+    return create_serialiser_list(
+        producer, f"SIM:PV:{index}", "data", "f144", EpicsProtocol.FAKE  # type: ignore
+    )
+
+
+def _run_timer_per_pv(pvs: int, rate: float, duration_s: float, producer):
+    def _timer_callback(trackers):
+        response = NTScalar("i").wrap(randint(0, 100))
+        response.timeStamp["secondsPastEpoch"] = int(time.time())
+        decoded = decode_pva_update(response)
+        for tracker in trackers:
+            tracker.process_pva_message(response, decoded)
+
+    timers = []
+    for index in range(pvs):
+        timer = RepeatTimer(
+            1.0 / rate, _timer_callback, args=(_trackers(producer, index),)
+        )
+        timer.start()
+        timers.append(timer)
+    threads = threading.active_count()
+    time.sleep(duration_s)
+    for timer in timers:
+        timer.cancel()
+    return threads
+
+
+def _run_fake_load(pvs: int, rate: float, duration_s: float, producer):
+    fake_load = FakeLoad()
+    profile = FakeProfile(rate=rate)
+    handlers = [
+        FakeUpdateHandler(
+            _trackers(producer, index), "f144", 0, fake_load=fake_load, profile=profile
+        )
+        for index in range(pvs)
+    ]
+    threads = threading.active_count()
+    time.sleep(duration_s)
+    for handler in handlers:
+        handler.stop()
+    fake_load.stop()
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pvs", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    requested = args.pvs * args.rate
+    for label, run in (
+        ("timer per PV", _run_timer_per_pv),
+        ("fake load", _run_fake_load),
+    ):
+        producer = _CountingProducer()
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        threads = run(args.pvs, args.rate, args.duration, producer)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        # Each update publishes an f144 message, alarms are only published when they change
+        updates = producer.messages - args.pvs
+        print(
+            f"{label}: {threads} threads, {updates / elapsed:.0f} of {requested:.0f} "
+            f"updates per second, {cpu / max(updates, 1) * 1e6:.0f} us CPU per update"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures how long the forwarder entry point, and the modules needed for a
+CA or PVA channel, take to import in a new interpreter, using -X importtime.
+This is most of the start up time of a container and of --version.
+
+Usage: python -m benchmarks.import_time [--repeats 5] [--top 10]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+STAGES = {
+    "entry point": "import forwarder.scripts.run",
+    "entry point + CA f144": (
+        "import forwarder.scripts.run\n"
+        "import forwarder.update_handlers.ca_update_handler\n"
+        "from forwarder.common import EpicsProtocol\n"
+        "from forwarder.update_handlers.schema_serialiser_factory import SerialiserFactory\n"
+        "SerialiserFactory.create_serialiser(EpicsProtocol.CA, 'f144', 'PV')\n"
+    ),
+    "entry point + PVA f144": (
+        "import forwarder.scripts.run\n"
+        "import forwarder.update_handlers.pva_update_handler\n"
+        "from forwarder.common import EpicsProtocol\n"
+        "from forwarder.update_handlers.schema_serialiser_factory import SerialiserFactory\n"
+        "SerialiserFactory.create_serialiser(EpicsProtocol.PVA, 'f144', 'PV')\n"
+    ),
+}
+
+
+def _import_times_us(code: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Cumulative import time and nesting depth of each module imported by code
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                depth = (len(module) - len(module.lstrip())) // 2
+                times[module.strip()] = (int(cumulative), depth)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    for label, code in STAGES.items():
+        runs = [_import_times_us(code) for _ in range(args.repeats)]
+        # Only top level imports, so that nested imports are not counted twice.
+        # Modules imported with importlib are not logged, but their imports are
+        totals = [
+            sum(time_us for time_us, depth in run.values() if depth == 0)
+            for run in runs
+        ]
+        print(f"{label}: {statistics.median(totals) / 1000:.0f} ms")
+
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)
+    print(f"\nSlowest modules for '{label}' (cumulative):")
+    for module, (time_us, _) in slowest[: args.top]:
+        print(f"  {time_us / 1000:7.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Reports the resident memory used by the serialiser trackers for every 10k PVs.
+
+Usage: python -m benchmarks.memory_per_pv [--pvs 10000] [--schema f144] [--protocol ca]
+"""
+import argparse
+import gc
+import os
+
+from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+
+
+class _NullProducer:
+    def produce(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pvs", type=int, default=10_000)
+    parser.add_argument("--schema", default="f144")
+    parser.add_argument("--protocol", default="ca", choices=["ca", "pva"])
+    args = parser.parse_args()
+    protocol = EpicsProtocol(args.protocol)
+    producer = _NullProducer()
+
+    # Create one set first so that lazily created module state is not counted
+    create_serialiser_list(producer, "warm_up", "topic", args.schema, protocol)  # type: ignore
+    gc.collect()
+    rss_before = _rss_bytes()
+    trackers = [
+        create_serialiser_list(producer, f"SIM:PV:{index}", "topic", args.schema, protocol)  # type: ignore
+        for index in range(args.pvs)
+    ]
+    gc.collect()
+    rss_after = _rss_bytes()
+
+    per_pv = (rss_after - rss_before) / len(trackers)
+    print(
+        f"{len(trackers)} PVs ({args.protocol}, {args.schema}): "
+        f"{per_pv:.0f} bytes per PV, {per_pv * 10_000 / 2**20:.1f} MiB per 10k PVs"
+    )
+
+
+if __name__ == "__main__":
+    main()
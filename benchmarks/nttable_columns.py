@@ -0,0 +1,118 @@
+"""
+Times the serialisation of large NTTable updates by the nttable_senv and
+nttable_se00 serialisers, compared with reading every column with items()
+and finding the columns from the labels for each update as was done before.
+
+Usage: python -m benchmarks.nttable_columns [--updates 100] [--rows 100000]
+"""
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+from p4p import Value
+from p4p.nt import NTTable
+from streaming_data_types.array_1d_se00 import serialise_se00
+from streaming_data_types.sample_environment_senv import serialise_senv
+
+from forwarder.update_handlers.nttable_se00_serialiser import nttable_se00_PVASerialiser
+from forwarder.update_handlers.nttable_senv_serialiser import nttable_senv_PVASerialiser
+
+# Other columns of the table, which are not forwarded
+_EXTRA_COLUMNS = 4
+
+
+def _create_update(rows: int) -> Value:
+    columns = [("value", "ad"), ("timestamp", "aL")] + [
+        (f"extra{index}", "ad") for index in range(_EXTRA_COLUMNS)
+    ]
+    data = {
+        "value": np.random.default_rng().normal(1000, 100, rows),
+        "timestamp": np.arange(rows, dtype=np.uint64) * 1000
+        + 1_700_000_000_000_000_000,
+    }
+    for index in range(_EXTRA_COLUMNS):
+        data[f"extra{index}"] = np.zeros(rows)
+    return Value(
+        NTTable.buildType(columns=columns),
+        {"labels": [name for name, _ in columns], "value": data},
+    )
+
+
+def _extract_with_items(update: Value):
+    column_headers = update.labels
+    tables = update.value.items()
+    values = tables[column_headers.index("value")][1]
+    timestamps = tables[column_headers.index("timestamp")][1]
+    return values, timestamps
+
+
+def _time_items_senv(update: Value, number_of_updates: int) -> float:
+    start = time.perf_counter()
+    for counter in range(number_of_updates):
+        values, timestamps = _extract_with_items(update)
+        serialise_senv(
+            name="SIM:TABLE",
+            value_timestamps=timestamps,
+            values=values.round().astype(np.int64),
+            timestamp=datetime.fromtimestamp(timestamps[0] / 1e9),
+            message_counter=counter,
+            sample_ts_delta=timestamps[1] - timestamps[0],
+            channel=0,
+        )
+    return time.perf_counter() - start
+
+
+def _time_items_se00(update: Value, number_of_updates: int) -> float:
+    start = time.perf_counter()
+    for counter in range(number_of_updates):
+        values, timestamps = _extract_with_items(update)
+        serialise_se00(
+            name="SIM:TABLE",
+            value_timestamps=timestamps,
+            values=values,
+            timestamp_unix_ns=timestamps[0],
+            message_counter=counter,
+            sample_ts_delta=timestamps[1] - timestamps[0],
+            channel=0,
+        )
+    return time.perf_counter() - start
+
+
+def _time_serialiser(serialiser, update: Value, number_of_updates: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number_of_updates):
+        serialiser.serialise(update)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+    update = _create_update(args.rows)
+
+    for label, elapsed in (
+        ("senv, all columns per update", _time_items_senv(update, args.updates)),
+        (
+            "senv, cached columns",
+            _time_serialiser(
+                nttable_senv_PVASerialiser("SIM:TABLE"), update, args.updates
+            ),
+        ),
+        ("se00, all columns per update", _time_items_se00(update, args.updates)),
+        (
+            "se00, cached columns",
+            _time_serialiser(
+                nttable_se00_PVASerialiser("SIM:TABLE"), update, args.updates
+            ),
+        ),
+    ):
+        print(
+            f"{label}: {elapsed:.2f} s, {elapsed / args.updates * 1e3:.2f} ms per update"
+        )
+
+
+if __name__ == "__main__":
+    main()
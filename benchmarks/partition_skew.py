@@ -0,0 +1,72 @@
+"""
+Reports how evenly the messages of a realistic mix of PVs, a few hot ones and
+many slow ones, are spread over the partitions of a topic: with every PV
+partitioned by its key, and with the hot PVs spread over several partitions.
+
+Skew is the message rate of the busiest partition over the mean rate.
+
+Usage: python -m benchmarks.partition_skew [--partitions 12] [--hot-pvs 4] [--spread 4]
+"""
+import argparse
+from typing import List, Optional, Tuple
+
+from forwarder.kafka.partitioning import (
+    PARTITIONING_KEY,
+    PARTITIONING_PRECOMPUTED,
+    create_pv_partitioner,
+)
+
+
+def _pv_rates(args) -> List[Tuple[str, float, bool]]:
+    return [
+        (f"SIM:HOT:{index}", args.hot_rate, True) for index in range(args.hot_pvs)
+    ] + [(f"SIM:SLOW:{index}", args.slow_rate, False) for index in range(args.slow_pvs)]
+
+
+def _partition_rates(
+    pvs: List[Tuple[str, float, bool]], partitions: int, spread: Optional[int]
+) -> List[float]:
+    rates = [0.0] * partitions
+    for pv_name, rate, hot in pvs:
+        partitioner = create_pv_partitioner(
+            PARTITIONING_PRECOMPUTED,
+            pv_name.encode(),
+            partitions,
+            spread if hot else None,
+        )
+        assert partitioner is not None
+        # Messages go to each of the partitions of the PV in turn
+        for partition in partitioner.partitions:
+            rates[partition] += rate / len(partitioner.partitions)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--partitions", type=int, default=12)
+    parser.add_argument("--hot-pvs", type=int, default=4)
+    parser.add_argument("--hot-rate", type=float, default=1000.0)
+    parser.add_argument("--slow-pvs", type=int, default=2000)
+    parser.add_argument("--slow-rate", type=float, default=1.0)
+    parser.add_argument("--spread", type=int, default=4)
+    args = parser.parse_args()
+
+    pvs = _pv_rates(args)
+    print(
+        f"{args.hot_pvs} PVs at {args.hot_rate:g} Hz and {args.slow_pvs} PVs at "
+        f"{args.slow_rate:g} Hz over {args.partitions} partitions"
+    )
+    for label, spread in (
+        (f"{PARTITIONING_KEY} hash", None),
+        (f"hot PVs spread over {args.spread}", args.spread),
+    ):
+        rates = _partition_rates(pvs, args.partitions, spread)
+        mean = sum(rates) / len(rates)
+        print(
+            f"{label}: busiest partition {max(rates):.0f} Hz, "
+            f"quietest {min(rates):.0f} Hz, skew {max(rates) / mean:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
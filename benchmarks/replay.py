@@ -0,0 +1,54 @@
+"""
+Replays a recording of EPICS updates, made with the forwarder's --record-file
+option, through the serialiser trackers into a producer which only counts
+the messages, to reproduce the load of a beamline offline.
+
+Usage: python -m benchmarks.replay updates.rec [--speed 1 | --speed max] [--pv-update-period 1000]
+"""
+import argparse
+from typing import Optional
+
+from forwarder.recording import Replayer
+
+
+class _CountingProducer:
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def produce(self, topic, payload, *args, **kwargs):
+        self.messages += 1
+        self.bytes += len(payload)
+
+    def close(self):
+        pass
+
+
+def _speed(value: str) -> Optional[float]:
+    return None if value == "max" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("recording")
+    parser.add_argument(
+        "--speed",
+        type=_speed,
+        default=1.0,
+        help="Multiple of the recorded rate to replay at, or max to replay as fast as possible",
+    )
+    parser.add_argument("--pv-update-period", type=int, default=None)
+    args = parser.parse_args()
+
+    producer = _CountingProducer()
+    replayer = Replayer(producer, args.speed, args.pv_update_period)  # type: ignore
+    elapsed = replayer.replay(args.recording)
+    print(
+        f"replayed {replayer.replayed_updates} updates in {elapsed:.2f} s "
+        f"({replayer.replayed_updates / elapsed:.0f} per second), "
+        f"producing {producer.messages} messages and {producer.bytes / 1e6:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
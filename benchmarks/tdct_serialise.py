@@ -0,0 +1,72 @@
+"""
+Times the serialisation of CA chopper timestamp updates by the tdct
+serialiser, compared with adding the offset into new arrays and serialising
+them with streaming_data_types as was done before.
+
+Usage: python -m benchmarks.tdct_serialise [--updates 10000] [--elements 1000]
+"""
+import argparse
+import time
+
+import numpy as np
+from caproto import ChannelType, ReadNotifyResponse, TimeStamp, timestamp_to_epics
+from streaming_data_types.timestamps_tdct import serialise_tdct
+
+from forwarder.update_handlers.decoded_update import decode_ca_update
+from forwarder.update_handlers.tdct_serialiser import tdct_CASerialiser
+
+
+def _create_updates(number_of_updates: int, elements: int):
+    start = time.time()
+    # CA data arrives big-endian
+    relative_timestamps = np.arange(elements, dtype=">i4") * 1000
+    return [
+        ReadNotifyResponse(
+            relative_timestamps,
+            ChannelType.TIME_LONG,
+            elements,
+            1,
+            1,
+            metadata=(0, 0, TimeStamp(*timestamp_to_epics(start + index * 1e-3))),
+        )
+        for index in range(number_of_updates)
+    ]
+
+
+def _time_copying(updates) -> float:
+    start = time.perf_counter()
+    for counter, update in enumerate(updates):
+        decoded = decode_ca_update(update)
+        timestamps = decoded.value + decoded.timestamp_ns
+        serialise_tdct("SIM:CHOPPER", timestamps.astype(np.uint64), counter)
+    return time.perf_counter() - start
+
+
+def _time_serialiser(updates) -> float:
+    serialiser = tdct_CASerialiser("SIM:CHOPPER")
+    start = time.perf_counter()
+    for update in updates:
+        serialiser.serialise(update, decode_ca_update(update))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=10_000)
+    parser.add_argument("--elements", type=int, default=1000)
+    args = parser.parse_args()
+    updates = _create_updates(args.updates, args.elements)
+
+    copying = _time_copying(updates)
+    in_place = _time_serialiser(updates)
+    for label, elapsed in (
+        ("new arrays per update", copying),
+        ("reused timestamp buffer", in_place),
+    ):
+        print(
+            f"{label}: {elapsed:.2f} s, {elapsed / len(updates) * 1e6:.2f} us per update"
+        )
+
+
+if __name__ == "__main__":
+    main()
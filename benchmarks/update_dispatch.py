@@ -0,0 +1,94 @@
+"""
+Times the handling of CA updates by three serialiser trackers for one PV
+(f144, al00 and ep01), with each tracker decoding the update itself compared
+with decoding it once and passing the result to all of them.
+
+Usage: python -m benchmarks.update_dispatch [--updates 100000] [--elements 1]
+"""
+import argparse
+import time
+
+import numpy as np
+from caproto import ChannelType, ReadNotifyResponse, TimeStamp, timestamp_to_epics
+
+from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.decoded_update import decode_ca_update
+from forwarder.update_handlers.schema_serialiser_factory import SerialiserFactory
+from forwarder.update_handlers.serialiser_tracker import SerialiserTracker
+
+
+class _NullProducer:
+    def produce(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+def _create_trackers():
+    producer = _NullProducer()
+    return [
+        SerialiserTracker(
+            SerialiserFactory.create_serialiser(EpicsProtocol.CA, schema, "SIM:PV"),
+            producer,  # type: ignore
+            "SIM:PV",
+            "topic",
+        )
+        for schema in ("f144", "al00", "ep01")
+    ]
+
+
+def _create_updates(number_of_updates: int, elements: int):
+    start = time.time()
+    return [
+        ReadNotifyResponse(
+            np.full(elements, index, dtype=np.float64),
+            ChannelType.TIME_DOUBLE,
+            elements,
+            1,
+            1,
+            metadata=(0, 0, TimeStamp(*timestamp_to_epics(start + index * 1e-6))),
+        )
+        for index in range(number_of_updates)
+    ]
+
+
+def _time_per_tracker_decode(updates) -> float:
+    trackers = _create_trackers()
+    start = time.perf_counter()
+    for update in updates:
+        for tracker in trackers:
+            tracker.process_ca_message(update)
+    return time.perf_counter() - start
+
+
+def _time_shared_decode(updates) -> float:
+    trackers = _create_trackers()
+    start = time.perf_counter()
+    for update in updates:
+        decoded = decode_ca_update(update)
+        for tracker in trackers:
+            tracker.process_ca_message(update, decoded)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=100_000)
+    parser.add_argument("--elements", type=int, default=1)
+    args = parser.parse_args()
+    updates = _create_updates(args.updates, args.elements)
+
+    per_tracker = _time_per_tracker_decode(updates)
+    shared = _time_shared_decode(updates)
+    for label, elapsed in (
+        ("decoded per tracker", per_tracker),
+        ("decoded once", shared),
+    ):
+        print(
+            f"{label}: {elapsed:.2f} s, {elapsed / len(updates) * 1e6:.2f} us per update"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
 import logging
 from typing import Optional
 
-import graypy
-
 logger_name = "python-forwarder"
 
 
@@ -21,6 +19,9 @@ def setup_logger(
     logger = logging.getLogger(logger_name)
     logger.setLevel(level)
     if graylog_logger_address is not None:
+        # Only imported when logging to Graylog, to keep start up fast
+        import graypy
+
         host, port = graylog_logger_address.split(":")
         handler = graypy.GELFTCPHandler(host, int(port), facility="ESS")
         logger.addHandler(handler)
@@ -0,0 +1,372 @@
+import fnmatch
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import tomli
+
+# Example policy file:
+#
+#   [[channel]]
+#   pattern = "SIM:TEMP:*"          # glob pattern matched against the PV name
+#   schema = "f144"                 # optional, the rule applies to all schemas if omitted
+#   absolute_deadband = 0.01        # forward scalars only if they change by more than this
+#   relative_deadband = 0.001       # ...and by more than this fraction of the last value
+#   suppress_unchanged_arrays = true
+#   max_rate = 10                   # forward at most 10 updates per second
+#   burst = 20                      # optional, number of updates allowed in a burst
+#   overflow = "keep_latest"        # "drop" (default), "decimate" or "keep_latest"
+#   batch_size = 1000               # se00 schema only, samples per message...
+#   batch_period_ms = 100           # ...or the longest time to batch samples for
+#   partition_spread = 4            # spread the messages over 4 partitions, in turn
+#
+#   [[topic]]
+#   pattern = "motion_*"            # glob pattern matched against the output topic
+#   max_rate = 1000                 # shared by all channels forwarded to the topic
+#
+#   [[fake]]                        # values of "fake" protocol channels
+#   pattern = "SIM:*"               # optional, the rule applies to all PVs if omitted
+#   schema = "f144"                 # optional
+#   rate = 100                      # updates per second, defaults to 1000 / fake-pv-period
+#   distribution = "normal"         # "uniform" (default), "normal" or "random_walk"
+#   low = 0                         # uniform distribution range, 0 to 100 by default
+#   high = 100
+#   mean = 0                        # normal distribution and random walk start
+#   std = 1                         # ...and standard deviation, or random walk step size
+#   array_size = 1000               # optional, arrays of this size instead of scalars
+#   dtype = "float64"               # "int32" (default), "int64", "float32" or "float64"
+#
+# The first rule matching a channel (or topic) is used.
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_DECIMATE = "decimate"
+OVERFLOW_KEEP_LATEST = "keep_latest"
+OVERFLOW_POLICIES = (OVERFLOW_DROP, OVERFLOW_DECIMATE, OVERFLOW_KEEP_LATEST)
+
+DISTRIBUTION_UNIFORM = "uniform"
+DISTRIBUTION_NORMAL = "normal"
+DISTRIBUTION_RANDOM_WALK = "random_walk"
+DISTRIBUTIONS = (DISTRIBUTION_UNIFORM, DISTRIBUTION_NORMAL, DISTRIBUTION_RANDOM_WALK)
+FAKE_INTEGER_DTYPES = ("int32", "int64")
+FAKE_DTYPES = FAKE_INTEGER_DTYPES + ("float32", "float64")
+
+
+@dataclass(frozen=True)
+class ChannelFilter:
+    absolute_deadband: Optional[float] = None
+    relative_deadband: Optional[float] = None
+    suppress_unchanged_arrays: bool = False
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    Token bucket limit on forwarded updates.
+
+    With the "drop" overflow policy updates over the limit are discarded,
+    with "keep_latest" the last of them is forwarded once the limit allows,
+    and with "decimate" bursts are not allowed so that the forwarded updates
+    are evenly spaced samples of the incoming ones.
+    """
+
+    max_rate: float
+    burst: Optional[int] = None
+    overflow: str = OVERFLOW_DROP
+
+    @property
+    def capacity(self) -> float:
+        if self.overflow == OVERFLOW_DECIMATE:
+            return 1.0
+        if self.burst is not None:
+            return float(self.burst)
+        return max(1.0, self.max_rate)
+
+
+@dataclass(frozen=True)
+class BatchSettings:
+    batch_size: Optional[int] = None
+    batch_period_ms: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class FakeProfile:
+    """
+    How the values of fake PVs are generated
+    """
+
+    # Updates per second, if not given the fake PV period is used
+    rate: Optional[float] = None
+    distribution: str = DISTRIBUTION_UNIFORM
+    low: float = 0.0
+    high: float = 100.0
+    mean: float = 0.0
+    std: float = 1.0
+    # Scalars if not given
+    array_size: Optional[int] = None
+    dtype: str = "int32"
+
+
+@dataclass(frozen=True)
+class ChannelPolicy:
+    pattern: str
+    schema: Optional[str] = None
+    filter: Optional[ChannelFilter] = None
+    rate_limit: Optional[RateLimit] = None
+    batching: Optional[BatchSettings] = None
+    # Number of partitions to send the messages to in turn, for PVs too busy
+    # for one partition. The messages of the PV are then not in order.
+    partition_spread: Optional[int] = None
+
+    def matches(self, pv_name: str, schema: str) -> bool:
+        return (self.schema is None or self.schema == schema) and fnmatch.fnmatchcase(
+            pv_name, self.pattern
+        )
+
+
+@dataclass(frozen=True)
+class TopicPolicy:
+    pattern: str
+    rate_limit: RateLimit
+
+    def matches(self, topic: str) -> bool:
+        return fnmatch.fnmatchcase(topic, self.pattern)
+
+
+@dataclass(frozen=True)
+class FakePolicy:
+    profile: FakeProfile
+    pattern: str = "*"
+    schema: Optional[str] = None
+
+    def matches(self, pv_name: str, schema: str) -> bool:
+        return (self.schema is None or self.schema == schema) and fnmatch.fnmatchcase(
+            pv_name, self.pattern
+        )
+
+
+class ChannelPolicies:
+    """
+    Forwarding policies for channels, selected by PV name pattern and schema
+    """
+
+    def __init__(
+        self,
+        policies: List[ChannelPolicy],
+        topic_policies: Optional[List[TopicPolicy]] = None,
+        fake_policies: Optional[List[FakePolicy]] = None,
+    ):
+        self._policies = policies
+        self._topic_policies = topic_policies or []
+        self._fake_policies = fake_policies or []
+        # Rules are matched on every subscription, so cache the result per channel
+        self._cache: Dict[Tuple[str, str], Optional[ChannelPolicy]] = {}
+
+    def policy_for(self, pv_name: str, schema: str) -> Optional[ChannelPolicy]:
+        key = (pv_name, schema)
+        if key not in self._cache:
+            self._cache[key] = next(
+                (
+                    policy
+                    for policy in self._policies
+                    if policy.matches(pv_name, schema)
+                ),
+                None,
+            )
+        return self._cache[key]
+
+    def filter_for(self, pv_name: str, schema: str) -> Optional[ChannelFilter]:
+        policy = self.policy_for(pv_name, schema)
+        return policy.filter if policy is not None else None
+
+    def batching_for(self, pv_name: str, schema: str) -> Optional[BatchSettings]:
+        policy = self.policy_for(pv_name, schema)
+        return policy.batching if policy is not None else None
+
+    def partition_spread_for(self, pv_name: str, schema: str) -> Optional[int]:
+        policy = self.policy_for(pv_name, schema)
+        return policy.partition_spread if policy is not None else None
+
+    def rate_limit_for(self, pv_name: str, schema: str) -> Optional[RateLimit]:
+        policy = self.policy_for(pv_name, schema)
+        return policy.rate_limit if policy is not None else None
+
+    def topic_rate_limit_for(self, topic: str) -> Optional[RateLimit]:
+        return next(
+            (
+                policy.rate_limit
+                for policy in self._topic_policies
+                if policy.matches(topic)
+            ),
+            None,
+        )
+
+    def fake_profile_for(self, pv_name: str, schema: str) -> Optional[FakeProfile]:
+        return next(
+            (
+                policy.profile
+                for policy in self._fake_policies
+                if policy.matches(pv_name, schema)
+            ),
+            None,
+        )
+
+    @property
+    def has_rate_limits(self) -> bool:
+        return bool(self._topic_policies) or any(
+            policy.rate_limit is not None for policy in self._policies
+        )
+
+    @property
+    def has_partition_spread(self) -> bool:
+        return any(policy.partition_spread is not None for policy in self._policies)
+
+
+def _optional_number(rule: Dict[str, Any], field: str) -> Optional[float]:
+    value = rule.get(field)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f'"{field}" must be a non-negative number, got {value!r}')
+    return float(value)
+
+
+def _number(rule: Dict[str, Any], field: str, default: float) -> float:
+    value = rule.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'"{field}" must be a number, got {value!r}')
+    return float(value)
+
+
+def _parse_filter(rule: Dict[str, Any]) -> Optional[ChannelFilter]:
+    channel_filter = ChannelFilter(
+        absolute_deadband=_optional_number(rule, "absolute_deadband"),
+        relative_deadband=_optional_number(rule, "relative_deadband"),
+        suppress_unchanged_arrays=bool(rule.get("suppress_unchanged_arrays", False)),
+    )
+    return channel_filter if channel_filter != ChannelFilter() else None
+
+
+def _parse_rate_limit(rule: Dict[str, Any]) -> Optional[RateLimit]:
+    max_rate = _optional_number(rule, "max_rate")
+    if max_rate is None:
+        for field in ("burst", "overflow"):
+            if field in rule:
+                raise ValueError(f'"{field}" is only used together with "max_rate"')
+        return None
+    if max_rate == 0:
+        raise ValueError('"max_rate" must be greater than zero')
+    burst = _optional_positive_int(rule, "burst")
+    overflow = rule.get("overflow", OVERFLOW_DROP)
+    if overflow not in OVERFLOW_POLICIES:
+        raise ValueError(
+            f'"overflow" must be one of {", ".join(OVERFLOW_POLICIES)}, got {overflow!r}'
+        )
+    return RateLimit(max_rate=max_rate, burst=burst, overflow=overflow)
+
+
+def _optional_positive_int(rule: Dict[str, Any], field: str) -> Optional[int]:
+    value = rule.get(field)
+    if value is not None and (
+        isinstance(value, bool) or not isinstance(value, int) or value < 1
+    ):
+        raise ValueError(f'"{field}" must be a positive integer, got {value!r}')
+    return value
+
+
+def _parse_batching(rule: Dict[str, Any]) -> Optional[BatchSettings]:
+    batching = BatchSettings(
+        batch_size=_optional_positive_int(rule, "batch_size"),
+        batch_period_ms=_optional_positive_int(rule, "batch_period_ms"),
+    )
+    return batching if batching != BatchSettings() else None
+
+
+def _parse_fake_profile(rule: Dict[str, Any]) -> FakeProfile:
+    rate = _optional_number(rule, "rate")
+    if rate == 0:
+        raise ValueError('"rate" must be greater than zero')
+    distribution = rule.get("distribution", DISTRIBUTION_UNIFORM)
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(
+            f'"distribution" must be one of {", ".join(DISTRIBUTIONS)}, got {distribution!r}'
+        )
+    dtype = rule.get("dtype", "int32")
+    if dtype not in FAKE_DTYPES:
+        raise ValueError(
+            f'"dtype" must be one of {", ".join(FAKE_DTYPES)}, got {dtype!r}'
+        )
+    profile = FakeProfile(
+        rate=rate,
+        distribution=distribution,
+        low=_number(rule, "low", 0.0),
+        high=_number(rule, "high", 100.0),
+        mean=_number(rule, "mean", 0.0),
+        std=_number(rule, "std", 1.0),
+        array_size=_optional_positive_int(rule, "array_size"),
+        dtype=dtype,
+    )
+    if profile.low > profile.high:
+        raise ValueError('"low" must not be greater than "high"')
+    if (
+        profile.distribution == DISTRIBUTION_UNIFORM
+        and profile.dtype in FAKE_INTEGER_DTYPES
+        and math.ceil(profile.low) > math.floor(profile.high)
+    ):
+        raise ValueError(
+            f'"low" to "high" must include an integer for dtype {profile.dtype!r}'
+        )
+    if profile.std < 0:
+        raise ValueError('"std" must not be negative')
+    return profile
+
+
+def _parse_pattern(rule: Dict[str, Any]) -> str:
+    pattern = rule.get("pattern")
+    if not isinstance(pattern, str) or not pattern:
+        raise ValueError('"pattern" must be a non-empty string')
+    return pattern
+
+
+def parse_channel_policies(config: Dict[str, Any]) -> ChannelPolicies:
+    policies = []
+    for index, rule in enumerate(config.get("channel", [])):
+        try:
+            policies.append(
+                ChannelPolicy(
+                    pattern=_parse_pattern(rule),
+                    schema=rule.get("schema"),
+                    filter=_parse_filter(rule),
+                    rate_limit=_parse_rate_limit(rule),
+                    batching=_parse_batching(rule),
+                    partition_spread=_optional_positive_int(rule, "partition_spread"),
+                )
+            )
+        except ValueError as error:
+            raise ValueError(f"Invalid channel policy rule {index}: {error}")
+    topic_policies = []
+    for index, rule in enumerate(config.get("topic", [])):
+        try:
+            rate_limit = _parse_rate_limit(rule)
+            if rate_limit is None:
+                raise ValueError('"max_rate" must be set')
+            topic_policies.append(TopicPolicy(_parse_pattern(rule), rate_limit))
+        except ValueError as error:
+            raise ValueError(f"Invalid topic policy rule {index}: {error}")
+    fake_policies = []
+    for index, rule in enumerate(config.get("fake", [])):
+        try:
+            fake_policies.append(
+                FakePolicy(
+                    _parse_fake_profile(rule),
+                    pattern=_parse_pattern(rule) if "pattern" in rule else "*",
+                    schema=rule.get("schema"),
+                )
+            )
+        except ValueError as error:
+            raise ValueError(f"Invalid fake PV rule {index}: {error}")
+    return ChannelPolicies(policies, topic_policies, fake_policies)
+
+
+def load_channel_policies(file_path: str) -> ChannelPolicies:
+    with open(file_path, "rb") as file:
+        return parse_channel_policies(tomli.load(file))
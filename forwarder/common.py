@@ -1,3 +1,4 @@
+import fnmatch
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional, Tuple
@@ -34,6 +35,25 @@ class Channel:
     schema: Optional[str]
 
 
+def matches_removal(remove_channel: Channel, channel: Channel) -> bool:
+    """
+    Whether a request to remove remove_channel applies to channel. Fields not
+    given in the request match anything, and the name and output topic can be
+    wildcard patterns.
+    """
+    return (
+        (
+            not remove_channel.name
+            or fnmatch.fnmatch(channel.name, remove_channel.name)  # type: ignore
+        )
+        and (not remove_channel.schema or channel.schema == remove_channel.schema)
+        and (
+            not remove_channel.output_topic
+            or fnmatch.fnmatch(channel.output_topic, remove_channel.output_topic)  # type: ignore
+        )
+    )
+
+
 @dataclass(frozen=True)
 class ConfigUpdate:
     command_type: CommandType
@@ -1,80 +1,328 @@
+import os
+import tempfile
 import time
-from typing import Dict
+from typing import Any, Dict, List, Optional, Set
 from unittest import mock
 
-from confluent_kafka import TopicPartition
+from confluent_kafka import KafkaError, TopicPartition
 from streaming_data_types.fbschemas.forwarder_config_update_rf5k.UpdateType import (
     UpdateType,
 )
 from streaming_data_types.forwarder_config_update_rf5k import (
+    ConfigurationUpdate,
     Protocol,
     StreamInfo,
     deserialise_rf5k,
     serialise_rf5k,
 )
 
-from forwarder.common import EpicsProtocol
+from forwarder.application_logger import get_logger
+from forwarder.common import Channel, CommandType, ConfigUpdate, EpicsProtocol
+
+logger = get_logger()
+
+# Stored messages are keyed to say whether they hold the full configuration
+# or only the changes since the previous message.
+# Messages without a key (written by older versions) hold the full configuration.
+SNAPSHOT_KEY = "snapshot"
+DELTA_KEY = "delta"
+
+# Write a full snapshot after this many delta messages
+MAX_DELTAS_BETWEEN_SNAPSHOTS = 100
+# Write a full snapshot once the last one is this old, so that it is not
+# removed by the retention of the storage topic
+SNAPSHOT_INTERVAL_S = 24 * 60 * 60
+
+RESTORE_BATCH_SIZE = 500
+RESTORE_TIMEOUT_S = 30.0
+
+_protocol_map = {
+    EpicsProtocol.CA: Protocol.Protocol.CA,
+    EpicsProtocol.FAKE: Protocol.Protocol.FAKE,
+    EpicsProtocol.PVA: Protocol.Protocol.PVA,
+}
+
+
+def _channel_to_stream(channel: Channel) -> StreamInfo:
+    return StreamInfo(
+        channel.name,
+        channel.schema,
+        channel.output_topic,
+        _protocol_map[channel.protocol],
+    )
+
+
+def _serialise_full_configuration(streams: List[StreamInfo]) -> bytes:
+    if streams:
+        return serialise_rf5k(UpdateType.ADD, streams)
+    # No streams so store a "blank" config
+    return serialise_rf5k(UpdateType.REMOVEALL, streams)
+
+
+def fold_configuration_updates(
+    snapshot: ConfigurationUpdate, deltas: List[ConfigurationUpdate]
+) -> bytes:
+    """
+    Apply deltas, oldest first, to a snapshot and return the resulting
+    full configuration as an rf5k buffer.
+    """
+    streams: Dict[StreamInfo, None] = {}
+    if snapshot.config_change == UpdateType.ADD:
+        streams.update(dict.fromkeys(snapshot.streams))
+    for delta in deltas:
+        if delta.config_change == UpdateType.ADD:
+            streams.update(dict.fromkeys(delta.streams))
+        elif delta.config_change == UpdateType.REMOVE:
+            for stream in delta.streams:
+                streams.pop(stream, None)
+        elif delta.config_change == UpdateType.REMOVEALL:
+            streams.clear()
+        else:
+            logger.warning(
+                f"Skipping stored configuration delta with unknown update type {delta.config_change}, the restored configuration may be incomplete"
+            )
+    return _serialise_full_configuration(list(streams))
 
 
 class ConfigurationStore:
-    def __init__(self, producer, consumer, topic):
+    """
+    Stores the forwarding configuration in a Kafka topic.
+
+    Each change is stored as a delta (the streams added and removed since the
+    last stored message) and a full snapshot is written on the first save,
+    after the stored configuration is restored, when all streams are removed,
+    when the deltas since the last snapshot exceed the compaction limits and
+    when the last snapshot is older than snapshot_interval_s. The interval must
+    be shorter than the retention of the storage topic.
+    """
+
+    def __init__(
+        self,
+        producer,
+        consumer,
+        topic,
+        max_deltas_between_snapshots: int = MAX_DELTAS_BETWEEN_SNAPSHOTS,
+        cache_file: Optional[str] = None,
+        snapshot_interval_s: float = SNAPSHOT_INTERVAL_S,
+    ):
         self._producer = producer
+        self._cache_file = cache_file
         self._consumer = consumer
         self._topic = topic
+        self._max_deltas_between_snapshots = max_deltas_between_snapshots
+        self._snapshot_interval_s = snapshot_interval_s
+        self._last_snapshot_s = time.monotonic()
+        # Channels in the stored configuration, None until a snapshot has been written
+        self._stored_channels: Optional[Set[Channel]] = None
+        self._deltas_since_snapshot = 0
+        self._delta_streams_since_snapshot = 0
 
     def save_configuration(self, update_handlers: Dict):
-        streams = []
-        for channel, update_handler in update_handlers.items():
-            protocol_map = {
-                EpicsProtocol.CA: Protocol.Protocol.CA,
-                EpicsProtocol.FAKE: Protocol.Protocol.FAKE,
-                EpicsProtocol.PVA: Protocol.Protocol.PVA,
-            }
-            stream = StreamInfo(
-                channel.name,
-                channel.schema,
-                channel.output_topic,
-                protocol_map[channel.protocol],
+        channels = set(update_handlers.keys())
+        if self._stored_channels is None or (not channels and self._stored_channels):
+            self._save_snapshot(channels)
+            self._write_cache(channels)
+            return
+
+        added = channels - self._stored_channels
+        removed = self._stored_channels - channels
+        if not added and not removed:
+            return
+        self._write_cache(channels)
+
+        self._deltas_since_snapshot += bool(added) + bool(removed)
+        self._delta_streams_since_snapshot += len(added) + len(removed)
+        if self._snapshot_due(len(channels)):
+            self._save_snapshot(channels)
+            return
+
+        if removed:
+            self._produce(
+                serialise_rf5k(
+                    UpdateType.REMOVE, [_channel_to_stream(c) for c in removed]
+                ),
+                DELTA_KEY,
             )
+        if added:
+            self._produce(
+                serialise_rf5k(UpdateType.ADD, [_channel_to_stream(c) for c in added]),
+                DELTA_KEY,
+            )
+        self._stored_channels = channels
 
-            streams.append(stream)
-        if streams:
-            message = serialise_rf5k(UpdateType.ADD, streams)
-        else:
-            # No streams so store a "blank" config
-            message = serialise_rf5k(UpdateType.REMOVEALL, streams)
-        self._producer.produce(self._topic, bytes(message), int(time.time() * 1000))
+    def set_stored_configuration(self, configuration: ConfigUpdate):
+        """
+        Record a configuration retrieved from the storage topic as the stored
+        one, so that later changes are stored as deltas from it, and update the
+        cache file to match.
+
+        It is stored again as a snapshot, as the snapshot and deltas it was
+        retrieved from may be about to be removed by the topic's retention.
+        """
+        if configuration.command_type == CommandType.INVALID:
+            return
+        channels = set(configuration.channels or ())
+        self._save_snapshot(channels)
+        self._write_cache(channels)
+
+    def save_snapshot_if_due(self):
+        """
+        Store the configuration again as a snapshot if the last snapshot is
+        older than the snapshot interval, even if it has not changed
+        """
+        if self._stored_channels is not None and self._snapshot_expired():
+            self._save_snapshot(self._stored_channels)
+
+    def _snapshot_due(self, number_of_channels: int) -> bool:
+        # Compact once restoring would mean replaying more than a snapshot's worth of streams
+        return (
+            self._deltas_since_snapshot > self._max_deltas_between_snapshots
+            or self._delta_streams_since_snapshot > number_of_channels
+            or self._snapshot_expired()
+        )
+
+    def _snapshot_expired(self) -> bool:
+        return time.monotonic() - self._last_snapshot_s >= self._snapshot_interval_s
+
+    def _save_snapshot(self, channels: Set[Channel]):
+        streams = [_channel_to_stream(channel) for channel in channels]
+        self._produce(_serialise_full_configuration(streams), SNAPSHOT_KEY)
+        self._stored_channels = channels
+        self._deltas_since_snapshot = 0
+        self._delta_streams_since_snapshot = 0
+        self._last_snapshot_s = time.monotonic()
+
+    def _produce(self, message: bytes, key: str):
+        self._producer.produce(
+            self._topic, bytes(message), int(time.time() * 1000), key=key
+        )
+
+    def _write_cache(self, channels: Set[Channel]):
+        if self._cache_file is None:
+            return
+        message = _serialise_full_configuration(
+            [_channel_to_stream(channel) for channel in channels]
+        )
+        # Write to a temporary file and rename it over the cache so that
+        # a crash part way through never leaves a truncated cache behind
+        cache_dir = os.path.dirname(os.path.abspath(self._cache_file))
+        try:
+            file_descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(file_descriptor, "wb") as temp_file:
+                    temp_file.write(message)
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+                os.replace(temp_path, self._cache_file)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as error:
+            logger.error(f"Could not write configuration cache file: {error}")
+
+    def retrieve_cached_configuration(self) -> bytes:
+        """Retrieve the configuration buffer from the local cache file."""
+        if self._cache_file is None:
+            raise RuntimeError("No configuration cache file configured")
+        try:
+            with open(self._cache_file, "rb") as cache:
+                payload = cache.read()
+        except OSError as error:
+            raise RuntimeError(f"Could not read configuration cache file: {error}")
+        if self._deserialise_configuration_buffer(payload) is None:
+            raise RuntimeError("Configuration cache file does not hold a valid buffer")
+        return payload
 
-    def retrieve_configuration(self):
-        """Retrieve last valid configuration buffer."""
+    def retrieve_configuration(self, timeout_s: float = RESTORE_TIMEOUT_S):
+        """
+        Retrieve the last valid configuration buffer, folding any deltas
+        stored after the last snapshot into it.
+
+        The tail of the topic is read in batches and validated in memory from
+        the newest message to the oldest, reading further back only if no
+        snapshot was found in the tail.
+        """
+        deadline = time.monotonic() + timeout_s
         topic = TopicPartition(self._topic, partition=0)
-        low_offset, high_offset = self._consumer.get_watermark_offsets(topic)
-        # Set offset to current_offset to start retrieving from last message
-        current_offset = high_offset - 1
-        topic.offset = current_offset
-        self._consumer.assign([topic])
-
-        while current_offset >= low_offset:
-            msg = self._consumer.consume(timeout=2)
-            if msg and self._is_a_valid_configuration_buffer(msg[-1].value()):
-                return msg[-1].value()
-            current_offset -= 1
-            topic.offset = current_offset
-            self._consumer.seek(topic)
+        low_offset, high_offset = self._consumer.get_watermark_offsets(
+            topic, timeout=max(0.0, deadline - time.monotonic())
+        )
+
+        deltas: List[ConfigurationUpdate] = []
+        end_offset = high_offset
+        # The last snapshot is normally followed by at most this many deltas,
+        # each earlier window read is doubled in size in case it is not
+        window_size = self._max_deltas_between_snapshots + 1
+        while end_offset > low_offset:
+            start_offset = max(low_offset, end_offset - window_size)
+            messages = self._read_range(start_offset, end_offset, deadline)
+            for msg in reversed(messages):
+                config_update = self._deserialise_configuration_buffer(msg.value())
+                if config_update is None:
+                    if msg.key() == DELTA_KEY.encode():
+                        logger.warning(
+                            f"Skipping stored configuration delta at offset {msg.offset()} as it could not be decoded, the restored configuration may be incomplete"
+                        )
+                    continue
+                if msg.key() != DELTA_KEY.encode():
+                    return fold_configuration_updates(
+                        config_update, list(reversed(deltas))
+                    )
+                deltas.append(config_update)
+            end_offset = start_offset
+            window_size *= 2
 
         raise RuntimeError("Could not retrieve stored configuration")
 
+    def _read_range(self, start_offset: int, end_offset: int, deadline: float) -> List:
+        """
+        Read the messages with offsets in [start_offset, end_offset), oldest first.
+
+        Offsets without a message (transaction markers, or messages removed by
+        compaction or retention) are skipped, so reading stops once the
+        consumer's position reaches end_offset or it reaches the end of the
+        partition, rather than at a message at end_offset - 1.
+        """
+        partition = TopicPartition(self._topic, 0, start_offset)
+        self._consumer.assign([partition])
+        messages: Dict[int, Any] = {}
+        while True:
+            remaining_s = deadline - time.monotonic()
+            if remaining_s <= 0:
+                raise RuntimeError(
+                    "Timed out reading stored configuration from storage topic"
+                )
+            batch = self._consumer.consume(
+                num_messages=min(RESTORE_BATCH_SIZE, end_offset - start_offset),
+                timeout=min(remaining_s, 1.0),
+            )
+            reached_end = False
+            for msg in batch:
+                if msg.error() is not None:
+                    reached_end |= msg.error().code() == KafkaError._PARTITION_EOF
+                    continue
+                if msg.offset() < end_offset:
+                    messages[msg.offset()] = msg
+                reached_end |= msg.offset() >= end_offset - 1
+            if reached_end or self._position(partition) >= end_offset:
+                return [messages[offset] for offset in sorted(messages)]
+
+    def _position(self, partition: TopicPartition) -> int:
+        # Negative until the first message has been consumed
+        return self._consumer.position([partition])[0].offset
+
     def stop(self):
         self._producer.close()
         self._consumer.close()
 
     @staticmethod
-    def _is_a_valid_configuration_buffer(payload):
+    def _deserialise_configuration_buffer(
+        payload,
+    ) -> Optional[ConfigurationUpdate]:
         try:
-            _ = deserialise_rf5k(payload)
-            return True
+            return deserialise_rf5k(payload)
         except Exception:
-            return False
+            return None
 
 
 NullConfigurationStore = mock.create_autospec(ConfigurationStore)
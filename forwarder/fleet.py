@@ -0,0 +1,247 @@
+import bisect
+import hashlib
+import json
+import re
+import time
+from logging import Logger
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from streaming_data_types.status_x5f2 import deserialise_x5f2
+
+from forwarder.common import Channel, CommandType, ConfigUpdate, matches_removal
+
+# Points on the hash ring per member, more spread the channels more evenly
+DEFAULT_VIRTUAL_NODES = 100
+# A peer is considered to have left after this many of its status intervals without a status message
+MEMBER_TIMEOUT_INTERVALS = 3
+DEFAULT_DISCOVERY_TIME_S = 5.0
+
+# The StatusReporter writes the fleet name as the first field of the status
+# JSON, so that it can be read without parsing the whole listing of streams
+_FLEET_FIELD = re.compile(r'^\{"fleet": ("(?:[^"\\]|\\.)*")')
+
+
+def _hash(key: str) -> int:
+    # Python's hash() is randomised per process, every instance must agree
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def fleet_name_from_status(status_json: str) -> Optional[str]:
+    match = _FLEET_FIELD.match(status_json)
+    return json.loads(match.group(1)) if match is not None else None
+
+
+class HashRing:
+    """
+    Consistent hash ring of fleet members. When a member joins or leaves,
+    only the keys owned by that member move.
+    """
+
+    def __init__(
+        self, members: Iterable[str], virtual_nodes: int = DEFAULT_VIRTUAL_NODES
+    ):
+        self.members: FrozenSet[str] = frozenset(members)
+        points = sorted(
+            (_hash(f"{member}#{node}"), member)
+            for member in self.members
+            for node in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class Fleet:
+    """
+    The channels configured for the whole fleet, and which of them this
+    instance forwards.
+
+    Every instance receives every configuration change, so each one keeps the
+    full set of channels and forwards those whose PV name hashes onto it. All
+    of the streams of a PV go to the same instance, so it is only subscribed
+    to once.
+    """
+
+    def __init__(
+        self,
+        service_id: str,
+        virtual_nodes: int = DEFAULT_VIRTUAL_NODES,
+    ):
+        self._service_id = service_id
+        self._virtual_nodes = virtual_nodes
+        self._ring = HashRing([service_id], virtual_nodes)
+        # Used as an ordered set
+        self._channels: Dict[Channel, None] = {}
+
+    @property
+    def members(self) -> FrozenSet[str]:
+        return self._ring.members
+
+    @property
+    def channels(self) -> Dict[Channel, None]:
+        return self._channels
+
+    def set_members(self, members: Iterable[str]) -> bool:
+        """
+        Returns whether the members changed, in which case the channels
+        should be reassigned with assigned_configuration()
+        """
+        members = frozenset(members) | {self._service_id}
+        if members == self._ring.members:
+            return False
+        self._ring = HashRing(members, self._virtual_nodes)
+        return True
+
+    def owns(self, channel: Channel) -> bool:
+        return self._ring.owner(channel.name or "") == self._service_id
+
+    def record(self, configuration_change: ConfigUpdate):
+        """
+        Apply a configuration change to the channels of the fleet
+        """
+        if configuration_change.command_type == CommandType.REMOVE_ALL:
+            self._channels.clear()
+        elif configuration_change.command_type == CommandType.ADD:
+            for channel in configuration_change.channels or ():
+                self._channels[channel] = None
+        elif configuration_change.command_type == CommandType.REMOVE:
+            for remove_channel in configuration_change.channels or ():
+                for channel in [
+                    channel
+                    for channel in self._channels
+                    if matches_removal(remove_channel, channel)
+                ]:
+                    del self._channels[channel]
+
+    def set_configuration(self, configuration: ConfigUpdate):
+        """
+        Replace the channels of the fleet with a full configuration
+        """
+        if configuration.command_type == CommandType.INVALID:
+            return
+        self._channels = dict.fromkeys(configuration.channels or ())
+
+    def assigned(self, configuration_change: ConfigUpdate) -> ConfigUpdate:
+        """
+        The part of a configuration change which applies to this instance
+        """
+        if configuration_change.command_type != CommandType.ADD:
+            # Removing channels this instance does not forward has no effect
+            return configuration_change
+        return ConfigUpdate(
+            CommandType.ADD,
+            tuple(
+                channel
+                for channel in configuration_change.channels or ()
+                if self.owns(channel)
+            ),
+        )
+
+    def assigned_configuration(self) -> ConfigUpdate:
+        """
+        The full configuration of the channels this instance should forward
+        """
+        return ConfigUpdate(
+            CommandType.ADD,
+            tuple(channel for channel in self._channels if self.owns(channel)),
+        )
+
+
+class FleetMembership:
+    """
+    Discovers the other members of a fleet from their status messages, which
+    carry the fleet name. A peer joins when its first status message is seen
+    and leaves when it has not reported for MEMBER_TIMEOUT_INTERVALS of its
+    status intervals.
+
+    poll() is called from the thread which handles configuration changes, so
+    that the channels are reassigned on that thread.
+    """
+
+    def __init__(
+        self,
+        consumer,
+        topic: str,
+        fleet_name: str,
+        service_id: str,
+        logger: Logger,
+        timeout_intervals: int = MEMBER_TIMEOUT_INTERVALS,
+    ):
+        self._consumer = consumer
+        self._fleet_name = fleet_name
+        self._service_id = service_id
+        self._logger = logger
+        self._timeout_intervals = timeout_intervals
+        # Deadline by which each peer must report again, by service ID
+        self._peers: Dict[str, float] = {}
+        self._members: FrozenSet[str] = frozenset([service_id])
+        self._consumer.subscribe([topic])
+
+    @property
+    def members(self) -> FrozenSet[str]:
+        return self._members
+
+    def _consume(self) -> List:
+        messages: List = []
+        while True:
+            batch = self._consumer.consume(num_messages=100, timeout=0)
+            if not batch:
+                return messages
+            messages.extend(msg for msg in batch if msg.error() is None)
+
+    def _peer_status(self, payload: bytes) -> Optional[Tuple[str, int]]:
+        try:
+            status = deserialise_x5f2(payload)
+        except Exception:
+            return None
+        if status.software_name != "Forwarder":
+            return None
+        if fleet_name_from_status(status.status_json) != self._fleet_name:
+            return None
+        return status.service_id, status.update_interval
+
+    def poll(self) -> bool:
+        """
+        Read any new status messages and expire peers which have stopped
+        reporting. Returns whether the members of the fleet changed.
+        """
+        now_s = time.monotonic()
+        for msg in self._consume():
+            peer = self._peer_status(msg.value())
+            if peer is not None and peer[0] != self._service_id:
+                service_id, interval_ms = peer
+                self._peers[service_id] = (
+                    now_s + self._timeout_intervals * interval_ms / 1000
+                )
+        for service_id in [
+            service_id
+            for service_id, deadline_s in self._peers.items()
+            if deadline_s < now_s
+        ]:
+            del self._peers[service_id]
+        members = frozenset(self._peers) | {self._service_id}
+        if members == self._members:
+            return False
+        self._logger.info(
+            f"Fleet {self._fleet_name} members changed from {sorted(self._members)} to {sorted(members)}"
+        )
+        self._members = members
+        return True
+
+    def discover(self, duration_s: float = DEFAULT_DISCOVERY_TIME_S):
+        """
+        Wait for the status messages of the current members, so that channels
+        are not assigned on start-up and then immediately reassigned
+        """
+        deadline_s = time.monotonic() + duration_s
+        while time.monotonic() < deadline_s:
+            self.poll()
+            time.sleep(min(0.1, max(0.0, deadline_s - time.monotonic())))
+
+    def stop(self):
+        self._consumer.close()
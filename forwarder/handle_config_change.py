@@ -1,29 +1,133 @@
-import fnmatch
+import glob
+import time
+from dataclasses import dataclass, replace
 from logging import Logger
-from typing import Dict, Optional
+from queue import Empty, Queue, SimpleQueue
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Union
 
-from caproto.threading.client import Context as CaContext
-from p4p.client.thread import Context as PvaContext
-
-from forwarder.common import Channel, CommandType, ConfigUpdate
+from forwarder.channel_policy import ChannelPolicies
+from forwarder.common import Channel, CommandType, ConfigUpdate, matches_removal
 from forwarder.configuration_store import ConfigurationStore, NullConfigurationStore
+from forwarder.fleet import Fleet
 from forwarder.kafka.kafka_producer import KafkaProducer
+from forwarder.kafka.partitioning import Partitioning
+from forwarder.parse_config_update import parse_config_update
+from forwarder.recording import UpdateRecorder
 from forwarder.status_reporter import StatusReporter
+from forwarder.update_handlers.batch_flusher import BatchFlusher
+from forwarder.update_handlers.ca_control_poller import CAControlPoller
+from forwarder.update_handlers.connection_status_tracker import ConnectionStatusTracker
 from forwarder.update_handlers.create_update_handler import (
     UpdateHandler,
     create_update_handler,
 )
+from forwarder.update_handlers.fake_load import FakeLoad
+from forwarder.update_handlers.rate_limiter import RateLimiters
+
+if TYPE_CHECKING:
+    from caproto.threading.client import Context as CaContext
+    from p4p.client.thread import Context as PvaContext
+
+
+@dataclass(frozen=True)
+class ForwarderContext:
+    """
+    The settings and shared collaborators used to create the update handlers
+    of the process, created once on start-up
+    """
+
+    producer: KafkaProducer
+    ca_ctx: "CaContext"
+    pva_ctx: "PvaContext"
+    fake_pv_period: int
+    pv_update_period: Optional[int] = None
+    connection_status_tracker: Optional[ConnectionStatusTracker] = None
+    ca_control_poller: Optional[CAControlPoller] = None
+    channel_policies: Optional[ChannelPolicies] = None
+    rate_limiters: Optional[RateLimiters] = None
+    partitioning: Optional[Partitioning] = None
+    recorder: Optional[UpdateRecorder] = None
+    fake_load: Optional[FakeLoad] = None
+    batch_flusher: Optional[BatchFlusher] = None
+    # Set in fleet mode, when configuration changes are for the whole fleet
+    fleet: Optional[Fleet] = None
+
+
+# Stopping a handler cancels its timers and unsubscribes from EPICS, so it can
+# take a while; handlers are stopped in batches on daemon worker threads, so
+# that any which never finish stopping do not keep the process alive
+STOP_HANDLERS_BATCH_SIZE = 100
+STOP_HANDLERS_MAX_WORKERS = 16
+STOP_HANDLERS_TIMEOUT_S = 30.0
+
+
+def stop_update_handlers(
+    handlers: Sequence[UpdateHandler],
+    logger: Logger,
+    timeout_s: float = STOP_HANDLERS_TIMEOUT_S,
+    batch_size: int = STOP_HANDLERS_BATCH_SIZE,
+    max_workers: int = STOP_HANDLERS_MAX_WORKERS,
+) -> int:
+    """
+    Stop the given update handlers concurrently, giving up waiting after timeout_s.
+    Returns the number of handlers in batches which had not finished stopping by the deadline.
+    """
+    if not handlers:
+        return 0
+
+    def _stop_batch(batch: Sequence[UpdateHandler]):
+        for handler in batch:
+            try:
+                handler.stop()
+            except Exception as e:
+                logger.error(f"Got exception when stopping update handler: {e}")
+
+    batches: "SimpleQueue[Sequence[UpdateHandler]]" = SimpleQueue()
+    for start in range(0, len(handlers), batch_size):
+        batches.put(handlers[start : start + batch_size])
+    gave_up = Event()
+    lock = Lock()
+    stopped = 0
+
+    def _run_worker():
+        nonlocal stopped
+        # Batches which have not been started by the deadline are abandoned
+        while not gave_up.is_set():
+            try:
+                batch = batches.get_nowait()
+            except Empty:
+                return
+            _stop_batch(batch)
+            with lock:
+                stopped += len(batch)
+
+    workers = [
+        Thread(target=_run_worker, name=f"stop_update_handlers_{index}", daemon=True)
+        for index in range(min(max_workers, batches.qsize()))
+    ]
+    for worker in workers:
+        worker.start()
+    deadline = time.monotonic() + timeout_s
+    for worker in workers:
+        worker.join(max(0.0, deadline - time.monotonic()))
+    # Do not block on any stragglers, they are left to finish in the background
+    gave_up.set()
+
+    with lock:
+        not_stopped = len(handlers) - stopped
+    if not_stopped:
+        logger.error(
+            f"Timed out after {timeout_s} s waiting for {not_stopped} update handler(s) to stop"
+        )
+    return not_stopped
 
 
 def _subscribe_to_pv(
     new_channel: Channel,
     update_handlers: Dict[Channel, UpdateHandler],
-    producer: KafkaProducer,
-    ca_ctx: CaContext,
-    pva_ctx: PvaContext,
+    context: ForwarderContext,
     logger: Logger,
-    fake_pv_period: int,
-    pv_update_period: Optional[int],
 ):
     if new_channel in update_handlers.keys():
         logger.warning(
@@ -34,12 +138,20 @@ def _subscribe_to_pv(
 
     try:
         update_handlers[new_channel] = create_update_handler(
-            producer,
-            ca_ctx,
-            pva_ctx,
+            context.producer,
+            context.ca_ctx,
+            context.pva_ctx,
             new_channel,
-            fake_pv_period,
-            periodic_update_ms=pv_update_period,
+            context.fake_pv_period,
+            periodic_update_ms=context.pv_update_period,
+            connection_status_tracker=context.connection_status_tracker,
+            ca_control_poller=context.ca_control_poller,
+            channel_policies=context.channel_policies,
+            rate_limiters=context.rate_limiters,
+            partitioning=context.partitioning,
+            recorder=context.recorder,
+            fake_load=context.fake_load,
+            batch_flusher=context.batch_flusher,
         )
     except RuntimeError as error:
         logger.error(str(error))
@@ -52,91 +164,205 @@ def _unsubscribe_from_pv(
     remove_channel: Channel,
     update_handlers: Dict[Channel, UpdateHandler],
     logger: Logger,
-):
-    def _match_channel_field(
-        field_in_remove_request: Optional[str], field_in_existing_channel: Optional[str]
-    ) -> bool:
-        return (
-            True
-            if not field_in_remove_request
-            or field_in_existing_channel == field_in_remove_request
-            else False
-        )
+) -> List[UpdateHandler]:
+    """
+    Remove handlers matching the channel from update_handlers and return them,
+    the caller is responsible for stopping them
+    """
 
-    def _wildcard_match_channel_field(
-        field_in_remove_request: Optional[str], field_in_existing_channel: Optional[str]
-    ) -> bool:
-        return (
-            True
-            if not field_in_remove_request
-            or fnmatch.fnmatch(field_in_existing_channel, field_in_remove_request)  # type: ignore
-            else False
-        )
+    channels_to_remove = [
+        channel
+        for channel in update_handlers.keys()
+        if matches_removal(remove_channel, channel)
+    ]
 
-    channels_to_remove = []
-    for channel in update_handlers.keys():
-        matching_fields = (
-            _wildcard_match_channel_field(remove_channel.name, channel.name),
-            _match_channel_field(remove_channel.schema, channel.schema),
-            _wildcard_match_channel_field(
-                remove_channel.output_topic, channel.output_topic
-            ),
-        )
-        if all(matching_fields):
-            channels_to_remove.append(channel)
-
-    for channel in channels_to_remove:
-        update_handlers[channel].stop()
-        del update_handlers[channel]
+    removed_handlers = [update_handlers.pop(channel) for channel in channels_to_remove]
 
     logger.info(
         f"Unsubscribed from PVs matching name='{remove_channel.name}', schema='{remove_channel.schema}', topic='{remove_channel.output_topic}'"
     )
+    return removed_handlers
 
 
 def _unsubscribe_from_all(
     update_handlers: Dict[Channel, UpdateHandler], logger: Logger
 ):
-    for update_handler in update_handlers.values():
-        update_handler.stop()
+    handlers_to_stop = list(update_handlers.values())
     update_handlers.clear()
+    stop_update_handlers(handlers_to_stop, logger)
     logger.info("Unsubscribed from all PVs")
 
 
 def handle_configuration_change(
     configuration_change: ConfigUpdate,
-    fake_pv_period: int,
-    pv_update_period: Optional[int],
     update_handlers: Dict[Channel, UpdateHandler],
-    producer: KafkaProducer,
-    ca_ctx: CaContext,
-    pva_ctx: PvaContext,
+    context: ForwarderContext,
     logger: Logger,
     status_reporter: StatusReporter,
     configuration_store: ConfigurationStore = NullConfigurationStore,
 ):
     """
-    Add or remove update handlers according to the requested change in configuration
+    Add or remove update handlers according to the requested change in configuration.
+    In fleet mode the change is recorded for the whole fleet, and only the
+    channels assigned to this instance are added.
     """
+    fleet = context.fleet
+    if fleet is not None:
+        fleet.record(configuration_change)
+        configuration_change = fleet.assigned(configuration_change)
     if configuration_change.command_type == CommandType.REMOVE_ALL:
         _unsubscribe_from_all(update_handlers, logger)
     elif configuration_change.command_type == CommandType.INVALID:
         return
     else:
+        removed_handlers: List[UpdateHandler] = []
         if configuration_change.channels is not None:
             for channel in configuration_change.channels:
                 if configuration_change.command_type == CommandType.ADD:
-                    _subscribe_to_pv(
-                        channel,
-                        update_handlers,
-                        producer,
-                        ca_ctx,
-                        pva_ctx,
-                        logger,
-                        fake_pv_period,
-                        pv_update_period,
-                    )
+                    _subscribe_to_pv(channel, update_handlers, context, logger)
                 elif configuration_change.command_type == CommandType.REMOVE:
-                    _unsubscribe_from_pv(channel, update_handlers, logger)
+                    removed_handlers.extend(
+                        _unsubscribe_from_pv(channel, update_handlers, logger)
+                    )
+        stop_update_handlers(removed_handlers, logger)
+    status_reporter.streams_changed()
     status_reporter.report_status()
-    configuration_store.save_configuration(update_handlers)
+    if fleet is not None:
+        configuration_store.save_configuration(fleet.channels)
+    else:
+        configuration_store.save_configuration(update_handlers)
+
+
+def reconcile_configuration(
+    stored_configuration: ConfigUpdate,
+    update_handlers: Dict[Channel, UpdateHandler],
+    context: ForwarderContext,
+    logger: Logger,
+    status_reporter: StatusReporter,
+    configuration_store: ConfigurationStore = NullConfigurationStore,
+):
+    """
+    Bring update handlers in line with a stored full configuration by applying
+    only the difference between it and the channels currently forwarded.
+    In fleet mode the stored configuration is that of the whole fleet, of
+    which only the channels assigned to this instance are forwarded.
+
+    The stored configuration is what is already in the configuration store,
+    so the changes made to reach it are not stored again as deltas.
+    """
+    if stored_configuration.command_type == CommandType.INVALID:
+        return
+    configuration_store.set_stored_configuration(stored_configuration)
+    if context.fleet is not None:
+        context.fleet.set_configuration(stored_configuration)
+        stored_configuration = context.fleet.assigned_configuration()
+        # The changes apply to this instance's channels, not the fleet's
+        context = replace(context, fleet=None)
+    target_channels = set(stored_configuration.channels or ())
+    channels_to_remove = tuple(
+        # Escape the channel so that it is removed by exact match, not as a wildcard
+        Channel(
+            glob.escape(channel.name) if channel.name else channel.name,
+            channel.protocol,
+            glob.escape(channel.output_topic)
+            if channel.output_topic
+            else channel.output_topic,
+            channel.schema,
+        )
+        for channel in update_handlers.keys()
+        if channel not in target_channels
+    )
+    channels_to_add = tuple(
+        channel for channel in target_channels if channel not in update_handlers
+    )
+    changes = []
+    if channels_to_remove:
+        changes.append(ConfigUpdate(CommandType.REMOVE, channels_to_remove))
+    if channels_to_add:
+        changes.append(ConfigUpdate(CommandType.ADD, channels_to_add))
+    logger.info(
+        f"Reconciling with stored configuration: removing {len(channels_to_remove)} "
+        f"and adding {len(channels_to_add)} channels"
+    )
+    for change in changes:
+        handle_configuration_change(
+            change, update_handlers, context, logger, status_reporter
+        )
+
+
+class BackgroundReconciliation:
+    """
+    Reconciles the update handlers with the stored configuration once it has
+    been retrieved in the background on start-up.
+
+    Configuration changes received before then are held back and applied
+    after reconciling, as they are newer than the stored configuration, and so
+    that the configuration store only stores them once it knows what is
+    already stored.
+    """
+
+    def __init__(
+        self,
+        retrieved: "Queue[Union[bytes, RuntimeError]]",
+        update_handlers: Dict[Channel, UpdateHandler],
+        context: ForwarderContext,
+        logger: Logger,
+        status_reporter: StatusReporter,
+        configuration_store: ConfigurationStore,
+    ):
+        self._retrieved: Optional["Queue[Union[bytes, RuntimeError]]"] = retrieved
+        self._update_handlers = update_handlers
+        self._context = context
+        self._logger = logger
+        self._status_reporter = status_reporter
+        self._configuration_store = configuration_store
+        self._held_back: List[ConfigUpdate] = []
+
+    @property
+    def done(self) -> bool:
+        return self._retrieved is None
+
+    def poll(self):
+        """
+        Reconcile, and apply the changes held back, if the stored
+        configuration has been retrieved
+        """
+        if self._retrieved is None:
+            return
+        try:
+            retrieved = self._retrieved.get_nowait()
+        except Empty:
+            return
+        self._retrieved = None
+        if isinstance(retrieved, RuntimeError):
+            self._logger.error(
+                f"Could not retrieve stored configuration on start-up: {retrieved}"
+            )
+        else:
+            reconcile_configuration(
+                parse_config_update(retrieved),
+                self._update_handlers,
+                self._context,
+                self._logger,
+                self._status_reporter,
+                self._configuration_store,
+            )
+        held_back, self._held_back = self._held_back, []
+        for configuration_change in held_back:
+            self.handle_configuration_change(configuration_change)
+
+    def handle_configuration_change(self, configuration_change: ConfigUpdate):
+        if self._retrieved is not None:
+            self._logger.info(
+                "Holding back configuration change until the stored configuration is retrieved"
+            )
+            self._held_back.append(configuration_change)
+            return
+        handle_configuration_change(
+            configuration_change,
+            self._update_handlers,
+            self._context,
+            self._logger,
+            self._status_reporter,
+            self._configuration_store,
+        )
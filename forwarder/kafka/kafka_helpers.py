@@ -4,7 +4,7 @@ from typing import Dict, Optional, Tuple, Union
 from confluent_kafka import Consumer, Producer
 from streaming_data_types.epics_connection_ep01 import ConnectionInfo, serialise_ep01
 
-from forwarder.utils import Counter
+from forwarder.utils import Counter, LabelledCounter
 
 from .kafka_producer import KafkaProducer
 
@@ -62,6 +62,9 @@ def create_producer(
     counter: Optional[Counter] = None,
     buffer_err_counter: Optional[Counter] = None,
     delivery_err_counter: Optional[Counter] = None,
+    delivery_err_type_counter: Optional[LabelledCounter] = None,
+    topic_counter: Optional[LabelledCounter] = None,
+    topic_bytes_counter: Optional[LabelledCounter] = None,
 ) -> KafkaProducer:
     producer_config = {
         "bootstrap.servers": broker_address,
@@ -79,6 +82,9 @@ def create_producer(
         update_msg_counter=counter,
         update_buffer_err_counter=buffer_err_counter,
         update_delivery_err_counter=delivery_err_counter,
+        update_delivery_err_type_counter=delivery_err_type_counter,
+        update_topic_counter=topic_counter,
+        update_topic_bytes_counter=topic_bytes_counter,
     )
 
 
@@ -89,12 +95,16 @@ def create_consumer(
     username: Optional[str] = None,
     password: Optional[str] = None,
     ssl_ca_file: Optional[str] = None,
+    partition_eof: bool = False,
 ) -> Consumer:
     consumer_config = {
         "bootstrap.servers": broker_address,
         "group.id": uuid.uuid4(),
         "default.topic.config": {"auto.offset.reset": "latest"},
     }
+    if partition_eof:
+        # Report reaching the end of each partition as an error message
+        consumer_config["enable.partition.eof"] = True
     if security_protocol:
         consumer_config.update(
             get_sasl_config(security_protocol, sasl_mechanism, username, password)
@@ -1,10 +1,10 @@
-from threading import Thread
-from typing import Optional
+from threading import Lock, Thread
+from typing import Dict, Optional, Union
 
 import confluent_kafka
 
 from forwarder.application_logger import get_logger
-from forwarder.utils import Counter
+from forwarder.utils import Counter, LabelledCounter
 
 
 class KafkaProducer:
@@ -14,11 +14,19 @@ class KafkaProducer:
         update_msg_counter: Optional[Counter] = None,
         update_buffer_err_counter: Optional[Counter] = None,
         update_delivery_err_counter: Optional[Counter] = None,
+        update_delivery_err_type_counter: Optional[LabelledCounter] = None,
+        update_topic_counter: Optional[LabelledCounter] = None,
+        update_topic_bytes_counter: Optional[LabelledCounter] = None,
     ):
         self._producer = producer
         self._update_msg_counter = update_msg_counter
         self._update_buffer_err_counter = update_buffer_err_counter
         self._update_delivery_err_counter = update_delivery_err_counter
+        self._update_delivery_err_type_counter = update_delivery_err_type_counter
+        self._update_topic_counter = update_topic_counter
+        self._update_topic_bytes_counter = update_topic_bytes_counter
+        self._partition_counts: Dict[str, Optional[int]] = {}
+        self._partition_counts_lock = Lock()
         self._cancelled = False
         self._poll_thread = Thread(target=self._poll_loop)
         self._poll_thread.start()
@@ -37,24 +45,70 @@ class KafkaProducer:
         max_wait_to_publish_producer_queue = 2  # seconds
         self._producer.flush(max_wait_to_publish_producer_queue)
 
+    def partition_count(self, topic: str, timeout_s: float = 5.0) -> Optional[int]:
+        """
+        Number of partitions of a topic, read from the broker the first time
+        it is asked for. None if it could not be read.
+        """
+        with self._partition_counts_lock:
+            if topic not in self._partition_counts:
+                try:
+                    metadata = self._producer.list_topics(topic, timeout=timeout_s)
+                    topic_metadata = metadata.topics.get(topic)
+                    self._partition_counts[topic] = (
+                        len(topic_metadata.partitions)
+                        if topic_metadata is not None
+                        and topic_metadata.error is None
+                        and topic_metadata.partitions
+                        else None
+                    )
+                except confluent_kafka.KafkaException as error:
+                    self.logger.error(
+                        f'Could not read the partitions of topic "{topic}": {error}'
+                    )
+                    self._partition_counts[topic] = None
+            return self._partition_counts[topic]
+
     def produce(
-        self, topic: str, payload: bytes, timestamp_ms: int, key: Optional[str] = None
+        self,
+        topic: str,
+        payload: bytes,
+        timestamp_ms: int,
+        key: Optional[Union[str, bytes]] = None,
+        partition: Optional[int] = None,
     ):
         def ack(err, _):
             if err:
                 self.logger.error(f"Message failed delivery: {err}")
                 if self._update_delivery_err_counter:
                     self._update_delivery_err_counter.increment()
+                if self._update_delivery_err_type_counter:
+                    self._update_delivery_err_type_counter.increment(err.name())
             else:
                 # increment only for PVs related updates
                 # key is None when we send commands.
-                if self._update_msg_counter and key is not None:
-                    self._update_msg_counter.increment()
+                if key is not None:
+                    if self._update_msg_counter:
+                        self._update_msg_counter.increment()
+                    if self._update_topic_counter:
+                        self._update_topic_counter.increment(topic)
+                    if self._update_topic_bytes_counter:
+                        self._update_topic_bytes_counter.increment(topic, len(payload))
 
         try:
-            self._producer.produce(
-                topic, payload, key=key, on_delivery=ack, timestamp=timestamp_ms
-            )
+            if partition is None:
+                self._producer.produce(
+                    topic, payload, key=key, on_delivery=ack, timestamp=timestamp_ms
+                )
+            else:
+                self._producer.produce(
+                    topic,
+                    payload,
+                    key=key,
+                    partition=partition,
+                    on_delivery=ack,
+                    timestamp=timestamp_ms,
+                )
         except BufferError:
             # Producer message buffer is full.
             # Data loss occurred as messages are produced faster than are sent to the kafka broker.
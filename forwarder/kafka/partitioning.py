@@ -0,0 +1,112 @@
+import zlib
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from forwarder.application_logger import get_logger
+
+if TYPE_CHECKING:
+    from forwarder.channel_policy import ChannelPolicies
+    from forwarder.kafka.kafka_producer import KafkaProducer
+
+# librdkafka hashes the key of every message to choose its partition
+PARTITIONING_KEY = "key"
+# The partition of each PV is chosen once, when it is subscribed to
+PARTITIONING_PRECOMPUTED = "precomputed"
+PARTITIONING_STRATEGIES = (PARTITIONING_KEY, PARTITIONING_PRECOMPUTED)
+
+logger = get_logger()
+
+
+def key_partition(key: bytes, partition_count: int) -> int:
+    """
+    The partition librdkafka's default (consistent_random) partitioner
+    chooses for a key, which is the CRC32 of the key
+    """
+    return zlib.crc32(key) % partition_count
+
+
+class PVPartitioner:
+    """
+    Partitions for the messages of one PV. Messages go to one partition,
+    keeping them in order, unless the PV is spread over several partitions,
+    in which case they go to each in turn.
+    """
+
+    __slots__ = ("partitions", "_next")
+
+    def __init__(self, partitions: Tuple[int, ...]):
+        self.partitions = partitions
+        self._next = 0
+
+    def next(self) -> int:
+        if len(self.partitions) == 1:
+            return self.partitions[0]
+        # Not locked, a partition chosen twice by racing threads does no harm
+        index = self._next
+        self._next = (index + 1) % len(self.partitions)
+        return self.partitions[index]
+
+
+def create_pv_partitioner(
+    strategy: str,
+    key: bytes,
+    partition_count: Optional[int],
+    partition_spread: Optional[int] = None,
+) -> Optional[PVPartitioner]:
+    """
+    Returns None when librdkafka should choose the partition from the key
+    """
+    if partition_count is None:
+        return None
+    if partition_spread is not None and partition_spread > 1:
+        start = key_partition(key, partition_count)
+        return PVPartitioner(
+            tuple(
+                (start + offset) % partition_count
+                for offset in range(min(partition_spread, partition_count))
+            )
+        )
+    if strategy == PARTITIONING_PRECOMPUTED:
+        return PVPartitioner((key_partition(key, partition_count),))
+    return None
+
+
+class Partitioning:
+    """
+    Chooses the partitioner for each forwarded channel when it is subscribed
+    to, from the partitioning strategy and the partition_spread of the channel
+    policies, so that hot PVs can be spread over several partitions.
+
+    The partition counts of the output topics are read from the broker once
+    per topic. If they cannot be read, librdkafka partitions by key.
+    """
+
+    def __init__(
+        self,
+        producer: "KafkaProducer",
+        strategy: str = PARTITIONING_KEY,
+        channel_policies: Optional["ChannelPolicies"] = None,
+    ):
+        if strategy not in PARTITIONING_STRATEGIES:
+            raise ValueError(f'Unknown partitioning strategy "{strategy}"')
+        self._producer = producer
+        self._strategy = strategy
+        self._channel_policies = channel_policies
+
+    def partitioner_for(
+        self, pv_name: str, schema: str, output_topic: str
+    ) -> Optional[PVPartitioner]:
+        partition_spread = (
+            self._channel_policies.partition_spread_for(pv_name, schema)
+            if self._channel_policies is not None
+            else None
+        )
+        if self._strategy == PARTITIONING_KEY and partition_spread is None:
+            return None
+        partition_count = self._producer.partition_count(output_topic)
+        if partition_count is None:
+            logger.warning(
+                f'Partitioning "{pv_name}" by key as the number of partitions of "{output_topic}" is not known'
+            )
+        return create_pv_partitioner(
+            self._strategy, pv_name.encode(), partition_count, partition_spread
+        )
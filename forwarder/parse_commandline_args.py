@@ -1,4 +1,5 @@
 import logging
+import tempfile
 from os import getpid
 from pathlib import Path
 
@@ -87,6 +88,22 @@ def parse_args():
         type=str,
         env_var="STATUS_TOPIC_SASL_PASSWORD",
     )
+    parser.add_argument(
+        "--status-mode",
+        required=False,
+        help='"full" to list every stream in each status message, or "summary" to only send counts of streams and list them in chunks of messages when they change',
+        choices=["full", "summary"],
+        default="full",
+        env_var="STATUS_MODE",
+    )
+    parser.add_argument(
+        "--status-listing-chunk-size",
+        required=False,
+        help='Number of streams listed per status message in "summary" status mode',
+        type=int,
+        default=1000,
+        env_var="STATUS_LISTING_CHUNK_SIZE",
+    )
     parser.add_argument(
         "--output-broker",
         required=True,
@@ -116,6 +133,23 @@ def parse_args():
         type=str,
         env_var="STORAGE_TOPIC_SASL_PASSWORD",
     )
+    parser.add_argument(
+        "--storage-cache-file",
+        required=False,
+        help="Local file to cache the last applied forwarding details in. On start-up these are applied "
+        "immediately and then reconciled in the background with those in the storage topic",
+        type=str,
+        env_var="STORAGE_CACHE_FILE",
+    )
+    parser.add_argument(
+        "--storage-snapshot-interval",
+        required=False,
+        help="Interval (in seconds) after which the forwarding details are stored again as a full snapshot "
+        "even if unchanged. Must be shorter than the retention of the storage topic",
+        type=float,
+        default=24 * 60 * 60,
+        env_var="STORAGE_SNAPSHOT_INTERVAL",
+    )
     parser.add_argument(
         "--ssl-ca-cert-file",
         required=False,
@@ -167,6 +201,51 @@ def parse_args():
         env_var="PV_UPDATE_PERIOD",
         type=int,
     )
+    parser.add_argument(
+        "--ca-control-refresh-period",
+        required=False,
+        help="If set then CA PV units are read on connection and refreshed with this interval, instead of monitoring them with a second subscription per PV (units=milliseconds)",
+        env_var="CA_CONTROL_REFRESH_PERIOD",
+        type=int,
+    )
+    parser.add_argument(
+        "--channel-policy-file",
+        required=False,
+        help="TOML file of per-channel forwarding policies, such as deadbands for noisy PVs",
+        env_var="CHANNEL_POLICY_FILE",
+        type=str,
+    )
+    parser.add_argument(
+        "--profiler-output-dir",
+        required=False,
+        help="Directory to write profiles to, sending SIGUSR1 to the forwarder starts sampling the stacks of all threads and sending it again stops early",
+        env_var="PROFILER_OUTPUT_DIR",
+        type=str,
+        default=tempfile.gettempdir(),
+    )
+    parser.add_argument(
+        "--profiler-sample-rate",
+        required=False,
+        help="Number of times per second to sample the stacks of all threads when profiling",
+        env_var="PROFILER_SAMPLE_RATE",
+        type=float,
+        default=100,
+    )
+    parser.add_argument(
+        "--profiler-duration",
+        required=False,
+        help="Longest time to profile for after SIGUSR1 is received (units=seconds)",
+        env_var="PROFILER_DURATION",
+        type=float,
+        default=30,
+    )
+    parser.add_argument(
+        "--record-file",
+        required=False,
+        help="File to record all EPICS updates received to, for replaying offline with benchmarks.replay",
+        env_var="RECORD_FILE",
+        type=str,
+    )
     parser.add_argument(
         "--service-id",
         required=False,
@@ -175,6 +254,31 @@ def parse_args():
         env_var="SERVICE_ID",
         type=str,
     )
+    parser.add_argument(
+        "--kafka-partitioning",
+        required=False,
+        help='"key" for librdkafka to choose the partition of each message from its key (the PV name), or "precomputed" to '
+        "choose the partition of each PV once when it is subscribed to. Busy PVs can also be spread over partitions with channel policies",
+        choices=["key", "precomputed"],
+        default="key",
+        env_var="KAFKA_PARTITIONING",
+    )
+    parser.add_argument(
+        "--fleet",
+        required=False,
+        help="Name of a fleet of forwarders sharing the config topic, each forwards the PVs which hash onto its service ID. "
+        "Members find each other from the status topic, so every member needs a unique service ID",
+        env_var="FLEET",
+        type=str,
+    )
+    parser.add_argument(
+        "--fleet-discovery-time",
+        required=False,
+        help="Time to wait for the status messages of the other members of the fleet on start-up (units=seconds)",
+        env_var="FLEET_DISCOVERY_TIME",
+        type=float,
+        default=5,
+    )
     parser.add_argument(
         "--fake-pv-period",
         required=False,
@@ -0,0 +1,481 @@
+import json
+import struct
+import time
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from forwarder.application_logger import get_logger
+from forwarder.common import Channel, EpicsProtocol
+
+if TYPE_CHECKING:
+    from caproto import Message as CA_Message
+    from p4p import Type, Value
+
+    from forwarder.kafka.kafka_producer import KafkaProducer
+    from forwarder.update_handlers.connection_status_tracker import (
+        ConnectionStatusTracker,
+        PVConnectionStatus,
+    )
+    from forwarder.update_handlers.decoded_update import ValueConversion
+    from forwarder.update_handlers.serialiser_tracker import SerialiserTracker
+
+logger = get_logger()
+
+# A recording is this marker followed by records, each of which is a header
+# (arrival time in ns since the epoch, channel ID, record kind and payload
+# length, little-endian) and a payload
+FILE_MARKER = b"FWDREC01"
+_RECORD_HEADER = struct.Struct("<qIBI")
+
+# The channel a channel ID refers to, as JSON, recorded before its first update
+RECORD_CHANNEL = 0
+# A CA monitor update, as the bytes received from the IOC
+RECORD_CA_UPDATE = 1
+# A change in CA connection state, as the name of the new state
+RECORD_CA_CONNECTION = 2
+# The structure of the following PVA updates of a channel, as JSON, recorded
+# when it first connects and whenever it changes
+RECORD_PVA_TYPE = 3
+# A PVA monitor update, as the values of the fields of the structure in order
+RECORD_PVA_UPDATE = 4
+# A PVA monitor error, such as a disconnection, as the exception type and message
+RECORD_PVA_ERROR = 5
+
+_LENGTH = struct.Struct("<I")
+# p4p type codes of the scalars which can be recorded
+_SCALAR_DTYPES = {
+    "?": np.dtype("<?"),
+    "b": np.dtype("<i1"),
+    "B": np.dtype("<u1"),
+    "h": np.dtype("<i2"),
+    "H": np.dtype("<u2"),
+    "i": np.dtype("<i4"),
+    "I": np.dtype("<u4"),
+    "l": np.dtype("<i8"),
+    "L": np.dtype("<u8"),
+    "f": np.dtype("<f4"),
+    "d": np.dtype("<f8"),
+}
+
+
+def _pack_string(value: str, out: bytearray):
+    encoded = value.encode()
+    out += _LENGTH.pack(len(encoded))
+    out += encoded
+
+
+def _unpack_string(payload: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = _LENGTH.unpack_from(payload, offset)
+    offset += _LENGTH.size
+    return payload[offset : offset + length].decode(), offset + length
+
+
+def encode_pva_fields(fields: List[Tuple[str, Any]], values: Dict, out: bytearray):
+    """
+    Append the values of a structure to out, in the order of its fields as
+    given by p4p's Type.aspy(). Unions and arrays of structures are not
+    supported.
+    """
+    for name, code in fields:
+        value = values[name]
+        if isinstance(code, tuple):
+            if code[0] != "S":
+                raise ValueError(
+                    f'Field "{name}" of type "{code[0]}" cannot be recorded'
+                )
+            encode_pva_fields(code[2], value, out)
+        elif code == "s":
+            _pack_string(value, out)
+        elif code == "as":
+            out += _LENGTH.pack(len(value))
+            for item in value:
+                _pack_string(item, out)
+        elif code in _SCALAR_DTYPES:
+            out += np.array(value, dtype=_SCALAR_DTYPES[code]).tobytes()
+        elif code[0] == "a" and code[1:] in _SCALAR_DTYPES:
+            array = np.ascontiguousarray(value, dtype=_SCALAR_DTYPES[code[1:]])
+            out += _LENGTH.pack(array.size)
+            out += array.tobytes()
+        else:
+            raise ValueError(f'Field "{name}" of type "{code}" cannot be recorded')
+
+
+def decode_pva_fields(
+    fields: List[Tuple[str, Any]], payload: bytes, offset: int = 0
+) -> Tuple[Dict, int]:
+    """
+    The values of a structure written by encode_pva_fields, and the offset
+    after them
+    """
+    values: Dict[str, Any] = {}
+    for name, code in fields:
+        if isinstance(code, tuple):
+            values[name], offset = decode_pva_fields(code[2], payload, offset)
+        elif code == "s":
+            values[name], offset = _unpack_string(payload, offset)
+        elif code == "as":
+            (count,) = _LENGTH.unpack_from(payload, offset)
+            offset += _LENGTH.size
+            items = []
+            for _ in range(count):
+                item, offset = _unpack_string(payload, offset)
+                items.append(item)
+            values[name] = items
+        elif code in _SCALAR_DTYPES:
+            dtype = _SCALAR_DTYPES[code]
+            values[name] = np.frombuffer(payload, dtype, 1, offset)[0].item()
+            offset += dtype.itemsize
+        else:
+            dtype = _SCALAR_DTYPES[code[1:]]
+            (count,) = _LENGTH.unpack_from(payload, offset)
+            offset += _LENGTH.size
+            values[name] = np.frombuffer(payload, dtype, count, offset)
+            offset += count * dtype.itemsize
+    return values, offset
+
+
+def _json_type(spec: Any) -> Any:
+    # Type.aspy() returns tuples, which come back from JSON as lists
+    if isinstance(spec, (list, tuple)):
+        return [_json_type(item) for item in spec]
+    return spec
+
+
+def _type_from_json(spec: Any) -> Any:
+    if isinstance(spec, list):
+        return tuple(_type_from_json(item) for item in spec)
+    return spec
+
+
+class RecordedUpdate(NamedTuple):
+    time_ns: int
+    channel_id: int
+    kind: int
+    payload: bytes
+    # The position of the record in the file
+    offset: int
+
+
+class ChannelRecorder:
+    """
+    Records the updates received by the update handler of one channel
+    """
+
+    __slots__ = ("_recorder", "_channel_id", "_pva_type")
+
+    def __init__(self, recorder: "UpdateRecorder", channel_id: int):
+        self._recorder = recorder
+        self._channel_id = channel_id
+        self._pva_type: Optional[Any] = None
+
+    def ca_update(self, response: "CA_Message"):
+        self._recorder.write(self._channel_id, RECORD_CA_UPDATE, bytes(response))
+
+    def ca_connection(self, state: str):
+        self._recorder.write(self._channel_id, RECORD_CA_CONNECTION, state.encode())
+
+    def pva_update(self, response: Union["Value", Exception]):
+        if isinstance(response, Exception):
+            self._recorder.write(
+                self._channel_id,
+                RECORD_PVA_ERROR,
+                json.dumps([type(response).__name__, str(response)]).encode(),
+            )
+            return
+        # p4p Types do not compare equal even when they have the same structure
+        spec = response.type().aspy()
+        payload = bytearray()
+        try:
+            encode_pva_fields(spec[2], response.todict(), payload)
+        except ValueError as e:
+            self._recorder.skip(str(e))
+            return
+        if spec != self._pva_type:
+            self._recorder.write(
+                self._channel_id, RECORD_PVA_TYPE, json.dumps(_json_type(spec)).encode()
+            )
+            self._pva_type = spec
+        self._recorder.write(self._channel_id, RECORD_PVA_UPDATE, bytes(payload))
+
+
+class UpdateRecorder:
+    """
+    Writes the updates received by the update handlers to a file, so that
+    the update stream of a beamline can be replayed offline with Replayer.
+
+    Updates are written as they were received from the EPICS client
+    libraries, before they are decoded, along with the time they arrived.
+    Updates which cannot be recorded, such as PVA unions, are counted in
+    skipped_updates and otherwise ignored, so recording never affects
+    forwarding.
+    """
+
+    def __init__(self, file_name: str, buffer_size: int = 1024 * 1024):
+        self._file: BinaryIO = open(file_name, "wb", buffering=buffer_size)
+        self._file.write(FILE_MARKER)
+        self._lock = Lock()
+        self._channel_ids: Dict[Channel, int] = {}
+        self._stopped = False
+        self.skipped_updates = 0
+
+    def channel(self, channel: Channel) -> ChannelRecorder:
+        with self._lock:
+            channel_id = self._channel_ids.get(channel)
+            if channel_id is None:
+                channel_id = len(self._channel_ids)
+                self._channel_ids[channel] = channel_id
+                self._write(
+                    channel_id,
+                    RECORD_CHANNEL,
+                    json.dumps(
+                        {
+                            "name": channel.name,
+                            "protocol": channel.protocol.value,
+                            "output_topic": channel.output_topic,
+                            "schema": channel.schema,
+                        }
+                    ).encode(),
+                )
+        return ChannelRecorder(self, channel_id)
+
+    def _write(self, channel_id: int, kind: int, payload: bytes):
+        if self._stopped:
+            return
+        try:
+            self._file.write(
+                _RECORD_HEADER.pack(time.time_ns(), channel_id, kind, len(payload))
+            )
+            self._file.write(payload)
+        except OSError as e:
+            logger.error(f"Stopped recording updates as writing failed: {str(e)}")
+            self._stopped = True
+
+    def write(self, channel_id: int, kind: int, payload: bytes):
+        with self._lock:
+            self._write(channel_id, kind, payload)
+
+    def skip(self, reason: str):
+        with self._lock:
+            self.skipped_updates += 1
+            if self.skipped_updates == 1:
+                logger.warning(f"Not recording some updates: {reason}")
+
+    def stop(self):
+        with self._lock:
+            if not self._stopped:
+                self._stopped = True
+                self._file.close()
+
+
+def read_recording(file_name: str) -> Iterator[RecordedUpdate]:
+    with open(file_name, "rb") as file:
+        if file.read(len(FILE_MARKER)) != FILE_MARKER:
+            raise ValueError(f'"{file_name}" is not a recording of EPICS updates')
+        while True:
+            offset = file.tell()
+            header = file.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                # The end of the file, or of the last complete record if the
+                # recorder did not stop cleanly
+                return
+            time_ns, channel_id, kind, length = _RECORD_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                return
+            yield RecordedUpdate(time_ns, channel_id, kind, payload, offset)
+
+
+class _ReplayedChannel:
+    __slots__ = (
+        "pv_name",
+        "serialiser_trackers",
+        "connection_status",
+        "value_conversion",
+        "pva_type",
+        "pva_fields",
+    )
+
+    def __init__(
+        self,
+        pv_name: str,
+        serialiser_trackers: List["SerialiserTracker"],
+        connection_status: "PVConnectionStatus",
+        value_conversion: "ValueConversion",
+    ):
+        self.pv_name = pv_name
+        self.serialiser_trackers = serialiser_trackers
+        self.connection_status = connection_status
+        self.value_conversion = value_conversion
+        self.pva_type: Optional["Type"] = None
+        self.pva_fields: List[Tuple[str, Any]] = []
+
+
+class Replayer:
+    """
+    Feeds a recording through serialiser trackers and a connection status
+    tracker, the same way the update handlers do, into a producer.
+
+    Updates are replayed at speed times the rate they were recorded at, or
+    as fast as possible if speed is None. Their EPICS timestamps are not
+    changed, so the serialiser trackers reject updates recorded more than a
+    year ago.
+    """
+
+    def __init__(
+        self,
+        producer: "KafkaProducer",
+        speed: Optional[float] = 1.0,
+        periodic_update_ms: Optional[int] = None,
+    ):
+        if speed is not None and speed <= 0:
+            raise ValueError("The replay speed must be greater than zero")
+        self._producer = producer
+        self._speed = speed
+        self._periodic_update_ms = periodic_update_ms
+        self._channels: Dict[int, _ReplayedChannel] = {}
+        self.replayed_updates = 0
+
+    def _add_channel(
+        self, channel_id: int, payload: bytes, tracker: "ConnectionStatusTracker"
+    ):
+        from forwarder.update_handlers.decoded_update import ValueConversion
+        from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+
+        channel = json.loads(payload)
+        self._channels[channel_id] = _ReplayedChannel(
+            channel["name"],
+            create_serialiser_list(
+                self._producer,
+                channel["name"],
+                channel["output_topic"],
+                channel["schema"],
+                EpicsProtocol(channel["protocol"]),
+                self._periodic_update_ms,
+                include_connection_status=False,
+            ),
+            tracker.register(channel["name"], channel["output_topic"]),
+            ValueConversion(),
+        )
+
+    def _replay_ca_update(self, channel: _ReplayedChannel, payload: bytes):
+        from caproto import SERVER
+
+        # Not exported by caproto, but it parses messages the same way as its clients
+        from caproto._commands import read_from_bytestream
+
+        from forwarder.update_handlers.decoded_update import decode_ca_update
+
+        _, response, _ = read_from_bytestream(bytearray(payload), SERVER)
+        decoded = decode_ca_update(response, channel.value_conversion)
+        for serialiser_tracker in channel.serialiser_trackers:
+            serialiser_tracker.process_ca_message(response, decoded)
+
+    def _replay_ca_connection(self, channel: _ReplayedChannel, payload: bytes):
+        state = payload.decode()
+        channel.value_conversion.reset()
+        channel.connection_status.ca_state_changed(state)
+        for serialiser_tracker in channel.serialiser_trackers:
+            serialiser_tracker.process_ca_connection(
+                channel.pv_name, state  # type: ignore
+            )
+
+    def _replay_pva_type(self, channel: _ReplayedChannel, payload: bytes):
+        from p4p import Type
+
+        spec = _type_from_json(json.loads(payload))
+        channel.pva_type = Type(spec[2], id=spec[1])
+        channel.pva_fields = spec[2]
+
+    def _replay_pva_update(self, channel: _ReplayedChannel, payload: bytes):
+        from p4p import Value
+
+        from forwarder.update_handlers.decoded_update import decode_pva_update
+
+        values, _ = decode_pva_fields(channel.pva_fields, payload)
+        response = Value(channel.pva_type, values)
+        channel.connection_status.pva_update(response)
+        decoded = decode_pva_update(response, channel.value_conversion)
+        for serialiser_tracker in channel.serialiser_trackers:
+            serialiser_tracker.process_pva_message(response, decoded)
+
+    def _replay_pva_error(self, channel: _ReplayedChannel, payload: bytes):
+        from p4p.client import thread
+
+        error_type, message = json.loads(payload)
+        error_class = getattr(thread, error_type, thread.Disconnected)
+        response = error_class(message)
+        channel.value_conversion.reset()
+        channel.connection_status.pva_update(response)
+        for serialiser_tracker in channel.serialiser_trackers:
+            serialiser_tracker.process_pva_message(response, None)
+
+    def _wait_until(self, time_ns: int, first_time_ns: int, start_s: float):
+        if self._speed is None:
+            return
+        delay_s = (time_ns - first_time_ns) / 1e9 / self._speed - (
+            time.monotonic() - start_s
+        )
+        if delay_s > 0:
+            time.sleep(delay_s)
+
+    def replay(self, file_name: str) -> float:
+        """
+        Replay a recording, returning how long it took in seconds
+        """
+        from forwarder.update_handlers.connection_status_tracker import (
+            ConnectionStatusTracker,
+        )
+
+        tracker = ConnectionStatusTracker(self._producer, self._periodic_update_ms)
+        replay_functions = {
+            RECORD_CA_UPDATE: self._replay_ca_update,
+            RECORD_CA_CONNECTION: self._replay_ca_connection,
+            RECORD_PVA_TYPE: self._replay_pva_type,
+            RECORD_PVA_UPDATE: self._replay_pva_update,
+            RECORD_PVA_ERROR: self._replay_pva_error,
+        }
+        first_time_ns: Optional[int] = None
+        start_s = time.monotonic()
+        try:
+            for time_ns, channel_id, kind, payload, offset in read_recording(file_name):
+                if kind == RECORD_CHANNEL:
+                    self._add_channel(channel_id, payload, tracker)
+                    continue
+                replay_function = replay_functions.get(kind)
+                channel = self._channels.get(channel_id)
+                if replay_function is None or channel is None:
+                    logger.warning(
+                        f"Skipping record at offset {offset} of the recording as it has an unknown kind ({kind}) or channel ID ({channel_id})"
+                    )
+                    continue
+                if first_time_ns is None:
+                    first_time_ns = time_ns
+                self._wait_until(time_ns, first_time_ns, start_s)
+                try:
+                    replay_function(channel, payload)
+                except (RuntimeError, ValueError) as e:
+                    logger.error(
+                        f"Got error when replaying update. Message was: {str(e)}"
+                    )
+                self.replayed_updates += 1
+            return time.monotonic() - start_s
+        finally:
+            for channel in self._channels.values():
+                for serialiser_tracker in channel.serialiser_trackers:
+                    serialiser_tracker.stop()
+                channel.connection_status.release()
+            self._channels.clear()
+            tracker.stop()
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+from collections import Counter
+from threading import Event, Lock, Thread
+from threading import enumerate as enumerate_threads
+from threading import get_ident
+from types import FrameType
+from typing import Dict, List, Optional
+
+from forwarder.application_logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_SAMPLE_RATE_HZ = 100
+DEFAULT_DURATION_S = 30.0
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapsed_stack(thread_name: str, frame: Optional[FrameType]) -> str:
+    labels: List[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    labels.reverse()
+    return ";".join(labels)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads at a fixed rate while it is running and
+    writes how often each stack was seen to a file in the collapsed stack
+    format, which flamegraph.pl, speedscope and similar tools can display.
+
+    Started and stopped with toggle(), for example from a signal handler, so
+    that the forwarder can be profiled in production without restarting it.
+    Profiling stops by itself after duration_s. There is no cost while it is
+    not running.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        sample_rate_hz: float = DEFAULT_SAMPLE_RATE_HZ,
+        duration_s: float = DEFAULT_DURATION_S,
+    ):
+        if sample_rate_hz <= 0:
+            raise ValueError("The profiler sample rate must be greater than zero")
+        self._output_dir = output_dir
+        self._interval_s = 1.0 / sample_rate_hz
+        self._duration_s = duration_s
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._stop_requested = Event()
+        self.last_output_file: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def toggle(self):
+        """
+        Start profiling, or stop it early if it is running
+        """
+        with self._lock:
+            if self.running:
+                self._stop_requested.set()
+                return
+            self._stop_requested.clear()
+            self._thread = Thread(
+                target=self._run, name="sampling_profiler", daemon=True
+            )
+            self._thread.start()
+        logger.warning(
+            f"Started profiling for up to {self._duration_s} s, at {1.0 / self._interval_s:.0f} samples per second"
+        )
+
+    def stop(self, timeout_s: Optional[float] = None):
+        """
+        Stop profiling if it is running, waiting for the samples to be written
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            self._stop_requested.set()
+            thread.join(timeout_s)
+
+    def _sample(self, stacks: Counter, own_thread_id: int):
+        thread_names: Dict[int, str] = {
+            thread.ident: thread.name
+            for thread in enumerate_threads()
+            if thread.ident is not None
+        }
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            stacks[
+                _collapsed_stack(thread_names.get(thread_id, str(thread_id)), frame)
+            ] += 1
+
+    def _run(self):
+        stacks: Counter = Counter()
+        own_thread_id = get_ident()
+        started_s = time.monotonic()
+        next_sample_s = started_s
+        try:
+            while time.monotonic() - started_s < self._duration_s:
+                self._sample(stacks, own_thread_id)
+                next_sample_s += self._interval_s
+                if self._stop_requested.wait(
+                    max(0.0, next_sample_s - time.monotonic())
+                ):
+                    break
+            self.last_output_file = self._write(stacks)
+            logger.warning(
+                f"Stopped profiling after {time.monotonic() - started_s:.1f} s, samples written to {self.last_output_file}"
+            )
+        except Exception as e:
+            logger.error(f"Profiling failed. The message was: {str(e)}")
+
+    def _write(self, stacks: Counter) -> str:
+        file_name = os.path.join(
+            self._output_dir,
+            f"forwarder-profile-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}.folded",
+        )
+        with open(file_name, "w") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        return file_name
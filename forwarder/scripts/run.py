@@ -1,27 +1,52 @@
 import os
+import signal
 import sys
 from contextlib import ExitStack
+from dataclasses import replace
+from queue import Queue
 from socket import gethostname
-from typing import Dict
-
-from caproto.threading.client import Context as CaContext
-from p4p.client.thread import Context as PvaContext
+from threading import Thread
+from typing import Dict, Optional, Union
 
 from forwarder.application_logger import get_logger, setup_logger
+from forwarder.channel_policy import load_channel_policies
 from forwarder.common import Channel
-from forwarder.configuration_store import ConfigurationStore, NullConfigurationStore
-from forwarder.handle_config_change import handle_configuration_change
+from forwarder.configuration_store import (
+    SNAPSHOT_INTERVAL_S,
+    ConfigurationStore,
+    NullConfigurationStore,
+)
+from forwarder.fleet import Fleet, FleetMembership
+from forwarder.handle_config_change import (
+    BackgroundReconciliation,
+    ForwarderContext,
+    handle_configuration_change,
+    reconcile_configuration,
+    stop_update_handlers,
+)
 from forwarder.kafka.kafka_helpers import (
     create_consumer,
     create_producer,
     parse_kafka_uri,
 )
+from forwarder.kafka.partitioning import PARTITIONING_KEY, Partitioning
 from forwarder.parse_commandline_args import get_version, parse_args
 from forwarder.parse_config_update import parse_config_update
+from forwarder.recording import UpdateRecorder
+from forwarder.sampling_profiler import SamplingProfiler
 from forwarder.statistics_reporter import StatisticsReporter
-from forwarder.status_reporter import StatusReporter
+from forwarder.status_reporter import (
+    DEFAULT_LISTING_CHUNK_SIZE,
+    STATUS_MODE_FULL,
+    StatusReporter,
+)
+from forwarder.update_handlers.batch_flusher import BatchFlusher
+from forwarder.update_handlers.ca_control_poller import CAControlPoller
+from forwarder.update_handlers.connection_status_tracker import ConnectionStatusTracker
 from forwarder.update_handlers.create_update_handler import UpdateHandler
-from forwarder.utils import Counter
+from forwarder.update_handlers.fake_load import FakeLoad
+from forwarder.update_handlers.rate_limiter import RateLimiters
+from forwarder.utils import Counter, LabelledCounter, LazyProxy
 
 
 def create_epics_producer(
@@ -31,6 +56,9 @@ def create_epics_producer(
     update_message_counter,
     update_buffer_err_counter,
     update_delivery_err_counter,
+    update_delivery_err_type_counter=None,
+    update_topic_counter=None,
+    update_topic_bytes_counter=None,
 ):
     (
         broker,
@@ -49,6 +77,9 @@ def create_epics_producer(
         counter=update_message_counter,
         buffer_err_counter=update_buffer_err_counter,
         delivery_err_counter=update_delivery_err_counter,
+        delivery_err_type_counter=update_delivery_err_type_counter,
+        topic_counter=update_topic_counter,
+        topic_bytes_counter=update_topic_bytes_counter,
     )
     return producer
 
@@ -77,6 +108,41 @@ def create_config_consumer(broker_uri, broker_sasl_password, broker_ssl_ca_file)
     return consumer
 
 
+def create_fleet_membership(
+    fleet_name,
+    broker_uri,
+    broker_sasl_password,
+    broker_ssl_ca_file,
+    service_id,
+    logger,
+) -> FleetMembership:
+    (
+        broker,
+        topic,
+        security_protocol,
+        sasl_mechanism,
+        username,
+    ) = parse_kafka_uri(broker_uri)
+
+    if not topic:
+        raise RuntimeError("Fleet membership must have a status topic")
+
+    return FleetMembership(
+        create_consumer(
+            broker,
+            security_protocol,
+            sasl_mechanism,
+            username,
+            broker_sasl_password,
+            broker_ssl_ca_file,
+        ),
+        topic,
+        fleet_name,
+        service_id,
+        logger,
+    )
+
+
 def create_status_reporter(
     update_handlers,
     broker_uri,
@@ -85,6 +151,10 @@ def create_status_reporter(
     service_id,
     version,
     logger,
+    mode=STATUS_MODE_FULL,
+    listing_chunk_size=DEFAULT_LISTING_CHUNK_SIZE,
+    connection_status_tracker=None,
+    fleet_name=None,
 ):
     (
         broker,
@@ -111,12 +181,20 @@ def create_status_reporter(
         service_id,
         version,
         logger,
+        mode=mode,
+        listing_chunk_size=listing_chunk_size,
+        connection_status_tracker=connection_status_tracker,
+        fleet_name=fleet_name,
     )
     return status_reporter
 
 
 def create_configuration_store(
-    storage_topic, storage_topic_sasl_password, broker_ssl_ca_file
+    storage_topic,
+    storage_topic_sasl_password,
+    broker_ssl_ca_file,
+    cache_file=None,
+    snapshot_interval_s=SNAPSHOT_INTERVAL_S,
 ):
     (
         broker,
@@ -145,12 +223,34 @@ def create_configuration_store(
             username,
             storage_topic_sasl_password,
             broker_ssl_ca_file,
+            partition_eof=True,
         ),
         topic,
+        cache_file=cache_file,
+        snapshot_interval_s=snapshot_interval_s,
     )
     return configuration_store
 
 
+def start_background_retrieval(
+    configuration_store: ConfigurationStore,
+) -> "Queue[Union[bytes, RuntimeError]]":
+    """
+    Retrieve the stored configuration from the storage topic on a separate
+    thread, the result (or error) is put on the returned queue
+    """
+    result: "Queue[Union[bytes, RuntimeError]]" = Queue(maxsize=1)
+
+    def _retrieve():
+        try:
+            result.put(configuration_store.retrieve_configuration())
+        except RuntimeError as error:
+            result.put(error)
+
+    Thread(target=_retrieve, daemon=True).start()
+    return result
+
+
 def create_statistics_reporter(
     service_id,
     grafana_carbon_address,
@@ -160,6 +260,10 @@ def create_statistics_reporter(
     update_delivery_err_counter,
     logger,
     statistics_update_interval,
+    update_throttled_counter=None,
+    update_delivery_err_type_counter=None,
+    update_topic_counter=None,
+    update_topic_bytes_counter=None,
 ):
     metric_hostname = gethostname().replace(".", "_")
     prefix = f"Forwarder.{metric_hostname}.{service_id}.throughput".replace(
@@ -174,10 +278,37 @@ def create_statistics_reporter(
         logger,
         prefix=prefix,
         update_interval_s=statistics_update_interval,
+        update_throttled_counter=update_throttled_counter,
+        update_delivery_err_type_counter=update_delivery_err_type_counter,
+        update_topic_counter=update_topic_counter,
+        update_topic_bytes_counter=update_topic_bytes_counter,
     )
     return statistics_reporter
 
 
+def create_ca_context():
+    from caproto.threading.client import Context as CaContext
+
+    return CaContext()
+
+
+def create_pva_context():
+    from p4p.client.thread import Context as PvaContext
+
+    return PvaContext("pva", nt=False)
+
+
+def install_profiler_signal_handler(output_dir, sample_rate_hz, duration_s):
+    """
+    Start or stop profiling when SIGUSR1 is received, where the platform has it
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return None
+    profiler = SamplingProfiler(output_dir, sample_rate_hz, duration_s)
+    signal.signal(signal.SIGUSR1, lambda signal_number, frame: profiler.toggle())
+    return profiler
+
+
 def main():
     args = parse_args()
 
@@ -207,18 +338,29 @@ def main():
     get_logger().info(
         f"Forwarder version '{version}' started, service Id: {args.service_id}"
     )
-    # EPICS
-    ca_ctx = CaContext()
-    pva_ctx = PvaContext("pva", nt=False)
+    install_profiler_signal_handler(
+        args.profiler_output_dir, args.profiler_sample_rate, args.profiler_duration
+    )
+    # EPICS, the client libraries are only loaded when a channel uses them
+    ca_ctx = LazyProxy(create_ca_context)
+    pva_ctx = LazyProxy(create_pva_context)
     # Using dictionary with Channel as key to ensure we avoid having multiple
     # handlers active for identical configurations: serialising updates from
     # same pv with same schema and publishing to same topic
     update_handlers: Dict[Channel, UpdateHandler] = {}
+    # Set when the stored configuration is being retrieved in the background
+    background_reconciliation: Optional[BackgroundReconciliation] = None
 
     grafana_carbon_address = args.grafana_carbon_address
     update_message_counter = Counter() if grafana_carbon_address else None
     update_buffer_err_counter = Counter() if grafana_carbon_address else None
     update_delivery_err_counter = Counter() if grafana_carbon_address else None
+    update_throttled_counter = Counter() if grafana_carbon_address else None
+    update_delivery_err_type_counter = (
+        LabelledCounter() if grafana_carbon_address else None
+    )
+    update_topic_counter = LabelledCounter() if grafana_carbon_address else None
+    update_topic_bytes_counter = LabelledCounter() if grafana_carbon_address else None
 
     with ExitStack() as exit_stack:
         # Kafka
@@ -229,9 +371,58 @@ def main():
             update_message_counter,
             update_buffer_err_counter,
             update_delivery_err_counter,
+            update_delivery_err_type_counter,
+            update_topic_counter,
+            update_topic_bytes_counter,
         )
         exit_stack.callback(producer.close)
 
+        connection_status_tracker = ConnectionStatusTracker(
+            producer, args.pv_update_period
+        )
+        exit_stack.callback(connection_status_tracker.stop)
+
+        ca_control_poller = (
+            CAControlPoller(args.ca_control_refresh_period)
+            if args.ca_control_refresh_period
+            else None
+        )
+        if ca_control_poller is not None:
+            exit_stack.callback(ca_control_poller.stop)
+
+        channel_policies = (
+            load_channel_policies(args.channel_policy_file)
+            if args.channel_policy_file
+            else None
+        )
+        rate_limiters = (
+            RateLimiters(channel_policies, update_throttled_counter)
+            if channel_policies is not None and channel_policies.has_rate_limits
+            else None
+        )
+        if rate_limiters is not None:
+            exit_stack.callback(rate_limiters.stop)
+
+        partitioning = (
+            Partitioning(producer, args.kafka_partitioning, channel_policies)
+            if args.kafka_partitioning != PARTITIONING_KEY
+            or (channel_policies is not None and channel_policies.has_partition_spread)
+            else None
+        )
+
+        recorder = UpdateRecorder(args.record_file) if args.record_file else None
+        if recorder is not None:
+            exit_stack.callback(recorder.stop)
+            get_logger().warning(f"Recording EPICS updates to {args.record_file}")
+
+        # Generates the updates of all fake PVs, its thread is only started if there are any
+        fake_load = FakeLoad()
+        exit_stack.callback(fake_load.stop)
+
+        # Flushes the batches of all se00 channels, its thread is only started if there are any
+        batch_flusher = BatchFlusher()
+        exit_stack.callback(batch_flusher.stop)
+
         consumer = create_config_consumer(
             args.config_topic, args.config_topic_sasl_password, args.ssl_ca_cert_file
         )
@@ -245,10 +436,47 @@ def main():
             args.service_id,
             version,
             get_logger(),
+            mode=args.status_mode,
+            listing_chunk_size=args.status_listing_chunk_size,
+            connection_status_tracker=connection_status_tracker,
+            fleet_name=args.fleet,
         )
         exit_stack.callback(status_reporter.stop)
         status_reporter.start()
 
+        fleet: Optional[Fleet] = None
+        fleet_membership: Optional[FleetMembership] = None
+        if args.fleet:
+            fleet = Fleet(args.service_id)
+            fleet_membership = create_fleet_membership(
+                args.fleet,
+                args.status_topic,
+                args.status_topic_sasl_password,
+                args.ssl_ca_cert_file,
+                args.service_id,
+                get_logger(),
+            )
+            exit_stack.callback(fleet_membership.stop)
+            fleet_membership.discover(args.fleet_discovery_time)
+            fleet.set_members(fleet_membership.members)
+
+        context = ForwarderContext(
+            producer,
+            ca_ctx,
+            pva_ctx,
+            args.fake_pv_period,
+            args.pv_update_period,
+            connection_status_tracker,
+            ca_control_poller,
+            channel_policies,
+            rate_limiters,
+            partitioning,
+            recorder,
+            fake_load,
+            batch_flusher,
+            fleet,
+        )
+
         if grafana_carbon_address:
             statistics_reporter = create_statistics_reporter(
                 args.service_id,
@@ -259,6 +487,10 @@ def main():
                 update_delivery_err_counter,
                 get_logger(),
                 args.statistics_update_interval,
+                update_throttled_counter,
+                update_delivery_err_type_counter,
+                update_topic_counter,
+                update_topic_bytes_counter,
             )
             exit_stack.callback(statistics_reporter.stop)
             statistics_reporter.start()
@@ -268,21 +500,46 @@ def main():
                 args.storage_topic,
                 args.storage_topic_sasl_password,
                 args.ssl_ca_cert_file,
+                args.storage_cache_file,
+                args.storage_snapshot_interval,
             )
             exit_stack.callback(configuration_store.stop)
-            if not args.skip_retrieval:
+            if not args.skip_retrieval and args.storage_cache_file:
+                try:
+                    # Not stored, the cache may be stale and the storage topic
+                    # is only updated once it has been reconciled with what is
+                    # retrieved from it
+                    handle_configuration_change(
+                        parse_config_update(
+                            configuration_store.retrieve_cached_configuration()
+                        ),
+                        update_handlers,
+                        context,
+                        get_logger(),
+                        status_reporter,
+                        NullConfigurationStore,
+                    )
+                except RuntimeError as error:
+                    get_logger().warning(
+                        f"Could not apply cached configuration on start-up: {error}"
+                    )
+                background_reconciliation = BackgroundReconciliation(
+                    start_background_retrieval(configuration_store),
+                    update_handlers,
+                    context,
+                    get_logger(),
+                    status_reporter,
+                    configuration_store,
+                )
+            elif not args.skip_retrieval:
                 try:
                     restore_config_command = parse_config_update(
                         configuration_store.retrieve_configuration()
                     )
-                    handle_configuration_change(
+                    reconcile_configuration(
                         restore_config_command,
-                        args.fake_pv_period,
-                        args.pv_update_period,
                         update_handlers,
-                        producer,
-                        ca_ctx,
-                        pva_ctx,
+                        context,
                         get_logger(),
                         status_reporter,
                         configuration_store,
@@ -293,14 +550,34 @@ def main():
                         f"{error}"
                     )
         else:
+            if args.storage_cache_file:
+                get_logger().warning(
+                    "Configuration cache file is only used together with a storage topic"
+                )
             configuration_store = NullConfigurationStore
 
-        # Metrics
-        # use https://github.com/Jetsetter/graphyte ?
-        # https://julien.danjou.info/atomic-lock-free-counters-in-python/
-
         try:
             while True:
+                if background_reconciliation is not None:
+                    background_reconciliation.poll()
+                    if background_reconciliation.done:
+                        background_reconciliation = None
+                if (
+                    fleet is not None
+                    and fleet_membership is not None
+                    and fleet_membership.poll()
+                ):
+                    fleet.set_members(fleet_membership.members)
+                    # Only the assignment changed, not the fleet's configuration
+                    reconcile_configuration(
+                        fleet.assigned_configuration(),
+                        update_handlers,
+                        replace(context, fleet=None),
+                        get_logger(),
+                        status_reporter,
+                        NullConfigurationStore,
+                    )
+                configuration_store.save_snapshot_if_due()
                 msg = consumer.poll(timeout=0.5)
                 if msg is None:
                     continue
@@ -309,18 +586,19 @@ def main():
                 else:
                     get_logger().info("Received config message")
                     config_change = parse_config_update(msg.value())
-                    handle_configuration_change(
-                        config_change,
-                        args.fake_pv_period,
-                        args.pv_update_period,
-                        update_handlers,
-                        producer,
-                        ca_ctx,
-                        pva_ctx,
-                        get_logger(),
-                        status_reporter,
-                        configuration_store,
-                    )
+                    if background_reconciliation is not None:
+                        background_reconciliation.handle_configuration_change(
+                            config_change
+                        )
+                    else:
+                        handle_configuration_change(
+                            config_change,
+                            update_handlers,
+                            context,
+                            get_logger(),
+                            status_reporter,
+                            configuration_store,
+                        )
 
         except KeyboardInterrupt:
             get_logger().info("%% Aborted by user")
@@ -331,8 +609,7 @@ def main():
             get_logger().exception(e)
 
         finally:
-            for handler in update_handlers.values():
-                handler.stop()
+            stop_update_handlers(list(update_handlers.values()), get_logger())
 
 
 if __name__ == "__main__":
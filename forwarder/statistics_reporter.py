@@ -1,16 +1,120 @@
+import re
 import time
+from collections import deque
 from logging import Logger
-from typing import Dict
+from threading import Condition, Thread
+from typing import Deque, Dict, List, Optional
 
 import graphyte  # type: ignore
 
 from forwarder.common import Channel
 from forwarder.repeat_timer import RepeatTimer
 from forwarder.update_handlers.create_update_handler import UpdateHandler
-from forwarder.utils import Counter
+from forwarder.utils import Counter, LabelledCounter
+
+# Batches of metrics kept while the carbon server cannot be reached
+MAX_PENDING_BATCHES = 100
+
+
+def _metric_path_segment(name: str) -> str:
+    """
+    Topic names can contain dots, which separate the parts of graphite metric paths
+    """
+    return re.sub(r"[.\s]", "_", name)
+
+
+class BatchedSender(graphyte.Sender):
+    """
+    Collects the metrics sent with send() into a batch, and sends each batch
+    passed to flush() to the carbon server from a background thread, so that
+    the caller never waits for the server.
+
+    Batches which could not be sent are retried along with the next one. At
+    most max_pending_batches are kept, the oldest are dropped after that.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        prefix: Optional[str] = None,
+        max_pending_batches: int = MAX_PENDING_BATCHES,
+        logger: Optional[Logger] = None,
+    ):
+        super().__init__(host, prefix=prefix)
+        self._logger = logger
+        self._batch: List[bytes] = []
+        self._pending: Deque[bytes] = deque(maxlen=max_pending_batches)
+        self._condition = Condition()
+        self._stopped = False
+        # Whether a batch has been queued since the last attempt to send
+        self._flushed = False
+        self.dropped_batches = 0
+        self._thread = Thread(target=self._send_loop, daemon=True)
+        self._thread.start()
+
+    def send(self, metric, value, timestamp=None, tags={}):
+        if timestamp is None:
+            timestamp = time.time()
+        self._batch.append(self.build_message(metric, value, timestamp, tags=tags))
+
+    def flush(self):
+        """
+        Queue the metrics sent since the last flush to be sent as one batch
+        """
+        if not self._batch:
+            return
+        batch = b"".join(self._batch)
+        self._batch = []
+        with self._condition:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped_batches += 1
+                if self._logger is not None:
+                    self._logger.error(
+                        "Dropped the oldest batch of statistics as the carbon server has not been reachable"
+                    )
+            self._pending.append(batch)
+            self._flushed = True
+            self._condition.notify()
+
+    def _send_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                batches = list(self._pending)
+                self._pending.clear()
+                self._flushed = False
+            try:
+                self.send_message(b"".join(batches))
+            except Exception as error:
+                if self._logger is not None:
+                    self._logger.warning(f"Could not send statistics: {error}")
+                with self._condition:
+                    # Retry with the next batch, keeping the newest if there are too many
+                    for batch in reversed(batches):
+                        if len(self._pending) == self._pending.maxlen:
+                            self.dropped_batches += 1
+                            break
+                        self._pending.appendleft(batch)
+                    self._condition.wait_for(lambda: self._flushed or self._stopped)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
 
 
 class StatisticsReporter:
+    """
+    Periodically sends totals and rates of the forwarded updates to a Grafana
+    (carbon) server.
+
+    Rates are calculated from the change in each count since the last send,
+    and all of the metrics for one interval are sent in a single batch.
+    """
+
     def __init__(
         self,
         graphyte_server: str,
@@ -21,22 +125,77 @@ class StatisticsReporter:
         logger: Logger,
         prefix: str = "throughput",
         update_interval_s: int = 10,
+        update_throttled_counter: Optional[Counter] = None,
+        update_delivery_err_type_counter: Optional[LabelledCounter] = None,
+        update_topic_counter: Optional[LabelledCounter] = None,
+        update_topic_bytes_counter: Optional[LabelledCounter] = None,
     ):
         self._graphyte_server = graphyte_server
         self._update_handlers = update_handlers
         self._update_msg_counter = update_msg_counter
         self._update_buffer_err_counter = update_buffer_err_counter
         self._update_delivery_err_counter = update_delivery_err_counter
+        self._update_throttled_counter = update_throttled_counter
+        self._update_delivery_err_type_counter = update_delivery_err_type_counter
+        self._update_topic_counter = update_topic_counter
+        self._update_topic_bytes_counter = update_topic_bytes_counter
+        self._last_sent_s = time.monotonic()
         self._logger = logger
 
-        self._sender = graphyte.Sender(self._graphyte_server, prefix=prefix)
+        self._sender = BatchedSender(
+            self._graphyte_server, prefix=prefix, logger=logger
+        )
         self._repeating_timer = RepeatTimer(update_interval_s, self.send_statistics)
 
     def start(self):
         self._repeating_timer.start()
 
+    def _send_rates(self, elapsed_s: float, timestamp: float):
+        self._sender.send(
+            "update_rate",
+            self._update_msg_counter.snapshot_and_reset() / elapsed_s,
+            timestamp,
+        )
+        self._sender.send(
+            "data_loss_rate",
+            self._update_buffer_err_counter.snapshot_and_reset() / elapsed_s,
+            timestamp,
+        )
+        self._sender.send(
+            "kafka_delivery_error_rate",
+            self._update_delivery_err_counter.snapshot_and_reset() / elapsed_s,
+            timestamp,
+        )
+        if self._update_throttled_counter is not None:
+            self._sender.send(
+                "throttled_update_rate",
+                self._update_throttled_counter.snapshot_and_reset() / elapsed_s,
+                timestamp,
+            )
+        if self._update_topic_counter is not None:
+            for topic, count in self._update_topic_counter.snapshot_and_reset().items():
+                self._sender.send(
+                    f"topics.{_metric_path_segment(topic)}.update_rate",
+                    count / elapsed_s,
+                    timestamp,
+                )
+        if self._update_topic_bytes_counter is not None:
+            topic_bytes = self._update_topic_bytes_counter.snapshot_and_reset()
+            self._sender.send(
+                "update_bytes_rate", sum(topic_bytes.values()) / elapsed_s, timestamp
+            )
+            for topic, count in topic_bytes.items():
+                self._sender.send(
+                    f"topics.{_metric_path_segment(topic)}.update_bytes_rate",
+                    count / elapsed_s,
+                    timestamp,
+                )
+
     def send_statistics(self):
         timestamp = time.time()
+        now_s = time.monotonic()
+        elapsed_s = now_s - self._last_sent_s
+        self._last_sent_s = now_s
         try:
             self._sender.send(
                 "number_pvs", len(self._update_handlers.keys()), timestamp
@@ -52,9 +211,25 @@ class StatisticsReporter:
                 self._update_delivery_err_counter.value,
                 timestamp,
             )
+            if self._update_throttled_counter is not None:
+                self._sender.send(
+                    "throttled_updates", self._update_throttled_counter.value, timestamp
+                )
+            if self._update_delivery_err_type_counter is not None:
+                for (
+                    error_type,
+                    count,
+                ) in self._update_delivery_err_type_counter.values.items():
+                    self._sender.send(
+                        f"kafka_delivery_errors.{error_type.lower()}", count, timestamp
+                    )
+            if elapsed_s > 0:
+                self._send_rates(elapsed_s, timestamp)
+            self._sender.flush()
         except Exception as ex:
             self._logger.error(f"Could not send statistic: {ex}")
 
     def stop(self):
         if self._repeating_timer:
             self._repeating_timer.cancel()
+        self._sender.stop()
@@ -1,19 +1,59 @@
 import json
 import time
+from collections import Counter
 from logging import Logger
 from os import getpid
 from socket import gethostname
-from typing import Dict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
 
 from streaming_data_types.status_x5f2 import serialise_x5f2
 
 from forwarder.common import Channel
 from forwarder.kafka.kafka_producer import KafkaProducer
 from forwarder.repeat_timer import RepeatTimer, milliseconds_to_seconds
+from forwarder.update_handlers.connection_status_tracker import ConnectionStatusTracker
 from forwarder.update_handlers.create_update_handler import UpdateHandler
 
+# Every stream is listed in each status message
+STATUS_MODE_FULL = "full"
+# Each status message has counts of the streams, which are listed in chunks
+# of several messages only when they change
+STATUS_MODE_SUMMARY = "summary"
+STATUS_MODES = (STATUS_MODE_FULL, STATUS_MODE_SUMMARY)
+DEFAULT_LISTING_CHUNK_SIZE = 1000
+
+
+def _stream_json(channel: Channel) -> str:
+    return json.dumps(
+        {
+            "channel_name": channel.name,
+            "protocol": channel.protocol.name,
+            "output_topic": channel.output_topic,
+            "schema": channel.schema,
+        }
+    )
+
 
 class StatusReporter:
+    """
+    Periodically publishes the streams being forwarded.
+
+    The JSON for each stream is kept between reports and the status message is
+    only rebuilt after streams_changed() is called, so a report is not
+    rebuilt from scratch each time for thousands of channels. This also means
+    that the timer thread never reads the update handlers while they change.
+
+    In summary mode each status message only has the number of streams per
+    topic and schema, and their connection status, to keep it small for
+    forwarders with tens of thousands of streams. The full listing of streams
+    is published in chunks of listing_chunk_size streams after they change,
+    numbered with a listing version which is also in the summary.
+
+    In fleet mode the fleet name is the first field of every status message,
+    which is how the members of the fleet find each other.
+    """
+
     def __init__(
         self,
         update_handlers: Dict[Channel, UpdateHandler],
@@ -23,7 +63,13 @@ class StatusReporter:
         version: str,
         logger: Logger,
         interval_ms: int = 4000,
+        mode: str = STATUS_MODE_FULL,
+        listing_chunk_size: int = DEFAULT_LISTING_CHUNK_SIZE,
+        connection_status_tracker: Optional[ConnectionStatusTracker] = None,
+        fleet_name: Optional[str] = None,
     ):
+        if mode not in STATUS_MODES:
+            raise ValueError(f'Unknown status mode "{mode}"')
         self._repeating_timer = RepeatTimer(
             milliseconds_to_seconds(interval_ms), self.report_status
         )
@@ -34,24 +80,52 @@ class StatusReporter:
         self._interval_ms = interval_ms
         self._version = version
         self._logger = logger
+        self._lock = Lock()
+        self._mode = mode
+        self._listing_chunk_size = listing_chunk_size
+        self._connection_status_tracker = connection_status_tracker
+        self._json_prefix = (
+            f'{{"fleet": {json.dumps(fleet_name)}, ' if fleet_name is not None else "{"
+        )
+        self._stream_fragments: Dict[Channel, str] = {}
+        self._streams_per_topic: Counter = Counter()
+        self._streams_per_schema: Counter = Counter()
+        self._listing_version = 0
+        self._listing_chunks = 0
+        # The status JSON and message, None when the streams have changed since they were built
+        self._status: Optional[Tuple[str, bytes]] = None
+        # Whether the streams have changed since they were last listed in summary mode
+        self._listing_changed = True
+        self.streams_changed()
 
-    def start(self):
-        self._repeating_timer.start()
+    def streams_changed(self):
+        """
+        Update the cached streams from the update handlers, this must be called
+        from the thread which adds and removes them
+        """
+        channels = list(self._update_handlers.keys())
+        with self._lock:
+            current_channels = set(channels)
+            for channel in self._stream_fragments.keys() - current_channels:
+                del self._stream_fragments[channel]
+                self._count_stream(channel, -1)
+            for channel in channels:
+                if channel not in self._stream_fragments:
+                    self._stream_fragments[channel] = _stream_json(channel)
+                    self._count_stream(channel, 1)
+            self._status = None
+            self._listing_changed = True
 
-    def report_status(self):
-        status_json = json.dumps(
-            {
-                "streams": [
-                    {
-                        "channel_name": channel.name,
-                        "protocol": channel.protocol.name,
-                        "output_topic": channel.output_topic,
-                        "schema": channel.schema,
-                    }
-                    for channel in self._update_handlers.keys()
-                ]
-            }
-        )
+    def _count_stream(self, channel: Channel, change: int):
+        for counts, key in (
+            (self._streams_per_topic, channel.output_topic),
+            (self._streams_per_schema, channel.schema),
+        ):
+            counts[key] += change
+            if counts[key] <= 0:
+                del counts[key]
+
+    def _serialise(self, status_json: str) -> bytes:
         status_message = serialise_x5f2(
             "Forwarder",
             self._version,
@@ -61,11 +135,75 @@ class StatusReporter:
             self._interval_ms,
             status_json,
         )
-        self._producer.produce(
-            self._topic, bytes(status_message), int(time.time() * 1000)
+        return bytes(status_message)
+
+    def _build_status(self) -> Tuple[str, bytes]:
+        status_json = (
+            self._json_prefix
+            + '"streams": ['
+            + ", ".join(self._stream_fragments.values())
+            + "]}"
         )
+        return status_json, self._serialise(status_json)
+
+    def _build_listing(self) -> List[bytes]:
+        self._listing_version += 1
+        fragments = list(self._stream_fragments.values())
+        chunk_starts = range(0, len(fragments), self._listing_chunk_size) or [0]
+        self._listing_chunks = len(chunk_starts)
+        return [
+            self._serialise(
+                self._json_prefix
+                + f'"listing_version": {self._listing_version}, "chunk": {chunk}, '
+                f'"chunks": {self._listing_chunks}, "streams": ['
+                + ", ".join(fragments[start : start + self._listing_chunk_size])
+                + "]}"
+            )
+            for chunk, start in enumerate(chunk_starts)
+        ]
+
+    def _build_summary(self) -> str:
+        summary = {
+            "stream_count": len(self._stream_fragments),
+            "listing_version": self._listing_version,
+            "listing_chunks": self._listing_chunks,
+            "streams_per_topic": dict(self._streams_per_topic),
+            "streams_per_schema": dict(self._streams_per_schema),
+        }
+        if self._connection_status_tracker is not None:
+            summary[
+                "connection_status"
+            ] = self._connection_status_tracker.connection_counts()
+        return self._json_prefix + json.dumps(summary)[1:]
+
+    def start(self):
+        self._repeating_timer.start()
+
+    def report_status(self):
+        if self._mode == STATUS_MODE_SUMMARY:
+            self._report_summary()
+            return
+        with self._lock:
+            if self._status is None:
+                self._status = self._build_status()
+            status_json, status_message = self._status
+        self._producer.produce(self._topic, status_message, int(time.time() * 1000))
         self._logger.debug(status_json)
 
+    def _report_summary(self):
+        listing: List[bytes] = []
+        with self._lock:
+            if self._listing_changed:
+                listing = self._build_listing()
+                self._listing_changed = False
+            # The summary is built for every report as the connection status changes
+            summary_json = self._build_summary()
+        timestamp_ms = int(time.time() * 1000)
+        for listing_message in listing:
+            self._producer.produce(self._topic, listing_message, timestamp_ms)
+        self._producer.produce(self._topic, self._serialise(summary_json), timestamp_ms)
+        self._logger.debug(summary_json)
+
     def stop(self):
         self._producer.close()
         if self._repeating_timer is not None:
@@ -1,13 +1,19 @@
-from typing import Optional, Tuple, Union
+from typing import TYPE_CHECKING, Optional, Tuple, Union
 
-import p4p
 from caproto import AlarmStatus as CA_AlarmStatus
 from caproto import Message as CA_Message
 from streaming_data_types.alarm_al00 import Severity, serialise_al00
 
-from forwarder.kafka.kafka_helpers import seconds_to_nanoseconds
+from forwarder.update_handlers.decoded_update import (
+    DecodedUpdate,
+    decode_ca_update,
+    decode_pva_update,
+)
 from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
 
+if TYPE_CHECKING:
+    import p4p
+
 
 def _serialise(
     source_name: str,
@@ -22,47 +28,66 @@ def _serialise(
 
 
 class al00_CASerialiser(CASerialiser):
+    __slots__ = ("_source_name", "_severity", "_status")
+
     def __init__(self, source_name: str):
         self._source_name = source_name
-        self._severity: Optional[Severity] = None
-        self._message: Optional[str] = None
+        self._severity: Optional[int] = None
+        self._status: Optional[int] = None
 
     def serialise(
-        self, update: CA_Message, **unused
+        self, update: CA_Message, decoded: Optional[DecodedUpdate] = None, **unused
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
-        timestamp = seconds_to_nanoseconds(update.metadata.timestamp)
-        severity = Severity(update.metadata.severity)
-        message = CA_AlarmStatus(update.metadata.status).name
-        if severity == self._severity and message == self._message:
+        if decoded is None:
+            decoded = decode_ca_update(update)
+        # Compare the raw values first as the alarm state rarely changes
+        severity = decoded.severity
+        status = decoded.status
+        if severity == self._severity and status == self._status:
             # Nothing has changed
             return None, None
         self._severity = severity
-        self._message = message
-        return _serialise(self._source_name, timestamp, severity, message)
+        self._status = status
+        return _serialise(
+            self._source_name,
+            decoded.timestamp_ns,
+            Severity(severity),
+            CA_AlarmStatus(status).name,
+        )
 
     def conn_serialise(self, pv: str, state: str) -> Tuple[None, None]:
         return None, None
 
 
 class al00_PVASerialiser(PVASerialiser):
+    __slots__ = ("_source_name", "_severity", "_message")
+
     def __init__(self, source_name: str):
         self._source_name = source_name
-        self._severity: Optional[Severity] = None
+        self._severity: Optional[int] = None
         self._message: Optional[str] = None
 
     def serialise(
-        self, update: Union[p4p.Value, RuntimeError]
+        self,
+        update: Union["p4p.Value", RuntimeError],
+        decoded: Optional[DecodedUpdate] = None,
+        **unused,
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
         if isinstance(update, RuntimeError):
             return None, None
-        timestamp = (
-            update.timeStamp.secondsPastEpoch * 1_000_000_000
-        ) + update.timeStamp.nanoseconds
-        severity = Severity(update.alarm.severity)
-        message = update.alarm.message
+        if decoded is None:
+            decoded = decode_pva_update(update)
+        # Compare the raw values first as the alarm state rarely changes
+        severity = decoded.severity
+        message = decoded.message
         if severity == self._severity and message == self._message:
             # Nothing has changed
             return None, None
         self._severity = severity
         self._message = message
-        return _serialise(self._source_name, timestamp, severity, message)
+        return _serialise(
+            self._source_name,
+            decoded.timestamp_ns,
+            Severity(severity),
+            message,  # type: ignore
+        )
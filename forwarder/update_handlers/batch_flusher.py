@@ -0,0 +1,95 @@
+import time
+from threading import Condition, Thread
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from forwarder.application_logger import get_logger
+
+if TYPE_CHECKING:
+    from forwarder.update_handlers.serialiser_tracker import SerialiserTracker
+
+logger = get_logger()
+
+
+class _PeriodGroup:
+    __slots__ = ("period_s", "due_s", "trackers")
+
+    def __init__(self, period_s: float):
+        self.period_s = period_s
+        self.due_s = time.monotonic() + period_s
+        self.trackers: Set["SerialiserTracker"] = set()
+
+
+class BatchFlusher:
+    """
+    Flushes the batches of all batching serialisers from one thread, so that
+    batches are still published if their PV stops updating.
+
+    Trackers with the same flush period are flushed together once per period.
+    If flushing takes longer than a period, the missed flushes are skipped.
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._groups: Dict[int, _PeriodGroup] = {}
+        self._thread: Optional[Thread] = None
+        self._stopped = False
+
+    def register(self, tracker: "SerialiserTracker", period_ms: int):
+        with self._condition:
+            if self._stopped:
+                return
+            group = self._groups.get(period_ms)
+            if group is None:
+                group = self._groups[period_ms] = _PeriodGroup(period_ms / 1000)
+            group.trackers.add(tracker)
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self._run, name="batch_flusher", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def unregister(self, tracker: "SerialiserTracker", period_ms: int):
+        with self._condition:
+            group = self._groups.get(period_ms)
+            if group is None:
+                return
+            group.trackers.discard(tracker)
+            if not group.trackers:
+                del self._groups[period_ms]
+
+    def _next_trackers(self) -> Optional[List["SerialiserTracker"]]:
+        """
+        Wait for the next group to be due, and return its trackers
+        """
+        with self._condition:
+            while not self._stopped:
+                if not self._groups:
+                    self._condition.wait()
+                    continue
+                group = min(self._groups.values(), key=lambda group: group.due_s)
+                now_s = time.monotonic()
+                if group.due_s > now_s:
+                    self._condition.wait(group.due_s - now_s)
+                    continue
+                group.due_s += group.period_s
+                if group.due_s < now_s:
+                    group.due_s = now_s + group.period_s
+                return list(group.trackers)
+            return None
+
+    def _run(self):
+        while True:
+            trackers = self._next_trackers()
+            if trackers is None:
+                return
+            for tracker in trackers:
+                # Errors are logged by the tracker
+                tracker.flush_batch()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
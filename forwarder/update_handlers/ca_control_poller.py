@@ -0,0 +1,51 @@
+from threading import Lock
+from typing import TYPE_CHECKING, Set
+
+from forwarder.application_logger import get_logger
+from forwarder.repeat_timer import RepeatTimer, milliseconds_to_seconds
+
+if TYPE_CHECKING:
+    from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
+
+logger = get_logger()
+
+
+class CAControlPoller:
+    """
+    Refreshes the control metadata (units) of CA PVs from one shared timer.
+
+    Used instead of a permanent "control" subscription for every PV, which
+    doubles the CA monitor traffic to watch values that almost never change.
+    The handlers read the metadata once when their PV connects and then again
+    on every refresh, using non-blocking reads.
+    """
+
+    def __init__(self, refresh_period_ms: int):
+        self._lock = Lock()
+        self._handlers: Set["CAUpdateHandler"] = set()
+        self._repeating_timer = RepeatTimer(
+            milliseconds_to_seconds(refresh_period_ms), self.refresh_all
+        )
+        self._repeating_timer.start()
+
+    def register(self, handler: "CAUpdateHandler"):
+        with self._lock:
+            self._handlers.add(handler)
+
+    def unregister(self, handler: "CAUpdateHandler"):
+        with self._lock:
+            self._handlers.discard(handler)
+
+    def refresh_all(self):
+        with self._lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            try:
+                handler.refresh_control()
+            except Exception as e:
+                logger.error(
+                    f"Got error when refreshing CA control metadata. Message was: {str(e)}"
+                )
+
+    def stop(self):
+        self._repeating_timer.cancel()
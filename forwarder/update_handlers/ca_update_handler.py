@@ -1,10 +1,14 @@
-from typing import List
+from typing import List, Optional
 
 from caproto import ReadNotifyResponse
 from caproto.threading.client import PV
 from caproto.threading.client import Context as CAContext
 
 from forwarder.application_logger import get_logger
+from forwarder.recording import ChannelRecorder
+from forwarder.update_handlers.ca_control_poller import CAControlPoller
+from forwarder.update_handlers.connection_status_tracker import PVConnectionStatus
+from forwarder.update_handlers.decoded_update import ValueConversion, decode_ca_update
 from forwarder.update_handlers.serialiser_tracker import SerialiserTracker
 
 
@@ -20,9 +24,17 @@ class CAUpdateHandler:
         context: CAContext,
         pv_name: str,
         serialiser_tracker_list: List[SerialiserTracker],
+        connection_status: Optional[PVConnectionStatus] = None,
+        control_poller: Optional[CAControlPoller] = None,
+        recorder: Optional[ChannelRecorder] = None,
     ):
         self._logger = get_logger()
         self.serialiser_tracker_list: List[SerialiserTracker] = serialiser_tracker_list
+        self._connection_status = connection_status
+        self._control_poller = control_poller
+        self._recorder = recorder
+        self._connected = False
+        self._value_conversion = ValueConversion()
         self._current_unit = None
         self._pv_name = pv_name
 
@@ -33,8 +45,25 @@ class CAUpdateHandler:
         sub = self._pv.subscribe(data_type="time")
         sub.add_callback(self._monitor_callback)
 
-        ctrl_sub = self._pv.subscribe(data_type="control")
-        ctrl_sub.add_callback(self._unit_callback)
+        if control_poller is None:
+            ctrl_sub = self._pv.subscribe(data_type="control")
+            ctrl_sub.add_callback(self._unit_callback)
+        else:
+            # Units are read on connection and refreshed by the shared poller
+            control_poller.register(self)
+
+    def refresh_control(self):
+        """
+        Request the control metadata without blocking, only if connected,
+        as reading a disconnected PV would wait for it to connect
+        """
+        if self._connected:
+            self._pv.read(
+                data_type="control", wait=False, callback=self._control_read_callback
+            )
+
+    def _control_read_callback(self, response: ReadNotifyResponse):
+        self._unit_callback(None, response)
 
     def _unit_callback(self, sub, response: ReadNotifyResponse):
         old_unit = self._current_unit
@@ -49,8 +78,12 @@ class CAUpdateHandler:
 
     def _monitor_callback(self, sub, response: ReadNotifyResponse):
         try:
+            if self._recorder is not None:
+                self._recorder.ca_update(response)
+            # Decode once for all of the trackers
+            decoded = decode_ca_update(response, self._value_conversion)
             for serialiser_tracker in self.serialiser_tracker_list:
-                serialiser_tracker.process_ca_message(response)
+                serialiser_tracker.process_ca_message(response, decoded)
         except (RuntimeError, ValueError) as e:
             self._logger.error(
                 f"Got error when handling CA update. Message was: {str(e)}"
@@ -62,6 +95,15 @@ class CAUpdateHandler:
 
     def _connection_state_callback(self, pv: PV, state: str):
         try:
+            if self._recorder is not None:
+                self._recorder.ca_connection(state)
+            self._connected = state == "connected"
+            # The type of the PV may be different when it reconnects
+            self._value_conversion.reset()
+            if self._connected and self._control_poller is not None:
+                self.refresh_control()
+            if self._connection_status is not None:
+                self._connection_status.ca_state_changed(state)
             for serialiser_tracker in self.serialiser_tracker_list:
                 serialiser_tracker.process_ca_connection(pv, state)
         except (RuntimeError, ValueError) as e:
@@ -79,4 +121,8 @@ class CAUpdateHandler:
         """
         for serialiser in self.serialiser_tracker_list:
             serialiser.stop()
+        if self._control_poller is not None:
+            self._control_poller.unregister(self)
         self._pv.unsubscribe_all()
+        if self._connection_status is not None:
+            self._connection_status.release()
@@ -0,0 +1,193 @@
+import time
+from collections import Counter
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+
+from streaming_data_types.epics_connection_ep01 import ConnectionInfo, serialise_ep01
+
+from forwarder.application_logger import get_logger
+from forwarder.kafka.kafka_helpers import _nanoseconds_to_milliseconds
+from forwarder.kafka.kafka_producer import KafkaProducer
+from forwarder.repeat_timer import RepeatTimer, milliseconds_to_seconds
+
+if TYPE_CHECKING:
+    import p4p
+
+    from forwarder.kafka.partitioning import PVPartitioner
+
+logger = get_logger()
+
+ca_state_to_connection_info: Dict[str, ConnectionInfo] = {
+    "connected": ConnectionInfo.CONNECTED,
+    "disconnected": ConnectionInfo.DISCONNECTED,
+    "destroyed": ConnectionInfo.DESTROYED,
+    "cancelled": ConnectionInfo.CANCELLED,
+    "finished": ConnectionInfo.FINISHED,
+    "remote_error": ConnectionInfo.REMOTE_ERROR,
+}
+
+
+class PVConnectionStatus:
+    """
+    Connection status of one PV forwarded to one topic, shared by all update
+    handlers for that PV and topic
+    """
+
+    __slots__ = (
+        "_tracker",
+        "pv_name",
+        "output_topic",
+        "status",
+        "_users",
+        "_key",
+        "_partitioner",
+    )
+
+    def __init__(
+        self,
+        tracker: "ConnectionStatusTracker",
+        pv_name: str,
+        topic: str,
+        partitioner: Optional["PVPartitioner"] = None,
+    ):
+        self._tracker = tracker
+        self.pv_name = pv_name
+        self.output_topic = topic
+        self.status = ConnectionInfo.NEVER_CONNECTED
+        self._users = 0
+        # Keyed and partitioned like the other messages of the PV
+        self._key = pv_name.encode()
+        self._partitioner = partitioner
+
+    def ca_state_changed(self, state: str):
+        self._tracker.set_status(
+            self,
+            ca_state_to_connection_info.get(state, ConnectionInfo.UNKNOWN),
+            time.time_ns(),
+        )
+
+    def pva_update(self, update: Union["p4p.Value", Exception]):
+        # Imported here as p4p is slow to import, and only needed for PVA channels
+        from forwarder.update_handlers.ep01_serialiser import (
+            pva_update_type_to_connection_info,
+        )
+
+        status = pva_update_type_to_connection_info.get(
+            type(update), ConnectionInfo.UNKNOWN
+        )
+        if (
+            self.status == ConnectionInfo.NEVER_CONNECTED
+            and status != ConnectionInfo.CONNECTED
+        ):
+            return
+        if not isinstance(update, Exception):
+            timestamp_ns = (
+                update.timeStamp.secondsPastEpoch * 1_000_000_000
+                + update.timeStamp.nanoseconds
+            )
+        else:
+            timestamp_ns = time.time_ns()
+        self._tracker.set_status(self, status, timestamp_ns)
+
+    def release(self):
+        self._tracker.unregister(self)
+
+
+class ConnectionStatusTracker:
+    """
+    Publishes ep01 connection status messages for all forwarded PVs, instead of
+    having a dedicated ep01 SerialiserTracker for every channel.
+
+    Only transitions are published. If a periodic update interval is given then
+    the current status of every connected PV is re-published in one batch from
+    a single timer.
+    """
+
+    def __init__(
+        self, producer: KafkaProducer, periodic_update_ms: Optional[int] = None
+    ):
+        self._producer = producer
+        self._lock = Lock()
+        self._statuses: Dict[Tuple[str, str], PVConnectionStatus] = {}
+        self._repeating_timer: Optional[RepeatTimer] = None
+        if periodic_update_ms is not None:
+            self._repeating_timer = RepeatTimer(
+                milliseconds_to_seconds(periodic_update_ms), self.publish_summary
+            )
+            self._repeating_timer.start()
+
+    def register(
+        self,
+        pv_name: str,
+        output_topic: str,
+        partitioner: Optional["PVPartitioner"] = None,
+    ) -> PVConnectionStatus:
+        with self._lock:
+            key = (pv_name, output_topic)
+            if key not in self._statuses:
+                self._statuses[key] = PVConnectionStatus(
+                    self, pv_name, output_topic, partitioner
+                )
+            pv_status = self._statuses[key]
+            pv_status._users += 1
+            return pv_status
+
+    def unregister(self, pv_status: PVConnectionStatus):
+        with self._lock:
+            pv_status._users -= 1
+            if pv_status._users <= 0:
+                self._statuses.pop((pv_status.pv_name, pv_status.output_topic), None)
+
+    def set_status(
+        self, pv_status: PVConnectionStatus, status: ConnectionInfo, timestamp_ns: int
+    ):
+        with self._lock:
+            if status == pv_status.status:
+                # Nothing has changed
+                return
+            pv_status.status = status
+            self._publish(pv_status, timestamp_ns)
+
+    def publish_summary(self):
+        """
+        Publish the current status of every PV which has ever connected
+        """
+        timestamp_ns = time.time_ns()
+        with self._lock:
+            for pv_status in self._statuses.values():
+                if pv_status.status != ConnectionInfo.NEVER_CONNECTED:
+                    self._publish(pv_status, timestamp_ns)
+
+    def connection_counts(self) -> Dict[str, int]:
+        """
+        The number of PVs with each connection status
+        """
+        with self._lock:
+            counts = Counter(
+                pv_status.status.name.lower() for pv_status in self._statuses.values()
+            )
+        return dict(counts)
+
+    def _publish(self, pv_status: PVConnectionStatus, timestamp_ns: int):
+        try:
+            self._producer.produce(
+                pv_status.output_topic,
+                serialise_ep01(
+                    timestamp_ns=timestamp_ns,
+                    status=pv_status.status,
+                    source_name=pv_status.pv_name,
+                ),
+                _nanoseconds_to_milliseconds(timestamp_ns),
+                key=pv_status._key,
+                partition=pv_status._partitioner.next()
+                if pv_status._partitioner is not None
+                else None,
+            )
+        except Exception as e:
+            logger.error(
+                f'Got error when publishing connection status of PV "{pv_status.pv_name}". Message was: {str(e)}'
+            )
+
+    def stop(self):
+        if self._repeating_timer is not None:
+            self._repeating_timer.cancel()
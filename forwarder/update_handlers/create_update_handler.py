@@ -1,26 +1,46 @@
-from typing import Optional, Union
-
-from caproto.threading.client import Context as CAContext
-from p4p.client.thread import Context as PVAContext
+from typing import TYPE_CHECKING, Optional, Union
 
+from forwarder.channel_policy import ChannelPolicies
 from forwarder.common import Channel as ConfigChannel
 from forwarder.common import EpicsProtocol
 from forwarder.kafka.kafka_producer import KafkaProducer
-from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
-from forwarder.update_handlers.fake_update_handler import FakeUpdateHandler
-from forwarder.update_handlers.pva_update_handler import PVAUpdateHandler
+from forwarder.kafka.partitioning import Partitioning
+from forwarder.recording import UpdateRecorder
+from forwarder.update_handlers.batch_flusher import BatchFlusher
+from forwarder.update_handlers.ca_control_poller import CAControlPoller
+from forwarder.update_handlers.connection_status_tracker import ConnectionStatusTracker
+from forwarder.update_handlers.fake_load import FakeLoad
+from forwarder.update_handlers.rate_limiter import RateLimiters
 from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
 
-UpdateHandler = Union[CAUpdateHandler, PVAUpdateHandler, FakeUpdateHandler]
+if TYPE_CHECKING:
+    from caproto.threading.client import Context as CAContext
+    from p4p.client.thread import Context as PVAContext
+
+    from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
+    from forwarder.update_handlers.fake_update_handler import FakeUpdateHandler
+    from forwarder.update_handlers.pva_update_handler import PVAUpdateHandler
+
+# The handlers are imported when the first one for their protocol is created,
+# so that only the EPICS client libraries which are used are loaded
+UpdateHandler = Union["CAUpdateHandler", "PVAUpdateHandler", "FakeUpdateHandler"]
 
 
 def create_update_handler(
     producer: KafkaProducer,
-    ca_context: CAContext,
-    pva_context: PVAContext,
+    ca_context: "CAContext",
+    pva_context: "PVAContext",
     channel: ConfigChannel,
     fake_pv_period_ms: int,
     periodic_update_ms: Optional[int] = None,
+    connection_status_tracker: Optional[ConnectionStatusTracker] = None,
+    ca_control_poller: Optional[CAControlPoller] = None,
+    channel_policies: Optional[ChannelPolicies] = None,
+    rate_limiters: Optional[RateLimiters] = None,
+    partitioning: Optional[Partitioning] = None,
+    recorder: Optional[UpdateRecorder] = None,
+    fake_load: Optional[FakeLoad] = None,
+    batch_flusher: Optional[BatchFlusher] = None,
 ) -> UpdateHandler:
     if not channel.name:
         raise RuntimeError("PV name not specified when adding handler for channel")
@@ -36,6 +56,11 @@ def create_update_handler(
         raise RuntimeError(
             f"Protocol not specified when adding handler for channel {channel.name}"
         )
+    partitioner = (
+        partitioning.partitioner_for(channel.name, channel.schema, channel.output_topic)
+        if partitioning is not None
+        else None
+    )
     serialiser_list = create_serialiser_list(
         producer,
         channel.name,
@@ -43,11 +68,70 @@ def create_update_handler(
         channel.schema,
         channel.protocol,
         periodic_update_ms,
+        include_connection_status=connection_status_tracker is None,
+        channel_filter=channel_policies.filter_for(channel.name, channel.schema)
+        if channel_policies is not None
+        else None,
+        rate_limiter=rate_limiters.limiter_for(
+            channel.name, channel.schema, channel.output_topic
+        )
+        if rate_limiters is not None
+        else None,
+        batch_settings=channel_policies.batching_for(channel.name, channel.schema)
+        if channel_policies is not None
+        else None,
+        partitioner=partitioner,
+        batch_flusher=batch_flusher,
     )
-    if channel.protocol == EpicsProtocol.PVA:
-        return PVAUpdateHandler(pva_context, channel.name, serialiser_list)
-    elif channel.protocol == EpicsProtocol.CA:
-        return CAUpdateHandler(ca_context, channel.name, serialiser_list)
-    elif channel.protocol == EpicsProtocol.FAKE:
-        return FakeUpdateHandler(serialiser_list, channel.schema, fake_pv_period_ms)
-    raise RuntimeError("Unexpected EpicsProtocol in create_update_handler")
+    connection_status = (
+        connection_status_tracker.register(
+            channel.name, channel.output_topic, partitioner
+        )
+        if connection_status_tracker is not None
+        else None
+    )
+    channel_recorder = (
+        recorder.channel(channel)
+        if recorder is not None and channel.protocol != EpicsProtocol.FAKE
+        else None
+    )
+    try:
+        if channel.protocol == EpicsProtocol.PVA:
+            from forwarder.update_handlers.pva_update_handler import PVAUpdateHandler
+
+            return PVAUpdateHandler(
+                pva_context,
+                channel.name,
+                serialiser_list,
+                connection_status,
+                channel_recorder,
+            )
+        elif channel.protocol == EpicsProtocol.CA:
+            from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
+
+            return CAUpdateHandler(
+                ca_context,
+                channel.name,
+                serialiser_list,
+                connection_status,
+                ca_control_poller,
+                channel_recorder,
+            )
+        elif channel.protocol == EpicsProtocol.FAKE:
+            from forwarder.update_handlers.fake_update_handler import FakeUpdateHandler
+
+            return FakeUpdateHandler(
+                serialiser_list,
+                channel.schema,
+                fake_pv_period_ms,
+                connection_status,
+                fake_load,
+                channel_policies.fake_profile_for(channel.name, channel.schema)
+                if channel_policies is not None
+                else None,
+            )
+        raise RuntimeError("Unexpected EpicsProtocol in create_update_handler")
+    except BaseException:
+        if connection_status is not None:
+            connection_status.release()
+        raise
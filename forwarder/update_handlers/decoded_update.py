@@ -0,0 +1,191 @@
+from typing import TYPE_CHECKING, Any, Optional, Tuple, Union
+
+import numpy as np
+from caproto import Message as CA_Message
+
+from forwarder.epics_to_serialisable_types import (
+    numpy_type_from_caproto_type,
+    numpy_type_from_p4p_type,
+)
+from forwarder.kafka.kafka_helpers import seconds_to_nanoseconds
+
+if TYPE_CHECKING:
+    import p4p
+
+_NOT_EXTRACTED = object()
+
+
+def extract_ca_value(update: CA_Message) -> np.ndarray:
+    data_type = numpy_type_from_caproto_type[update.data_type]
+    data = update.data
+    if type(data) is not np.ndarray:
+        data = np.array(data).astype(data_type)
+    else:
+        data = data.astype(np.dtype(data.dtype.str.strip("<>=")))
+    return np.squeeze(data)
+
+
+def extract_pva_value(update: "p4p.Value") -> np.ndarray:
+    if update.getID() == "epics:nt/NTEnum:1.0":
+        return update.value.index
+    data_type = numpy_type_from_p4p_type[_p4p_value_type_code(update)]
+    return np.squeeze(np.array(update.value)).astype(data_type)
+
+
+def _p4p_value_type_code(update: "p4p.Value") -> str:
+    return update.type()["value"][-1]
+
+
+class ValueConversion:
+    """
+    How to convert the values of one PV's updates into numpy arrays.
+
+    The target type is worked out from the first update and reused until the
+    type of the incoming data changes, rather than being looked up again for
+    every update. Arrays which already have the target type are not copied.
+    Each update handler keeps one for its PV, and resets it on reconnection.
+    """
+
+    __slots__ = ("_plan",)
+
+    def __init__(self):
+        # (incoming type, target dtype, whether a conversion is needed),
+        # replaced as a whole so that callbacks on other threads see a consistent plan
+        self._plan: Optional[Tuple[Any, Any, bool]] = None
+
+    def reset(self):
+        self._plan = None
+
+    def ca_value(self, update: CA_Message) -> np.ndarray:
+        data = update.data
+        is_array = type(data) is np.ndarray
+        incoming_type = (update.data_type, data.dtype if is_array else None)
+        plan = self._plan
+        if plan is None or plan[0] != incoming_type:
+            if is_array:
+                # Only the byte order is changed, the same as extract_ca_value
+                target_dtype = data.dtype.newbyteorder("=")
+                plan = (incoming_type, target_dtype, target_dtype != data.dtype)
+            else:
+                plan = (
+                    incoming_type,
+                    numpy_type_from_caproto_type[update.data_type],
+                    True,
+                )
+            self._plan = plan
+        _, target_dtype, convert = plan
+        if not is_array:
+            data = np.array(data).astype(target_dtype)
+        elif convert:
+            data = data.astype(target_dtype)
+        return np.squeeze(data)
+
+    def pva_value(self, update: "p4p.Value", type_id: str) -> np.ndarray:
+        if type_id == "epics:nt/NTEnum:1.0":
+            return update.value.index
+        value = update.value
+        is_array = type(value) is np.ndarray
+        incoming_type = (type_id, value.dtype if is_array else type(value))
+        plan = self._plan
+        if plan is None or plan[0] != incoming_type:
+            target_dtype = np.dtype(
+                numpy_type_from_p4p_type[_p4p_value_type_code(update)]
+            )
+            plan = (
+                incoming_type,
+                target_dtype,
+                not is_array or value.dtype != target_dtype,
+            )
+            self._plan = plan
+        _, target_dtype, convert = plan
+        if not is_array:
+            return np.array(value, dtype=target_dtype)
+        if convert:
+            value = value.astype(target_dtype)
+        return np.squeeze(value)
+
+
+class DecodedUpdate:
+    """
+    The fields of an EPICS update that are used by more than one serialiser.
+
+    An update handler decodes each update once and passes the result to all of
+    its serialisers, so that they do not each look up the same fields again.
+    The value array is only extracted the first time it is asked for, as not
+    every schema needs it (al00 only uses the alarm fields, for example).
+    """
+
+    __slots__ = (
+        "timestamp_ns",
+        "severity",
+        "status",
+        "message",
+        "type_id",
+        "_update",
+        "_value",
+        "_conversion",
+    )
+
+    def __init__(
+        self,
+        update: Union[CA_Message, "p4p.Value"],
+        timestamp_ns: int,
+        severity: int,
+        status: int,
+        message: Optional[str],
+        type_id: Any,
+        conversion: Optional[ValueConversion] = None,
+    ):
+        self._update = update
+        self._conversion = conversion
+        self.timestamp_ns = timestamp_ns
+        self.severity = severity
+        self.status = status
+        self.message = message
+        self.type_id = type_id
+        self._value: Any = _NOT_EXTRACTED
+
+    @property
+    def value(self) -> np.ndarray:
+        if self._value is _NOT_EXTRACTED:
+            if self._conversion is not None:
+                if isinstance(self._update, CA_Message):
+                    self._value = self._conversion.ca_value(self._update)
+                else:
+                    self._value = self._conversion.pva_value(self._update, self.type_id)
+            elif isinstance(self._update, CA_Message):
+                self._value = extract_ca_value(self._update)
+            else:
+                self._value = extract_pva_value(self._update)
+        return self._value
+
+
+def decode_ca_update(
+    update: CA_Message, conversion: Optional[ValueConversion] = None
+) -> DecodedUpdate:
+    metadata = update.metadata
+    return DecodedUpdate(
+        update,
+        seconds_to_nanoseconds(metadata.timestamp),
+        metadata.severity,
+        metadata.status,
+        None,
+        update.data_type,
+        conversion,
+    )
+
+
+def decode_pva_update(
+    update: "p4p.Value", conversion: Optional[ValueConversion] = None
+) -> DecodedUpdate:
+    time_stamp = update.timeStamp
+    alarm = update.alarm
+    return DecodedUpdate(
+        update,
+        time_stamp.secondsPastEpoch * 1_000_000_000 + time_stamp.nanoseconds,
+        alarm.severity,
+        alarm.status,
+        alarm.message,
+        update.getID(),
+        conversion,
+    )
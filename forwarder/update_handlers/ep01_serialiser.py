@@ -7,6 +7,9 @@ from p4p.client.thread import Cancelled, Disconnected, Finished, RemoteError
 from streaming_data_types.epics_connection_ep01 import ConnectionInfo, serialise_ep01
 
 from forwarder.kafka.kafka_helpers import seconds_to_nanoseconds
+from forwarder.update_handlers.connection_status_tracker import (
+    ca_state_to_connection_info,
+)
 from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
 
 
@@ -23,18 +26,21 @@ def _serialise(
     )
 
 
+pva_update_type_to_connection_info: Dict[type, ConnectionInfo] = {
+    p4p.Value: ConnectionInfo.CONNECTED,
+    Cancelled: ConnectionInfo.CANCELLED,
+    Disconnected: ConnectionInfo.DISCONNECTED,
+    RemoteError: ConnectionInfo.REMOTE_ERROR,
+    Finished: ConnectionInfo.FINISHED,
+}
+
+
 class ep01_CASerialiser(CASerialiser):
+    __slots__ = ("_source_name", "_conn_status")
+
     def __init__(self, source_name: str):
         self._source_name = source_name
         self._conn_status: ConnectionInfo = ConnectionInfo.NEVER_CONNECTED
-        self._state_str_to_enum: Dict[str, ConnectionInfo] = {
-            "connected": ConnectionInfo.CONNECTED,
-            "disconnected": ConnectionInfo.DISCONNECTED,
-            "destroyed": ConnectionInfo.DESTROYED,
-            "cancelled": ConnectionInfo.CANCELLED,
-            "finished": ConnectionInfo.FINISHED,
-            "remote_error": ConnectionInfo.REMOTE_ERROR,
-        }
 
     def serialise(
         self, update: CA_Message, **unused
@@ -44,7 +50,9 @@ class ep01_CASerialiser(CASerialiser):
     def conn_serialise(
         self, pv: str, state: str
     ) -> Tuple[Optional[bytes], Optional[int]]:
-        self._conn_status = self._state_str_to_enum.get(state, ConnectionInfo.UNKNOWN)
+        self._conn_status = ca_state_to_connection_info.get(
+            state, ConnectionInfo.UNKNOWN
+        )
         return _serialise(
             self._source_name, self._conn_status, seconds_to_nanoseconds(time.time())
         )
@@ -58,16 +66,11 @@ class ep01_CASerialiser(CASerialiser):
 
 
 class ep01_PVASerialiser(PVASerialiser):
+    __slots__ = ("_source_name", "_conn_status")
+
     def __init__(self, source_name: str):
         self._source_name = source_name
         self._conn_status: ConnectionInfo = ConnectionInfo.NEVER_CONNECTED
-        self._conn_state_map = {
-            p4p.Value: ConnectionInfo.CONNECTED,
-            Cancelled: ConnectionInfo.CANCELLED,
-            Disconnected: ConnectionInfo.DISCONNECTED,
-            RemoteError: ConnectionInfo.REMOTE_ERROR,
-            Finished: ConnectionInfo.FINISHED,
-        }
 
     def serialise(
         self, update: Union[p4p.Value, RuntimeError], **unused
@@ -80,7 +83,9 @@ class ep01_PVASerialiser(PVASerialiser):
                 + update.timeStamp.nanoseconds
             )
 
-        conn_status = self._conn_state_map.get(type(update), ConnectionInfo.UNKNOWN)
+        conn_status = pva_update_type_to_connection_info.get(
+            type(update), ConnectionInfo.UNKNOWN
+        )
 
         if conn_status == self._conn_status:
             # Nothing has changed
@@ -1,33 +1,18 @@
-from typing import Tuple, Union
+from typing import TYPE_CHECKING, Optional, Tuple, Union
 
 import numpy as np
-import p4p
 from caproto import Message as CA_Message
 from streaming_data_types.logdata_f144 import serialise_f144
 
-from forwarder.epics_to_serialisable_types import (
-    numpy_type_from_caproto_type,
-    numpy_type_from_p4p_type,
+from forwarder.update_handlers.decoded_update import (
+    DecodedUpdate,
+    decode_ca_update,
+    decode_pva_update,
 )
-from forwarder.kafka.kafka_helpers import seconds_to_nanoseconds
 from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
 
-
-def _extract_pva_data(update: p4p.Value) -> np.ndarray:
-    if update.getID() == "epics:nt/NTEnum:1.0":
-        return update.value.index
-    data_type = numpy_type_from_p4p_type[update.type()["value"][-1]]
-    return np.squeeze(np.array(update.value)).astype(data_type)
-
-
-def _extract_ca_data(update: CA_Message) -> np.ndarray:
-    data_type = numpy_type_from_caproto_type[update.data_type]
-    data = update.data
-    if type(data) is not np.ndarray:
-        data = np.array(data).astype(data_type)
-    else:
-        data = data.astype(np.dtype(data.dtype.str.strip("<>=")))
-    return np.squeeze(data)
+if TYPE_CHECKING:
+    import p4p
 
 
 def _serialise(
@@ -42,31 +27,36 @@ def _serialise(
 
 
 class f144_CASerialiser(CASerialiser):
+    __slots__ = ("_source_name",)
+
     def __init__(self, source_name: str):
         self._source_name = source_name
 
     def serialise(
-        self, update: CA_Message, **unused
+        self, update: CA_Message, decoded: Optional[DecodedUpdate] = None, **unused
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
-        timestamp = seconds_to_nanoseconds(update.metadata.timestamp)
-        value = _extract_ca_data(update)
-        return _serialise(self._source_name, value, timestamp)
+        if decoded is None:
+            decoded = decode_ca_update(update)
+        return _serialise(self._source_name, decoded.value, decoded.timestamp_ns)
 
     def conn_serialise(self, pv: str, state: str) -> Tuple[None, None]:
         return None, None
 
 
 class f144_PVASerialiser(PVASerialiser):
+    __slots__ = ("_source_name",)
+
     def __init__(self, source_name: str):
         self._source_name = source_name
 
     def serialise(
-        self, update: Union[p4p.Value, RuntimeError]
+        self,
+        update: Union["p4p.Value", RuntimeError],
+        decoded: Optional[DecodedUpdate] = None,
+        **unused,
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
         if isinstance(update, RuntimeError):
             return None, None
-        value = _extract_pva_data(update)
-        timestamp = (
-            update.timeStamp.secondsPastEpoch * 1_000_000_000
-        ) + update.timeStamp.nanoseconds
-        return _serialise(self._source_name, value, timestamp)
+        if decoded is None:
+            decoded = decode_pva_update(update)
+        return _serialise(self._source_name, decoded.value, decoded.timestamp_ns)
@@ -0,0 +1,250 @@
+import heapq
+import math
+import time
+from threading import Condition, Thread
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from forwarder.application_logger import get_logger
+from forwarder.channel_policy import (
+    DISTRIBUTION_NORMAL,
+    DISTRIBUTION_RANDOM_WALK,
+    FAKE_INTEGER_DTYPES,
+    FakeProfile,
+)
+
+if TYPE_CHECKING:
+    from forwarder.update_handlers.fake_update_handler import FakeUpdateHandler
+
+logger = get_logger()
+
+# Shortest time between the batches of a group of fake PVs, a group is split
+# into batches spread over its period so that its updates are not all sent at once
+DEFAULT_RESOLUTION_S = 0.01
+
+
+class _Group:
+    """
+    Fake PVs with the same profile and period
+    """
+
+    __slots__ = ("profile", "period_s", "batches", "size", "closed")
+
+    def __init__(self, profile: FakeProfile, period_s: float, number_of_batches: int):
+        self.profile = profile
+        self.period_s = period_s
+        self.batches = [_Batch(self) for _ in range(number_of_batches)]
+        self.size = 0
+        self.closed = False
+
+
+class _Batch:
+    """
+    Fake PVs of a group which are updated at the same time
+    """
+
+    __slots__ = ("group", "handlers", "walk")
+
+    def __init__(self, group: _Group):
+        self.group = group
+        self.handlers: List["FakeUpdateHandler"] = []
+        # The current values of a random walk, a row per handler
+        self.walk: Optional[np.ndarray] = None
+
+    def add(self, handler: "FakeUpdateHandler"):
+        self.handlers.append(handler)
+        if self.walk is not None:
+            self.walk = np.vstack(
+                [self.walk, np.full((1, self.walk.shape[1]), self.group.profile.mean)]
+            )
+
+    def remove(self, handler: "FakeUpdateHandler"):
+        # Swap with the last handler, so that the rows of the walk stay in step
+        index = self.handlers.index(handler)
+        last = len(self.handlers) - 1
+        self.handlers[index] = self.handlers[last]
+        self.handlers.pop()
+        if self.walk is not None:
+            self.walk[index] = self.walk[last]
+            self.walk = self.walk[:last]
+
+
+def _array_size(profile: FakeProfile) -> int:
+    return profile.array_size if profile.array_size is not None else 1
+
+
+def generate_values(
+    profile: FakeProfile,
+    rng: np.random.Generator,
+    shape: Tuple[int, int],
+    walk: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    A batch of values for several fake PVs, a row per PV. A random walk
+    takes a step from, and updates, walk.
+    """
+    if profile.distribution == DISTRIBUTION_RANDOM_WALK:
+        assert walk is not None
+        walk += rng.normal(0.0, profile.std, shape)
+        values = walk
+    elif profile.distribution == DISTRIBUTION_NORMAL:
+        values = rng.normal(profile.mean, profile.std, shape)
+    elif profile.dtype in FAKE_INTEGER_DTYPES:
+        values = rng.integers(
+            math.ceil(profile.low), math.floor(profile.high), shape, endpoint=True
+        )
+    else:
+        values = rng.uniform(profile.low, profile.high, shape)
+    return values.astype(profile.dtype, copy=False)
+
+
+class FakeLoad:
+    """
+    Generates the updates of all fake PVs from one thread.
+
+    Fake PVs with the same profile and period are grouped, and each group is
+    split into batches which are spread evenly over the period. The values
+    of each batch are generated together with NumPy and then passed to the
+    update handlers in turn.
+
+    If the updates take longer than their period to handle, the batches which
+    were missed are skipped, as with a timer per PV, and counted in
+    missed_batches. A group whose values cannot be generated is logged and
+    no longer updated, without stopping the other groups.
+    """
+
+    def __init__(
+        self,
+        resolution_s: float = DEFAULT_RESOLUTION_S,
+        seed: Optional[int] = None,
+    ):
+        self._resolution_s = resolution_s
+        self._rng = np.random.default_rng(seed)
+        self._condition = Condition()
+        self._groups: Dict[Tuple[FakeProfile, float], _Group] = {}
+        self._handler_batches: Dict["FakeUpdateHandler", _Batch] = {}
+        # Time each batch is next due, with a sequence number to break ties
+        self._schedule: List[Tuple[float, int, _Batch]] = []
+        self._sequence = 0
+        self._thread: Optional[Thread] = None
+        self._stopped = False
+        self.missed_batches = 0
+
+    def _schedule_batch(self, due_s: float, batch: _Batch):
+        heapq.heappush(self._schedule, (due_s, self._sequence, batch))
+        self._sequence += 1
+
+    def _create_group(self, profile: FakeProfile, period_s: float) -> _Group:
+        group = _Group(
+            profile, period_s, max(1, int(round(period_s / self._resolution_s)))
+        )
+        start_s = time.monotonic()
+        spacing_s = period_s / len(group.batches)
+        for index, batch in enumerate(group.batches):
+            self._schedule_batch(start_s + (index + 1) * spacing_s, batch)
+        return group
+
+    def register(
+        self, handler: "FakeUpdateHandler", profile: FakeProfile, period_s: float
+    ):
+        with self._condition:
+            if self._stopped:
+                return
+            key = (profile, period_s)
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = self._create_group(profile, period_s)
+            batch = min(group.batches, key=lambda batch: len(batch.handlers))
+            if profile.distribution == DISTRIBUTION_RANDOM_WALK and batch.walk is None:
+                batch.walk = np.full(
+                    (len(batch.handlers), _array_size(profile)), profile.mean
+                )
+            batch.add(handler)
+            group.size += 1
+            self._handler_batches[handler] = batch
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="fake_load", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def unregister(self, handler: "FakeUpdateHandler"):
+        with self._condition:
+            batch = self._handler_batches.pop(handler, None)
+            if batch is None:
+                return
+            batch.remove(handler)
+            group = batch.group
+            group.size -= 1
+            if group.size == 0:
+                # Its batches are dropped from the schedule when they are next due
+                group.closed = True
+                del self._groups[(group.profile, group.period_s)]
+
+    def _next_batch(self) -> Optional[Tuple[List["FakeUpdateHandler"], np.ndarray]]:
+        """
+        Wait for the next batch to be due, and generate its values
+        """
+        with self._condition:
+            while not self._stopped:
+                if not self._schedule:
+                    self._condition.wait()
+                    continue
+                due_s, _, batch = self._schedule[0]
+                wait_s = due_s - time.monotonic()
+                if wait_s > 0:
+                    self._condition.wait(wait_s)
+                    continue
+                heapq.heappop(self._schedule)
+                group = batch.group
+                if group.closed:
+                    continue
+                next_due_s = due_s + group.period_s
+                now_s = time.monotonic()
+                if next_due_s < now_s:
+                    missed = math.ceil((now_s - next_due_s) / group.period_s)
+                    self.missed_batches += missed
+                    next_due_s += missed * group.period_s
+                self._schedule_batch(next_due_s, batch)
+                if not batch.handlers:
+                    continue
+                handlers = list(batch.handlers)
+                try:
+                    values = generate_values(
+                        group.profile,
+                        self._rng,
+                        (len(handlers), _array_size(group.profile)),
+                        batch.walk,
+                    )
+                except Exception as e:
+                    # Its batches are dropped from the schedule, but it is kept
+                    # so that its handlers can still be unregistered
+                    group.closed = True
+                    logger.error(
+                        f"Stopped updating {group.size} fake PVs as their values could not be generated. The message was: {str(e)}"
+                    )
+                    continue
+                return handlers, values
+            return None
+
+    def _run(self):
+        while True:
+            next_batch = self._next_batch()
+            if next_batch is None:
+                return
+            handlers, values = next_batch
+            timestamp_ns = time.time_ns()
+            for handler, handler_values in zip(handlers, values):
+                try:
+                    handler.publish(handler_values, timestamp_ns)
+                except BaseException as e:
+                    logger.error(
+                        f"Got uncaught exception when publishing fake update. The message was: {str(e)}"
+                    )
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
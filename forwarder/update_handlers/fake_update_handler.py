@@ -1,20 +1,37 @@
-import time
-from random import randint
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
-from numpy.typing import NDArray
+from p4p import Type, Value
 from p4p.nt import NTScalar
 
 from forwarder.application_logger import get_logger
-from forwarder.repeat_timer import RepeatTimer, milliseconds_to_seconds
+from forwarder.channel_policy import FakeProfile
+from forwarder.repeat_timer import milliseconds_to_seconds
+from forwarder.update_handlers.connection_status_tracker import PVConnectionStatus
+from forwarder.update_handlers.decoded_update import ValueConversion, decode_pva_update
+from forwarder.update_handlers.fake_load import FakeLoad
 from forwarder.update_handlers.serialiser_tracker import SerialiserTracker
 
+_P4P_TYPE_CODES = {"int32": "i", "int64": "l", "float32": "f", "float64": "d"}
+# NTScalar types by dtype and whether they hold arrays, shared by all fake PVs
+_nt_types: Dict[Tuple[str, bool], Type] = {}
+
+
+def _nt_type(dtype: str, is_array: bool) -> Type:
+    key = (dtype, is_array)
+    if key not in _nt_types:
+        code = _P4P_TYPE_CODES[dtype]
+        _nt_types[key] = NTScalar(f"a{code}" if is_array else code).type
+    return _nt_types[key]
+
 
 class FakeUpdateHandler:
     """
-    Periodically generate a random integer as a PV value instead of monitoring a real EPICS PV
+    Periodically generate random values as PV updates instead of monitoring a real EPICS PV
     serialises updates in FlatBuffers and passes them onto a Kafka Producer.
+
+    The values of all fake PVs sharing a FakeLoad are generated from its single
+    thread. Without one, the handler creates its own.
     """
 
     def __init__(
@@ -22,28 +39,55 @@ class FakeUpdateHandler:
         serialiser_tracker_list: List[SerialiserTracker],
         schema: str,
         fake_pv_period_ms: int,
+        connection_status: Optional[PVConnectionStatus] = None,
+        fake_load: Optional[FakeLoad] = None,
+        profile: Optional[FakeProfile] = None,
     ):
         self._logger = get_logger()
         self.serialiser_tracker_list: List[SerialiserTracker] = serialiser_tracker_list
+        self._connection_status = connection_status
         self._schema = schema
+        self._value_conversion = ValueConversion()
+        self._stopped = False
 
-        self._repeating_timer = RepeatTimer(
-            milliseconds_to_seconds(fake_pv_period_ms), self._timer_callback
+        if profile is None:
+            profile = FakeProfile()
+        # tdct needs a 1D array as data to send, otherwise 0D (scalar) is fine
+        self._is_array = schema == "tdct" or profile.array_size is not None
+        self._type = _nt_type(profile.dtype, self._is_array)
+        period_s = (
+            1.0 / profile.rate
+            if profile.rate is not None
+            else milliseconds_to_seconds(fake_pv_period_ms)
+        )
+        self._owns_fake_load = fake_load is None
+        self._fake_load = fake_load if fake_load is not None else FakeLoad()
+        self._fake_load.register(self, profile, period_s)
+
+    def publish(self, values: np.ndarray, timestamp_ns: int):
+        """
+        Publish an update with the given values, a row of a batch generated by FakeLoad
+        """
+        if self._stopped:
+            return
+        seconds, nanoseconds = divmod(timestamp_ns, 1_000_000_000)
+        response = Value(
+            self._type,
+            {
+                "value": values if self._is_array else values[0],
+                "timeStamp": {
+                    "secondsPastEpoch": seconds,
+                    "nanoseconds": nanoseconds,
+                },
+            },
         )
-        self._repeating_timer.start()
-
-    def _timer_callback(self):
-        if self._schema == "tdct":
-            # tdct needs a 1D array as data to send
-            data: NDArray[np.int32] = np.array([randint(0, 100)]).astype(np.int32)
-            response = NTScalar("ai").wrap(data)
-        else:
-            # Otherwise 0D (scalar) is fine
-            response = NTScalar("i").wrap(randint(0, 100))
-        response.timeStamp["secondsPastEpoch"] = int(time.time())
         try:
+            if self._connection_status is not None:
+                self._connection_status.pva_update(response)
+            # Decode once for all of the trackers
+            decoded = decode_pva_update(response, self._value_conversion)
             for serialiser_tracker in self.serialiser_tracker_list:
-                serialiser_tracker.process_pva_message(response)
+                serialiser_tracker.process_pva_message(response, decoded)
         except (RuntimeError, ValueError) as e:
             self._logger.error(
                 f"Got error when handling PVA update. Message was: {str(e)}"
@@ -53,6 +97,11 @@ class FakeUpdateHandler:
         """
         Stop periodic updates
         """
+        self._stopped = True
+        self._fake_load.unregister(self)
+        if self._owns_fake_load:
+            self._fake_load.stop()
         for serialiser in self.serialiser_tracker_list:
             serialiser.stop()
-        self._repeating_timer.cancel()
+        if self._connection_status is not None:
+            self._connection_status.release()
@@ -1,12 +1,16 @@
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 
-import p4p
 from caproto import Message as CA_Message
 
 from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
 
+if TYPE_CHECKING:
+    import p4p
+
 
 class no_op_CASerialiser(CASerialiser):
+    __slots__ = ()
+
     def __init__(self, source_name: str):
         pass
 
@@ -18,8 +22,10 @@ class no_op_CASerialiser(CASerialiser):
 
 
 class no_op_PVASerialiser(PVASerialiser):
+    __slots__ = ()
+
     def __init__(self, source_name: str):
         pass
 
-    def serialise(self, update: p4p.Value) -> Tuple[None, None]:
+    def serialise(self, update: "p4p.Value", **unused) -> Tuple[None, None]:
         return None, None
@@ -0,0 +1,45 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import p4p
+
+
+class NTTableColumns:
+    """
+    Finds the "value" and "timestamp" columns of a PV's NTTable updates.
+
+    The table columns are matched to the labels once and the column names are
+    reused until the labels change, and only the two needed columns are read
+    from the update rather than materialising every column with items().
+    """
+
+    __slots__ = ("_labels", "_value_column", "_timestamp_column")
+
+    def __init__(self):
+        self._labels: Optional[List[str]] = None
+        self._value_column = ""
+        self._timestamp_column = ""
+
+    def _find_columns(self, update: p4p.Value, labels: List[str]):
+        if "value" not in labels or "timestamp" not in labels:
+            raise RuntimeError(
+                f'Unable to find required columns ("value", "timestamp") in NTTable. Found the columns {labels} instead.'
+            )
+        column_names = update.value.keys()
+        self._value_column = column_names[labels.index("value")]
+        self._timestamp_column = column_names[labels.index("timestamp")]
+        self._labels = labels
+
+    def extract(self, update: p4p.Value) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the value and timestamp columns of the update
+        """
+        if update.getID() != "epics:nt/NTTable:1.0":
+            raise RuntimeError(
+                f'Unable to process EPICS updates of type: "{update.getID()}".'
+            )
+        labels = update.labels
+        if labels != self._labels:
+            self._find_columns(update, labels)
+        table = update.value
+        return table[self._value_column], table[self._timestamp_column]
@@ -5,35 +5,42 @@ import numpy as np
 import p4p
 from streaming_data_types.sample_environment_senv import serialise_senv
 
+from forwarder.update_handlers.nttable_columns import NTTableColumns
 from forwarder.update_handlers.schema_serialisers import PVASerialiser
 
 
 class nttable_senv_PVASerialiser(PVASerialiser):
+    __slots__ = ("_source_name", "_msg_counter", "_columns", "_rounded_values")
+
     def __init__(self, source_name: str):
         self._source_name = source_name
         self._msg_counter = -1
+        self._columns = NTTableColumns()
+        self._rounded_values: np.ndarray = np.empty(0, dtype=np.int64)
+
+    def _round_to_integers(self, values: np.ndarray) -> np.ndarray:
+        """
+        Rounds into a buffer reused between updates, as the columns of p4p
+        updates are read-only
+        """
+        if values.size > self._rounded_values.size:
+            self._rounded_values = np.empty(
+                max(values.size, 2 * self._rounded_values.size), dtype=np.int64
+            )
+        rounded = self._rounded_values[: values.size]
+        np.rint(values, out=rounded, casting="unsafe")
+        return rounded
 
     def serialise(
         self, update: Union[p4p.Value, RuntimeError], **unused
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
         if isinstance(update, RuntimeError):
             return None, None
-        if update.getID() != "epics:nt/NTTable:1.0":
-            raise RuntimeError(
-                f'Unable to process EPICS updates of type: "{update.getID()}".'
-            )
-        column_headers = update.labels
-        if "value" not in column_headers or "timestamp" not in column_headers:
-            raise RuntimeError(
-                f'Unable to find required columns ("value", "timestamp") in NTTable. Found the columns {column_headers} instead.'
-            )
-        tables = update.value.items()
-        values = tables[column_headers.index("value")][1]
-        if np.issubdtype(values.dtype, np.floating):
-            values = values.round().astype(np.int64)
-        timestamps = tables[column_headers.index("timestamp")][1]
+        values, timestamps = self._columns.extract(update)
         if len(timestamps) == 0:
             return None, None
+        if np.issubdtype(values.dtype, np.floating):
+            values = self._round_to_integers(values)
         self._msg_counter += 1
         origin_timestamp = timestamps[0]
         message_timestamp = datetime.fromtimestamp(origin_timestamp / 1e9)
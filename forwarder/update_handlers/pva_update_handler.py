@@ -1,9 +1,12 @@
-from typing import List, Union
+from typing import List, Optional, Union
 
 from p4p.client.thread import Context as PVAContext
 from p4p.client.thread import Value
 
 from forwarder.application_logger import get_logger
+from forwarder.recording import ChannelRecorder
+from forwarder.update_handlers.connection_status_tracker import PVConnectionStatus
+from forwarder.update_handlers.decoded_update import ValueConversion, decode_pva_update
 from forwarder.update_handlers.serialiser_tracker import SerialiserTracker
 
 
@@ -19,11 +22,16 @@ class PVAUpdateHandler:
         context: PVAContext,
         pv_name: str,
         serialiser_tracker_list: List[SerialiserTracker],
+        connection_status: Optional[PVConnectionStatus] = None,
+        recorder: Optional[ChannelRecorder] = None,
     ):
         self._logger = get_logger()
         self.serialiser_tracker_list: List[SerialiserTracker] = serialiser_tracker_list
+        self._connection_status = connection_status
+        self._recorder = recorder
         self._pv_name = pv_name
         self._unit = None
+        self._value_conversion = ValueConversion()
 
         request = context.makeRequest("field()")
         self._sub = context.monitor(
@@ -44,8 +52,19 @@ class PVAUpdateHandler:
                 f'Display unit of (pva) PV with name "{self._pv_name}" changed from "{old_unit}" to "{self._unit}".'
             )
         try:
+            if self._recorder is not None:
+                self._recorder.pva_update(response)
+            if self._connection_status is not None:
+                self._connection_status.pva_update(response)
+            # Decode once for all of the trackers
+            if isinstance(response, Value):
+                decoded = decode_pva_update(response, self._value_conversion)
+            else:
+                # The type of the PV may be different when it reconnects
+                self._value_conversion.reset()
+                decoded = None
             for serialiser_tracker in self.serialiser_tracker_list:
-                serialiser_tracker.process_pva_message(response)
+                serialiser_tracker.process_pva_message(response, decoded)
         except (RuntimeError, ValueError) as e:
             self._logger.error(
                 f"Got error when handling PVA update. Message was: {str(e)}"
@@ -62,3 +81,5 @@ class PVAUpdateHandler:
         for serialiser in self.serialiser_tracker_list:
             serialiser.stop()
         self._sub.close()
+        if self._connection_status is not None:
+            self._connection_status.release()
@@ -0,0 +1,230 @@
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional, Set, Tuple, Union
+
+from forwarder.application_logger import get_logger
+from forwarder.channel_policy import OVERFLOW_KEEP_LATEST, ChannelPolicies, RateLimit
+from forwarder.repeat_timer import RepeatTimer, milliseconds_to_seconds
+from forwarder.utils import Counter
+
+logger = get_logger()
+
+# How often updates held back by "keep_latest" limits are retried
+KEEP_LATEST_FLUSH_PERIOD_MS = 100
+
+
+class TokenBucket:
+    __slots__ = ("_rate", "_capacity", "_tokens", "_last_refill_s", "_lock")
+
+    def __init__(self, rate_limit: RateLimit):
+        self._rate = rate_limit.max_rate
+        self._capacity = rate_limit.capacity
+        self._tokens = self._capacity
+        self._last_refill_s = time.monotonic()
+        self._lock = Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now_s = time.monotonic()
+            self._tokens = min(
+                self._capacity,
+                self._tokens + (now_s - self._last_refill_s) * self._rate,
+            )
+            self._last_refill_s = now_s
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    def refund(self):
+        with self._lock:
+            self._tokens = min(self._capacity, self._tokens + 1.0)
+
+
+class ChannelRateLimiter:
+    """
+    Applies the rate limit of one channel, and of its output topic, to the
+    updates of a SerialiserTracker
+    """
+
+    __slots__ = (
+        "_channel_bucket",
+        "_topic_bucket",
+        "_keep_latest",
+        "_rate_limiters",
+        "_pending",
+        "_lock",
+        "_publish",
+        "throttled_count",
+    )
+
+    def __init__(
+        self,
+        rate_limiters: "RateLimiters",
+        channel_bucket: Optional[TokenBucket],
+        topic_bucket: Optional[TokenBucket],
+        keep_latest: bool,
+    ):
+        self._rate_limiters = rate_limiters
+        self._channel_bucket = channel_bucket
+        self._topic_bucket = topic_bucket
+        self._keep_latest = keep_latest
+        self._pending: Optional[
+            Tuple[bytes, Union[int, float], Optional[Callable[[], None]]]
+        ] = None
+        self._lock = Lock()
+        self._publish: Optional[Callable[[bytes, Union[int, float]], bool]] = None
+        self.throttled_count = 0
+
+    def set_publisher(self, publish: Callable[[bytes, Union[int, float]], bool]):
+        """
+        Set the function used to publish updates held back by a "keep_latest" limit
+        """
+        self._publish = publish
+
+    def _try_acquire(self) -> bool:
+        if self._channel_bucket is not None and not self._channel_bucket.try_acquire():
+            return False
+        if self._topic_bucket is not None and not self._topic_bucket.try_acquire():
+            if self._channel_bucket is not None:
+                self._channel_bucket.refund()
+            return False
+        return True
+
+    def allow(
+        self,
+        message: bytes,
+        timestamp_ns: Union[int, float],
+        on_published: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """
+        Returns whether the update can be published now, otherwise it is counted
+        as throttled and kept for later if the overflow policy is "keep_latest".
+        on_published is called if an update kept for later is published.
+        """
+        with self._lock:
+            if self._try_acquire():
+                # Anything held back is older than this update, so is superseded by it
+                self._pending = None
+                return True
+            self.throttled_count += 1
+            if self._keep_latest:
+                self._pending = (message, timestamp_ns, on_published)
+        self._rate_limiters.throttled(self if self._keep_latest else None)
+        return False
+
+    def flush(self) -> bool:
+        """
+        Publish the held back update if the limit allows,
+        returns whether there is still an update waiting
+        """
+        with self._lock:
+            if self._pending is None:
+                return False
+            if not self._try_acquire():
+                return True
+            message, timestamp_ns, on_published = self._pending
+            self._pending = None
+            # Published while holding the lock, which a newer update needs to be
+            # allowed, so the held back update cannot be published after it
+            if (
+                self._publish is not None
+                and self._publish(message, timestamp_ns)
+                and on_published is not None
+            ):
+                on_published()
+        return False
+
+    @property
+    def has_pending(self) -> bool:
+        return self._pending is not None
+
+    def release(self):
+        with self._lock:
+            self._pending = None
+        self._rate_limiters.forget(self)
+
+
+class RateLimiters:
+    """
+    Creates the rate limiters for channels from the channel policies, sharing
+    one token bucket between all channels forwarded to a topic with a limit.
+
+    Every throttled update is counted, and the updates held back by
+    "keep_latest" limits are retried from a single timer.
+    """
+
+    def __init__(
+        self,
+        channel_policies: ChannelPolicies,
+        throttled_counter: Optional[Counter] = None,
+        flush_period_ms: int = KEEP_LATEST_FLUSH_PERIOD_MS,
+    ):
+        self._channel_policies = channel_policies
+        self._throttled_counter = throttled_counter
+        self._lock = Lock()
+        self._topic_buckets: Dict[str, Optional[TokenBucket]] = {}
+        self._waiting: Set[ChannelRateLimiter] = set()
+        self._repeating_timer = RepeatTimer(
+            milliseconds_to_seconds(flush_period_ms), self.flush
+        )
+        self._repeating_timer.start()
+
+    def limiter_for(
+        self, pv_name: str, schema: str, output_topic: str
+    ) -> Optional[ChannelRateLimiter]:
+        rate_limit = self._channel_policies.rate_limit_for(pv_name, schema)
+        topic_bucket = self._topic_bucket(output_topic)
+        if rate_limit is None and topic_bucket is None:
+            return None
+        topic_rate_limit = self._channel_policies.topic_rate_limit_for(output_topic)
+        keep_latest = any(
+            limit is not None and limit.overflow == OVERFLOW_KEEP_LATEST
+            for limit in (rate_limit, topic_rate_limit)
+        )
+        return ChannelRateLimiter(
+            self,
+            TokenBucket(rate_limit) if rate_limit is not None else None,
+            topic_bucket,
+            keep_latest,
+        )
+
+    def _topic_bucket(self, output_topic: str) -> Optional[TokenBucket]:
+        with self._lock:
+            if output_topic not in self._topic_buckets:
+                rate_limit = self._channel_policies.topic_rate_limit_for(output_topic)
+                self._topic_buckets[output_topic] = (
+                    TokenBucket(rate_limit) if rate_limit is not None else None
+                )
+            return self._topic_buckets[output_topic]
+
+    def throttled(self, waiting: Optional[ChannelRateLimiter]):
+        if self._throttled_counter is not None:
+            self._throttled_counter.increment()
+        if waiting is not None:
+            with self._lock:
+                self._waiting.add(waiting)
+
+    def forget(self, limiter: ChannelRateLimiter):
+        with self._lock:
+            self._waiting.discard(limiter)
+
+    def flush(self):
+        with self._lock:
+            waiting = list(self._waiting)
+        for limiter in waiting:
+            try:
+                still_waiting = limiter.flush()
+            except Exception as e:
+                still_waiting = False
+                logger.error(
+                    f"Got error when publishing rate limited update. Message was: {str(e)}"
+                )
+            if not still_waiting:
+                with self._lock:
+                    # Unless it was throttled again while being flushed
+                    if not limiter.has_pending:
+                        self._waiting.discard(limiter)
+
+    def stop(self):
+        self._repeating_timer.cancel()
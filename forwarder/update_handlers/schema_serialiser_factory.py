@@ -1,72 +1,73 @@
-from typing import Callable, Dict, Iterable, Union
+from importlib import import_module
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Tuple, Union
 
 from forwarder.common import EpicsProtocol
-from forwarder.update_handlers.al00_serialiser import (
-    al00_CASerialiser,
-    al00_PVASerialiser,
-)
-from forwarder.update_handlers.ep01_serialiser import (
-    ep01_CASerialiser,
-    ep01_PVASerialiser,
-)
-from forwarder.update_handlers.f142_serialiser import (
-    f142_CASerialiser,
-    f142_PVASerialiser,
-)
-from forwarder.update_handlers.f144_serialiser import (
-    f144_CASerialiser,
-    f144_PVASerialiser,
-)
-from forwarder.update_handlers.no_op_serialiser import (
-    no_op_CASerialiser,
-    no_op_PVASerialiser,
-)
-from forwarder.update_handlers.nttable_se00_serialiser import nttable_se00_PVASerialiser
-from forwarder.update_handlers.nttable_senv_serialiser import nttable_senv_PVASerialiser
-from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
-from forwarder.update_handlers.tdct_serialiser import (
-    tdct_CASerialiser,
-    tdct_PVASerialiser,
-)
+
+if TYPE_CHECKING:
+    from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
+
+_PACKAGE = "forwarder.update_handlers"
 
 
 class SerialiserFactory:
-    _schema_serialisers: Dict[EpicsProtocol, Dict[str, Callable]] = {
+    """
+    Serialisers are registered by module and class name, and each module is
+    only imported when the first serialiser for its schema is created, so
+    that the forwarder starts without loading schemas which are not used.
+    """
+
+    _schema_serialisers: Dict[EpicsProtocol, Dict[str, Tuple[str, str]]] = {
         EpicsProtocol.CA: {
-            "al00": al00_CASerialiser,
-            "ep01": ep01_CASerialiser,
-            "f142": f142_CASerialiser,
-            "f144": f144_CASerialiser,
-            "no_op": no_op_CASerialiser,
-            "tdct": tdct_CASerialiser,
+            "al00": ("al00_serialiser", "al00_CASerialiser"),
+            "ep01": ("ep01_serialiser", "ep01_CASerialiser"),
+            "f142": ("f142_serialiser", "f142_CASerialiser"),
+            "f144": ("f144_serialiser", "f144_CASerialiser"),
+            "no_op": ("no_op_serialiser", "no_op_CASerialiser"),
+            "se00": ("se00_serialiser", "se00_CASerialiser"),
+            "tdct": ("tdct_serialiser", "tdct_CASerialiser"),
         },
         EpicsProtocol.FAKE: {
-            "al00": al00_PVASerialiser,
-            "ep01": ep01_PVASerialiser,
-            "f142": f142_PVASerialiser,
-            "f144": f144_PVASerialiser,
-            "no_op": no_op_PVASerialiser,
-            "nttable_se00": nttable_se00_PVASerialiser,
-            "nttable_senv": nttable_senv_PVASerialiser,
-            "tdct": tdct_PVASerialiser,
+            "al00": ("al00_serialiser", "al00_PVASerialiser"),
+            "ep01": ("ep01_serialiser", "ep01_PVASerialiser"),
+            "f142": ("f142_serialiser", "f142_PVASerialiser"),
+            "f144": ("f144_serialiser", "f144_PVASerialiser"),
+            "no_op": ("no_op_serialiser", "no_op_PVASerialiser"),
+            "nttable_se00": ("nttable_se00_serialiser", "nttable_se00_PVASerialiser"),
+            "nttable_senv": ("nttable_senv_serialiser", "nttable_senv_PVASerialiser"),
+            "se00": ("se00_serialiser", "se00_PVASerialiser"),
+            "tdct": ("tdct_serialiser", "tdct_PVASerialiser"),
         },
         EpicsProtocol.PVA: {
-            "al00": al00_PVASerialiser,
-            "ep01": ep01_PVASerialiser,
-            "f142": f142_PVASerialiser,
-            "f144": f144_PVASerialiser,
-            "no_op": no_op_PVASerialiser,
-            "nttable_se00": nttable_se00_PVASerialiser,
-            "nttable_senv": nttable_senv_PVASerialiser,
-            "tdct": tdct_PVASerialiser,
+            "al00": ("al00_serialiser", "al00_PVASerialiser"),
+            "ep01": ("ep01_serialiser", "ep01_PVASerialiser"),
+            "f142": ("f142_serialiser", "f142_PVASerialiser"),
+            "f144": ("f144_serialiser", "f144_PVASerialiser"),
+            "no_op": ("no_op_serialiser", "no_op_PVASerialiser"),
+            "nttable_se00": ("nttable_se00_serialiser", "nttable_se00_PVASerialiser"),
+            "nttable_senv": ("nttable_senv_serialiser", "nttable_senv_PVASerialiser"),
+            "se00": ("se00_serialiser", "se00_PVASerialiser"),
+            "tdct": ("tdct_serialiser", "tdct_PVASerialiser"),
         },
     }
+    _resolved: Dict[Tuple[EpicsProtocol, str], Callable] = {}
+
+    @classmethod
+    def get_serialiser_class(cls, protocol: EpicsProtocol, schema: str) -> Callable:
+        key = (protocol, schema)
+        serialiser_class = cls._resolved.get(key)
+        if serialiser_class is None:
+            module_name, class_name = cls._schema_serialisers[protocol][schema]
+            serialiser_class = getattr(
+                import_module(f"{_PACKAGE}.{module_name}"), class_name
+            )
+            cls._resolved[key] = serialiser_class
+        return serialiser_class
 
     @classmethod
     def create_serialiser(
-        cls, protocol: EpicsProtocol, schema: str, source_name: str
-    ) -> Union[CASerialiser, PVASerialiser]:
-        return cls._schema_serialisers[protocol][schema](source_name)
+        cls, protocol: EpicsProtocol, schema: str, source_name: str, **options
+    ) -> Union["CASerialiser", "PVASerialiser"]:
+        return cls.get_serialiser_class(protocol, schema)(source_name, **options)
 
     @classmethod
     def get_protocols(cls) -> Iterable[EpicsProtocol]:
@@ -1,11 +1,16 @@
 from abc import abstractmethod
-from typing import Optional, Protocol, Tuple, Union
+from typing import TYPE_CHECKING, Optional, Protocol, Tuple, Union, runtime_checkable
 
 from caproto import Message as CA_Message
-from p4p import Value
+
+if TYPE_CHECKING:
+    from p4p import Value
 
 
 class CASerialiser(Protocol):
+    # Serialisers exist for every forwarded PV, so subclasses use __slots__ to keep them small
+    __slots__ = ()
+
     @abstractmethod
     def serialise(
         self, update: CA_Message, **unused
@@ -20,8 +25,24 @@ class CASerialiser(Protocol):
 
 
 class PVASerialiser(Protocol):
+    __slots__ = ()
+
     @abstractmethod
     def serialise(
-        self, update: Union[Value, RuntimeError]
+        self, update: Union["Value", RuntimeError], **unused
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
         raise NotImplementedError
+
+
+@runtime_checkable
+class BatchingSerialiser(Protocol):
+    """
+    A serialiser which accumulates updates into one message, so has to be
+    flushed periodically in case no further updates arrive
+    """
+
+    flush_period_ms: int
+
+    @abstractmethod
+    def flush(self, force: bool = False) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        raise NotImplementedError
@@ -0,0 +1,176 @@
+import time
+from threading import Lock
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+import numpy as np
+from caproto import Message as CA_Message
+from streaming_data_types.array_1d_se00 import numpy_type_map, serialise_se00
+
+from forwarder.update_handlers.decoded_update import (
+    DecodedUpdate,
+    decode_ca_update,
+    decode_pva_update,
+)
+from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
+
+if TYPE_CHECKING:
+    import p4p
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_PERIOD_MS = 100
+
+
+class _SampleBatch:
+    """
+    Accumulates scalar samples and their timestamps in preallocated buffers
+    and serialises them as one se00 message when the batch is full or older
+    than the batch period
+    """
+
+    __slots__ = (
+        "_source_name",
+        "_batch_size",
+        "_batch_period_ns",
+        "_values",
+        "_timestamps",
+        "_length",
+        "_started_ns",
+        "_msg_counter",
+        "_lock",
+    )
+
+    def __init__(self, source_name: str, batch_size: int, batch_period_ms: int):
+        self._source_name = source_name
+        self._batch_size = batch_size
+        self._batch_period_ns = batch_period_ms * 1_000_000
+        # Allocated with the dtype of the first sample
+        self._values: Optional[np.ndarray] = None
+        self._timestamps: np.ndarray = np.empty(batch_size, dtype=np.uint64)
+        self._length = 0
+        self._started_ns = 0
+        self._msg_counter = -1
+        self._lock = Lock()
+
+    def add(
+        self, value: np.ndarray, timestamp_ns: int
+    ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        if value.size != 1:
+            raise RuntimeError(
+                f"Unable to batch updates from {self._source_name} as se00 batching only supports scalar PVs"
+            )
+        if value.dtype not in numpy_type_map:
+            raise RuntimeError(
+                f"Unable to batch updates from {self._source_name} as se00 does not support the {value.dtype} type"
+            )
+        with self._lock:
+            if self._values is not None and self._values.dtype != value.dtype:
+                # The type of the PV changed, so send what was batched with the old type
+                message = self._serialise()
+                self._values = None
+                self._append(value, timestamp_ns)
+                return message
+            self._append(value, timestamp_ns)
+            if (
+                self._length == self._batch_size
+                or time.monotonic_ns() - self._started_ns >= self._batch_period_ns
+            ):
+                return self._serialise()
+            return None, None
+
+    def _append(self, value: np.ndarray, timestamp_ns: int):
+        if self._values is None:
+            self._values = np.empty(self._batch_size, dtype=value.dtype)
+        if self._length == 0:
+            self._started_ns = time.monotonic_ns()
+        self._values[self._length] = value.reshape(())
+        self._timestamps[self._length] = timestamp_ns
+        self._length += 1
+
+    def flush(self, force: bool = False) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        with self._lock:
+            if self._length == 0 or (
+                not force
+                and time.monotonic_ns() - self._started_ns < self._batch_period_ns
+            ):
+                return None, None
+            return self._serialise()
+
+    def _serialise(self) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        length = self._length
+        if length == 0 or self._values is None:
+            return None, None
+        self._length = 0
+        self._msg_counter += 1
+        timestamps = self._timestamps[:length]
+        origin_timestamp = int(timestamps[0])
+        delta_time = (
+            int((int(timestamps[-1]) - origin_timestamp) // (length - 1))
+            if length > 1
+            else 0
+        )
+        return (
+            serialise_se00(
+                name=self._source_name,
+                channel=0,
+                timestamp_unix_ns=origin_timestamp,
+                sample_ts_delta=delta_time,
+                message_counter=self._msg_counter,
+                values=self._values[:length],
+                value_timestamps=timestamps,
+            ),
+            origin_timestamp,
+        )
+
+
+class se00_CASerialiser(CASerialiser):
+    __slots__ = ("_batch", "flush_period_ms")
+
+    def __init__(
+        self,
+        source_name: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        batch_period_ms: int = DEFAULT_BATCH_PERIOD_MS,
+    ):
+        self._batch = _SampleBatch(source_name, batch_size, batch_period_ms)
+        self.flush_period_ms = batch_period_ms
+
+    def serialise(
+        self, update: CA_Message, decoded: Optional[DecodedUpdate] = None, **unused
+    ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        if decoded is None:
+            decoded = decode_ca_update(update)
+        return self._batch.add(np.asarray(decoded.value), decoded.timestamp_ns)
+
+    def flush(self, force: bool = False) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        return self._batch.flush(force)
+
+    def conn_serialise(self, pv: str, state: str) -> Tuple[None, None]:
+        return None, None
+
+
+class se00_PVASerialiser(PVASerialiser):
+    __slots__ = ("_batch", "flush_period_ms")
+
+    def __init__(
+        self,
+        source_name: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        batch_period_ms: int = DEFAULT_BATCH_PERIOD_MS,
+    ):
+        self._batch = _SampleBatch(source_name, batch_size, batch_period_ms)
+        self.flush_period_ms = batch_period_ms
+
+    def serialise(
+        self,
+        update: Union["p4p.Value", RuntimeError],
+        decoded: Optional[DecodedUpdate] = None,
+        **unused,
+    ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        if isinstance(update, RuntimeError):
+            return None, None
+        if decoded is None:
+            decoded = decode_pva_update(update)
+        return self._batch.add(np.asarray(decoded.value), decoded.timestamp_ns)
+
+    def flush(self, force: bool = False) -> Union[Tuple[bytes, int], Tuple[None, None]]:
+        return self._batch.flush(force)
@@ -1,33 +1,105 @@
 import time
 from datetime import datetime, timedelta, timezone
 from threading import Lock
-from typing import List, Optional, Union
+from typing import TYPE_CHECKING, Callable, List, Optional, Union
 
 from caproto import ReadNotifyResponse
-from caproto.threading.client import PV
 from confluent_kafka.error import (
     KafkaException,
     KeySerializationError,
     ValueSerializationError,
 )
-from p4p.client.thread import Value
 
 from forwarder.application_logger import get_logger
+from forwarder.channel_policy import BatchSettings, ChannelFilter
 from forwarder.common import EpicsProtocol
 from forwarder.kafka.kafka_helpers import (
     _nanoseconds_to_milliseconds,
     seconds_to_nanoseconds,
 )
 from forwarder.kafka.kafka_producer import KafkaProducer
+from forwarder.kafka.partitioning import PVPartitioner
 from forwarder.repeat_timer import RepeatTimer, milliseconds_to_seconds
+from forwarder.update_handlers.batch_flusher import BatchFlusher
+from forwarder.update_handlers.decoded_update import (
+    DecodedUpdate,
+    decode_ca_update,
+    decode_pva_update,
+)
+from forwarder.update_handlers.rate_limiter import ChannelRateLimiter
 from forwarder.update_handlers.schema_serialiser_factory import SerialiserFactory
+from forwarder.update_handlers.schema_serialisers import BatchingSerialiser
+from forwarder.update_handlers.update_filter import UpdateFilter
+
+if TYPE_CHECKING:
+    from caproto.threading.client import PV
+    from p4p.client.thread import Value
 
 LOWER_AGE_LIMIT = timedelta(days=365.25)
 UPPER_AGE_LIMIT = timedelta(minutes=10)
+_LOWER_AGE_LIMIT_NS = int(LOWER_AGE_LIMIT.total_seconds() * 1_000_000_000)
+_UPPER_AGE_LIMIT_NS = int(UPPER_AGE_LIMIT.total_seconds() * 1_000_000_000)
 SCHEMAS_THAT_DO_NOT_REQUIRE_ATTACHED_ALARM = ["f142"]
+# Schemas which forward a single value or array per update, so can be filtered by value
+SCHEMAS_THAT_SUPPORT_FILTERING = ["f142", "f144"]
+# Schemas which batch several updates into one message
+SCHEMAS_THAT_SUPPORT_BATCHING = ["se00"]
+
+logger = get_logger()
+
+
+def _ns_to_datetime(timestamp_ns: Union[int, float]) -> datetime:
+    return datetime.fromtimestamp(timestamp_ns / 1e9, tz=timezone.utc)
 
 
 class SerialiserTracker:
+    """
+    Passes EPICS updates to a serialiser and publishes the results.
+
+    If an alarm serialiser is given it is run on each update in the same pass,
+    with its messages checked and cached separately from those of the main
+    serialiser.
+
+    If an update filter is given, updates it rejects are not passed to the main
+    serialiser. Alarms are still evaluated and periodic updates still publish
+    the last forwarded value. Later updates are only compared against updates
+    which were published.
+
+    If a rate limiter is given, the main serialiser's messages are only
+    published when it allows.
+
+    If the main serialiser batches updates it is flushed by a BatchFlusher,
+    shared between trackers if one is given, so that batches are still
+    published if the PV stops updating. Batches are not republished by
+    periodic updates, as that would send their samples again. Messages of the
+    main serialiser are created and published under one lock, so that a batch
+    flushed in the background is never published out of order with one
+    completed by an update.
+    """
+
+    # There are trackers for every forwarded PV, so they only hold what they need in __slots__
+    __slots__ = (
+        "serialiser",
+        "alarm_serialiser",
+        "_producer",
+        "_pv_name",
+        "_key",
+        "_partitioner",
+        "_output_topic",
+        "_last_timestamp_ns",
+        "_last_alarm_timestamp_ns",
+        "_repeating_timer",
+        "_cached_update",
+        "_cached_alarm_update",
+        "_cached_timestamp",
+        "_cache_lock",
+        "_publish_lock",
+        "_update_filter",
+        "_rate_limiter",
+        "_batch_flusher",
+        "_owns_batch_flusher",
+    )
+
     def __init__(
         self,
         serialiser,
@@ -35,24 +107,65 @@ class SerialiserTracker:
         pv_name: str,
         output_topic: str,
         periodic_update_ms: Optional[int] = None,
+        alarm_serialiser=None,
+        update_filter: Optional[UpdateFilter] = None,
+        rate_limiter: Optional[ChannelRateLimiter] = None,
+        partitioner: Optional[PVPartitioner] = None,
+        batch_flusher: Optional[BatchFlusher] = None,
     ):
         self.serialiser = serialiser
-        self._logger = get_logger()
+        self.alarm_serialiser = alarm_serialiser
+        self._update_filter = update_filter
+        self._rate_limiter = rate_limiter
+        if rate_limiter is not None:
+            rate_limiter.set_publisher(self._publish_and_cache)
         self._producer = producer
         self._pv_name = pv_name
+        # Encoded once rather than by the producer for every message
+        self._key = pv_name.encode()
+        self._partitioner = partitioner
         self._output_topic = output_topic
-        self._last_timestamp = datetime(
-            year=1900, month=1, day=1, hour=0, minute=0, second=0, tzinfo=timezone.utc
-        )
+        self._last_timestamp_ns: Union[int, float] = 0
+        self._last_alarm_timestamp_ns: Union[int, float] = 0
+        self._cached_update: Optional[bytes] = None
+        self._cached_alarm_update: Optional[bytes] = None
+        self._cached_timestamp: Union[int, float] = 0
+        self._cache_lock = Lock()
+        self._publish_lock = Lock()
         self._repeating_timer: Optional[RepeatTimer] = None
         if periodic_update_ms is not None:
             self._repeating_timer = RepeatTimer(
                 milliseconds_to_seconds(periodic_update_ms), self._publish_cached_update
             )
             self._repeating_timer.start()
-        self._cached_update: Optional[bytes] = None
-        self._cached_timestamp: Union[int, float] = 0
-        self._cache_lock = Lock()
+        self._batch_flusher: Optional[BatchFlusher] = None
+        self._owns_batch_flusher = False
+        if isinstance(serialiser, BatchingSerialiser):
+            if batch_flusher is None:
+                batch_flusher = BatchFlusher()
+                self._owns_batch_flusher = True
+            self._batch_flusher = batch_flusher
+            batch_flusher.register(self, serialiser.flush_period_ms)
+
+    def flush_batch(self, force: bool = False):
+        try:
+            with self._publish_lock:
+                new_message, new_timestamp = self.serialiser.flush(force)
+                if new_message is not None:
+                    self.set_new_message(new_message, new_timestamp)
+        except (
+            KafkaException,
+            ValueSerializationError,
+            KeySerializationError,
+            BufferError,
+        ) as e:
+            logger.error(
+                f"Got kafka error when publishing batched update. Message was: {str(e)}"
+            )
+        except BaseException as e:
+            exception_string = f"Got uncaught exception in SerialiserTracker.flush_batch. The message was: {str(e)}"
+            logger.error(exception_string)
+            logger.exception(e)
 
     def _publish_cached_update(self):
         try:
@@ -61,77 +174,185 @@ class SerialiserTracker:
                     self.publish_message(
                         self._cached_update, seconds_to_nanoseconds(time.time())
                     )
+                if self._cached_alarm_update is not None:
+                    self.publish_message(
+                        self._cached_alarm_update, seconds_to_nanoseconds(time.time())
+                    )
         except (
             KafkaException,
             ValueSerializationError,
             KeySerializationError,
             BufferError,
         ) as e:
-            self._logger.error(
+            logger.error(
                 f"Got kafka error when publishing cached update. Message was: {str(e)}"
             )
         except BaseException as e:
             exception_string = f"Got uncaught exception in SerialiserTracker._publish_cached_update. The message was: {str(e)}"
-            self._logger.error(exception_string)
-            self._logger.exception(e)
-
-    def process_pva_message(self, response: Union[Value, Exception]):
-        new_message, new_timestamp = self.serialiser.serialise(response)
-        if new_message is not None:
-            self.set_new_message(new_message, new_timestamp)
-
-    def process_ca_message(self, response: ReadNotifyResponse):
-        new_message, new_timestamp = self.serialiser.serialise(response)
-        if new_message is not None:
-            self.set_new_message(new_message, new_timestamp)
-
-    def process_ca_connection(self, pv: PV, state: str):
-        (
-            new_message,
-            new_timestamp,
-        ) = self.serialiser.conn_serialise(pv, state)
-        if new_message is not None:
-            self.set_new_message(new_message, new_timestamp)
-
-    def set_new_message(self, message: bytes, timestamp_ns: Union[int, float]):
-        if message is None:
-            return
-        message_datetime = datetime.fromtimestamp(timestamp_ns / 1e9, tz=timezone.utc)
-        if message_datetime < self._last_timestamp:
-            self._logger.error(
-                f"Rejecting update on {self._pv_name} as its timestamp is older than the previous message timestamp from that PV ({message_datetime} vs {self._last_timestamp})."
+            logger.error(exception_string)
+            logger.exception(e)
+
+    def process_pva_message(
+        self,
+        response: Union["Value", Exception],
+        decoded: Optional[DecodedUpdate] = None,
+    ):
+        if decoded is None and not isinstance(response, Exception):
+            decoded = decode_pva_update(response)
+        if decoded is None:
+            # Disconnected, so forward the first value after reconnecting
+            if self._update_filter is not None:
+                self._update_filter.reset()
+            with self._publish_lock:
+                new_message, new_timestamp = self.serialiser.serialise(response)
+                if new_message is not None:
+                    self.set_new_message(new_message, new_timestamp)
+        elif self._update_filter is None or self._update_filter.check(decoded):
+            with self._publish_lock:
+                new_message, new_timestamp = self.serialiser.serialise(
+                    response, decoded=decoded
+                )
+                self._set_new_filtered_message(new_message, new_timestamp)
+        if self.alarm_serialiser is not None:
+            alarm_message, alarm_timestamp = self.alarm_serialiser.serialise(
+                response, decoded=decoded
             )
-            return
-        current_datetime = datetime.now(tz=timezone.utc)
-        if message_datetime < current_datetime - LOWER_AGE_LIMIT:
-            self._logger.error(
+            if alarm_message is not None:
+                self._set_new_alarm_message(alarm_message, alarm_timestamp)
+
+    def process_ca_message(
+        self, response: ReadNotifyResponse, decoded: Optional[DecodedUpdate] = None
+    ):
+        if decoded is None:
+            decoded = decode_ca_update(response)
+        if self._update_filter is None or self._update_filter.check(decoded):
+            with self._publish_lock:
+                new_message, new_timestamp = self.serialiser.serialise(
+                    response, decoded=decoded
+                )
+                self._set_new_filtered_message(new_message, new_timestamp)
+        if self.alarm_serialiser is not None:
+            alarm_message, alarm_timestamp = self.alarm_serialiser.serialise(
+                response, decoded=decoded
+            )
+            if alarm_message is not None:
+                self._set_new_alarm_message(alarm_message, alarm_timestamp)
+
+    def process_ca_connection(self, pv: "PV", state: str):
+        if self._update_filter is not None:
+            # Forward the first value after any change in connection
+            self._update_filter.reset()
+        with self._publish_lock:
+            (
+                new_message,
+                new_timestamp,
+            ) = self.serialiser.conn_serialise(pv, state)
+            if new_message is not None:
+                self.set_new_message(new_message, new_timestamp)
+
+    def _is_timestamp_acceptable(
+        self, timestamp_ns: Union[int, float], last_timestamp_ns: Union[int, float]
+    ) -> bool:
+        if timestamp_ns < last_timestamp_ns:
+            logger.error(
+                f"Rejecting update on {self._pv_name} as its timestamp is older than the previous message timestamp from that PV ({_ns_to_datetime(timestamp_ns)} vs {_ns_to_datetime(last_timestamp_ns)})."
+            )
+            return False
+        current_time_ns = time.time_ns()
+        if timestamp_ns < current_time_ns - _LOWER_AGE_LIMIT_NS:
+            logger.error(
                 f"Rejecting update on {self._pv_name} as its timestamp is older than allowed ({LOWER_AGE_LIMIT})."
             )
-            return
-        if message_datetime > current_datetime + UPPER_AGE_LIMIT:
-            self._logger.error(
+            return False
+        if timestamp_ns > current_time_ns + _UPPER_AGE_LIMIT_NS:
+            logger.error(
                 f"Rejecting update on {self._pv_name} as its timestamp is from further into the future than allowed ({UPPER_AGE_LIMIT})."
             )
+            return False
+        return True
+
+    def set_new_message(
+        self,
+        message: bytes,
+        timestamp_ns: Union[int, float],
+        on_published: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """
+        Returns whether the message was published now. on_published is called
+        once it is published, now or later if it is held back by a rate limit.
+        """
+        if message is None:
+            return False
+        if not self._is_timestamp_acceptable(timestamp_ns, self._last_timestamp_ns):
+            return False
+        self._last_timestamp_ns = timestamp_ns
+        if self._rate_limiter is not None and not self._rate_limiter.allow(
+            message, timestamp_ns, on_published
+        ):
+            return False
+        if not self._publish_and_cache(message, timestamp_ns):
+            return False
+        if on_published is not None:
+            on_published()
+        return True
+
+    def _set_new_filtered_message(
+        self, message: Optional[bytes], timestamp_ns: Union[int, float, None]
+    ):
+        if message is None or timestamp_ns is None:
             return
-        self._last_timestamp = message_datetime
+        # The update filter only compares later updates against this one if it is published
+        self.set_new_message(
+            message,
+            timestamp_ns,
+            self._update_filter.deferred_commit()
+            if self._update_filter is not None
+            else None,
+        )
+
+    def _publish_and_cache(
+        self, message: bytes, timestamp_ns: Union[int, float]
+    ) -> bool:
+        if not self.publish_message(message, timestamp_ns):
+            return False
+        # Republishing a batch would send its samples again
+        if self._repeating_timer is not None and self._batch_flusher is None:
+            with self._cache_lock:
+                self._cached_update = message
+                self._cached_timestamp = timestamp_ns
+        return True
+
+    def _set_new_alarm_message(self, message: bytes, timestamp_ns: Union[int, float]):
+        if not self._is_timestamp_acceptable(
+            timestamp_ns, self._last_alarm_timestamp_ns
+        ):
+            return
+        self._last_alarm_timestamp_ns = timestamp_ns
         if (
             self.publish_message(message, timestamp_ns)
             and self._repeating_timer is not None
         ):
             with self._cache_lock:
-                self._cached_update = message
-                self._cached_timestamp = timestamp_ns
+                self._cached_alarm_update = message
 
     def stop(self):
         if self._repeating_timer is not None:
             self._repeating_timer.cancel()
+        if self._batch_flusher is not None:
+            self._batch_flusher.unregister(self, self.serialiser.flush_period_ms)
+            if self._owns_batch_flusher:
+                self._batch_flusher.stop()
+            # Do not lose the samples batched so far
+            self.flush_batch(force=True)
+        if self._rate_limiter is not None:
+            self._rate_limiter.release()
         self._producer.close()
 
     def publish_message(
         self, message: Optional[bytes], timestamp_ns: Union[int, float]
     ) -> bool:
         if message is None:
-            self._logger.error(
+            logger.error(
                 f'Rejecting update from PV "{self._pv_name}" as the message was not serialised.'
             )
             return False
@@ -139,7 +360,10 @@ class SerialiserTracker:
             self._output_topic,
             message,
             _nanoseconds_to_milliseconds(int(timestamp_ns)),
-            key=self._pv_name,
+            key=self._key,
+            partition=self._partitioner.next()
+            if self._partitioner is not None
+            else None,
         )
         return True
 
@@ -151,35 +375,65 @@ def create_serialiser_list(
     schema: str,
     protocol: EpicsProtocol,
     periodic_update_ms: Optional[int] = None,
+    include_connection_status: bool = True,
+    channel_filter: Optional[ChannelFilter] = None,
+    rate_limiter: Optional[ChannelRateLimiter] = None,
+    batch_settings: Optional[BatchSettings] = None,
+    partitioner: Optional[PVPartitioner] = None,
+    batch_flusher: Optional[BatchFlusher] = None,
 ) -> List[SerialiserTracker]:
     return_list = []
+    update_filter = None
+    if channel_filter is not None:
+        if schema in SCHEMAS_THAT_SUPPORT_FILTERING:
+            update_filter = UpdateFilter(channel_filter)
+        else:
+            logger.warning(
+                f'Ignoring update filter for PV "{pv_name}" as the {schema} schema does not support filtering'
+            )
+    # The alarm serialiser shares the value tracker so each update is handled in one pass
+    alarm_serialiser = (
+        SerialiserFactory.create_serialiser(protocol, "al00", pv_name)
+        if schema not in SCHEMAS_THAT_DO_NOT_REQUIRE_ATTACHED_ALARM
+        else None
+    )
+    serialiser_options = {}
+    if batch_settings is not None:
+        if schema in SCHEMAS_THAT_SUPPORT_BATCHING:
+            serialiser_options = {
+                option: value
+                for option, value in vars(batch_settings).items()
+                if value is not None
+            }
+        else:
+            logger.warning(
+                f'Ignoring batch settings for PV "{pv_name}" as the {schema} schema does not support batching'
+            )
     return_list.append(
         SerialiserTracker(
-            SerialiserFactory.create_serialiser(protocol, schema, pv_name),
+            SerialiserFactory.create_serialiser(
+                protocol, schema, pv_name, **serialiser_options
+            ),
             producer,
             pv_name,
             output_topic,
             periodic_update_ms,
+            alarm_serialiser=alarm_serialiser,
+            update_filter=update_filter,
+            rate_limiter=rate_limiter,
+            partitioner=partitioner,
+            batch_flusher=batch_flusher,
         )
     )
-    if schema not in SCHEMAS_THAT_DO_NOT_REQUIRE_ATTACHED_ALARM:
+    # Connection status serialiser, unless a shared ConnectionStatusTracker is used
+    if include_connection_status:
         return_list.append(
             SerialiserTracker(
-                SerialiserFactory.create_serialiser(protocol, "al00", pv_name),
+                SerialiserFactory.create_serialiser(protocol, "ep01", pv_name),
                 producer,
                 pv_name,
                 output_topic,
                 periodic_update_ms,
             )
         )
-    # Connection status serialiser
-    return_list.append(
-        SerialiserTracker(
-            SerialiserFactory.create_serialiser(protocol, "ep01", pv_name),
-            producer,
-            pv_name,
-            output_topic,
-            periodic_update_ms,
-        )
-    )
     return return_list
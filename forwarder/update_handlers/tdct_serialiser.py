@@ -1,84 +1,139 @@
-from typing import Tuple, Union
+from typing import TYPE_CHECKING, Optional, Tuple, Union
 
+import flatbuffers
 import numpy as np
-import p4p
 from caproto import Message as CA_Message
-from numpy.typing import NDArray
-from streaming_data_types.timestamps_tdct import serialise_tdct
+from streaming_data_types.fbschemas.timestamps_tdct.timestamp import (
+    timestampAddName,
+    timestampAddSequenceCounter,
+    timestampAddTimestamps,
+    timestampEnd,
+    timestampStart,
+)
+from streaming_data_types.timestamps_tdct import FILE_IDENTIFIER
 
-from forwarder.epics_to_serialisable_types import (
-    numpy_type_from_caproto_type,
-    numpy_type_from_p4p_type,
+from forwarder.update_handlers.decoded_update import (
+    DecodedUpdate,
+    decode_ca_update,
+    decode_pva_update,
 )
-from forwarder.kafka.kafka_helpers import seconds_to_nanoseconds
 from forwarder.update_handlers.schema_serialisers import CASerialiser, PVASerialiser
 
+if TYPE_CHECKING:
+    import p4p
+
+_MIN_BUFFER_SIZE = 64
+
+
+class _TimestampBuffer:
+    """
+    Reusable uint64 buffer for converting relative chopper timestamps to unix
+    timestamps, grown geometrically so that it is rarely reallocated.
 
-def _extract_ca_data(update: CA_Message) -> np.ndarray:
-    data_type = numpy_type_from_caproto_type[update.data_type]
-    return np.squeeze(np.array(update.data)).astype(data_type)
+    The offset is added while converting the relative timestamps, straight from
+    the EPICS data, into the buffer so no intermediate arrays are created.
+    """
+
+    __slots__ = ("_buffer",)
+
+    def __init__(self):
+        self._buffer: np.ndarray = np.empty(0, dtype=np.uint64)
+
+    def offset(self, relative_timestamps: np.ndarray, origin_time: int) -> np.ndarray:
+        size = relative_timestamps.size
+        if size > self._buffer.size:
+            self._buffer = np.empty(
+                max(_MIN_BUFFER_SIZE, size, 2 * self._buffer.size), dtype=np.uint64
+            )
+        timestamps = self._buffer[:size]
+        np.add(
+            relative_timestamps,
+            np.int64(origin_time),
+            out=timestamps,
+            casting="unsafe",
+        )
+        return timestamps
+
+
+def _serialise_tdct(name: str, timestamps: np.ndarray, sequence_counter: int) -> bytes:
+    """
+    As streaming_data_types' serialise_tdct, but without copying timestamps
+    which are already uint64, and with a builder big enough for the message
+    """
+    builder = flatbuffers.Builder(timestamps.nbytes + len(name) + 64)
+    builder.ForceDefaults(True)
+    name_offset = builder.CreateString(name)
+    array_offset = builder.CreateNumpyVector(timestamps)
+    timestampStart(builder)
+    timestampAddName(builder, name_offset)
+    timestampAddTimestamps(builder, array_offset)
+    timestampAddSequenceCounter(builder, sequence_counter)
+    timestamps_message = timestampEnd(builder)
+    builder.Finish(timestamps_message, file_identifier=FILE_IDENTIFIER)
+    return bytes(builder.Output())
 
 
 class tdct_CASerialiser(CASerialiser):
+    __slots__ = ("_source_name", "_msg_counter", "_timestamp_buffer")
+
     def __init__(self, source_name: str):
         self._source_name = source_name
         self._msg_counter = -1
+        self._timestamp_buffer = _TimestampBuffer()
 
     def _serialise(self, value_arr: np.ndarray, origin_time: int) -> Tuple[bytes, int]:
-        timestamps = value_arr + origin_time
+        timestamps = self._timestamp_buffer.offset(value_arr, origin_time)
         self._msg_counter += 1
         return (
-            serialise_tdct(
-                name=self._source_name,
-                timestamps=timestamps.astype(np.uint64),
-                sequence_counter=self._msg_counter,
-            ),
+            _serialise_tdct(self._source_name, timestamps, self._msg_counter),
             origin_time,
         )
 
     def serialise(
-        self, update: CA_Message, **unused
+        self, update: CA_Message, decoded: Optional[DecodedUpdate] = None, **unused
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
         if update.data.size == 0:
             return None, None
-        origin_time = seconds_to_nanoseconds(update.metadata.timestamp)
-        value_arr = _extract_ca_data(update)
-        return self._serialise(value_arr, origin_time)
+        if decoded is None:
+            decoded = decode_ca_update(update)
+        # Use the received data directly rather than the decoded value, which is a copy
+        return self._serialise(np.ravel(update.data), decoded.timestamp_ns)
 
     def conn_serialise(self, pv: str, state: str) -> Tuple[None, None]:
         return None, None
 
 
 class tdct_PVASerialiser(PVASerialiser):
+    __slots__ = ("_source_name", "_msg_counter", "_timestamp_buffer")
+
     def __init__(self, source_name: str):
         self._source_name = source_name
         self._msg_counter = -1
+        self._timestamp_buffer = _TimestampBuffer()
 
     def _serialise(self, value_arr: np.ndarray, origin_time: int) -> Tuple[bytes, int]:
-        timestamps = value_arr + origin_time
+        timestamps = self._timestamp_buffer.offset(value_arr, origin_time)
         self._msg_counter += 1
         return (
-            serialise_tdct(
-                name=self._source_name,
-                timestamps=timestamps.astype(np.uint64),
-                sequence_counter=self._msg_counter,
-            ),
+            _serialise_tdct(self._source_name, timestamps, self._msg_counter),
             origin_time,
         )
 
     def serialise(
-        self, update: Union[p4p.Value, RuntimeError], **unused
+        self,
+        update: Union["p4p.Value", RuntimeError],
+        decoded: Optional[DecodedUpdate] = None,
+        **unused,
     ) -> Union[Tuple[bytes, int], Tuple[None, None]]:
         if isinstance(update, RuntimeError):
             return None, None
-        origin_time = (
-            update.timeStamp.secondsPastEpoch * 1_000_000_000
-        ) + update.timeStamp.nanoseconds
+        if decoded is None:
+            decoded = decode_pva_update(update)
 
         allowed_types = ["epics:nt/NTScalar:1.0", "epics:nt/NTScalarArray:1.0"]
-        if update.getID() not in allowed_types:
+        if decoded.type_id not in allowed_types:
             raise RuntimeError(
-                f'Unable to extract TDC data from EPICS type: "{update.getID()}"'
+                f'Unable to extract TDC data from EPICS type: "{decoded.type_id}"'
             )
         if update.value is None:
             return None, None
@@ -87,6 +142,5 @@ class tdct_PVASerialiser(PVASerialiser):
                 return None, None
         except AttributeError:
             pass
-        data_type = numpy_type_from_p4p_type[update.type()["value"][-1]]
-        value_arr: NDArray = np.squeeze(np.array(update.value)).astype(data_type)
-        return self._serialise(value_arr, origin_time)
+        # Use the received data directly rather than the decoded value, which is a copy
+        return self._serialise(np.ravel(update.value), decoded.timestamp_ns)
@@ -0,0 +1,123 @@
+import zlib
+from functools import partial
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from forwarder.channel_policy import ChannelFilter
+from forwarder.update_handlers.decoded_update import DecodedUpdate
+
+
+class UpdateFilter:
+    """
+    Drops updates whose value has not changed enough since the last forwarded one.
+
+    Numeric scalars are compared against absolute and relative deadbands,
+    an update is forwarded only if it moves by more than every configured
+    deadband. Arrays (and strings) are forwarded only when their contents
+    change, detected with a checksum so that the previous array is not kept.
+
+    An update which passes check() only becomes the value later updates are
+    compared against once commit() is called, when it has been published, so
+    updates dropped afterwards (e.g. by a rate limit) are not used. Updates
+    published later, after newer updates have been checked, are committed with
+    the function returned by deferred_commit() when they were checked.
+    """
+
+    __slots__ = (
+        "_absolute_deadband",
+        "_relative_deadband",
+        "_suppress_unchanged_arrays",
+        "_last_scalar",
+        "_last_array_signature",
+        "_checked_scalar",
+        "_checked_array_signature",
+    )
+
+    def __init__(self, channel_filter: ChannelFilter):
+        self._absolute_deadband = channel_filter.absolute_deadband
+        self._relative_deadband = channel_filter.relative_deadband
+        self._suppress_unchanged_arrays = channel_filter.suppress_unchanged_arrays
+        self._last_scalar: Optional[float] = None
+        self._last_array_signature: Optional[Tuple[str, Tuple[int, ...], int]] = None
+        self._checked_scalar: Optional[float] = None
+        self._checked_array_signature: Optional[Tuple[str, Tuple[int, ...], int]] = None
+
+    def reset(self):
+        """
+        Forget the last forwarded value, so the next update is always forwarded
+        """
+        self._last_scalar = None
+        self._last_array_signature = None
+        self._checked_scalar = None
+        self._checked_array_signature = None
+
+    def check(self, decoded: DecodedUpdate) -> bool:
+        """
+        Returns whether the update should be forwarded, without using it for
+        later comparisons until commit() is called
+        """
+        self._checked_scalar = None
+        self._checked_array_signature = None
+        value = np.asarray(decoded.value)
+        if value.size == 1 and value.dtype.kind in "biuf":
+            return self._check_scalar(float(value.reshape(())))
+        if self._suppress_unchanged_arrays:
+            return self._check_array(value)
+        return True
+
+    def commit(self):
+        """
+        Compare later updates against the last update which passed check()
+        """
+        self._commit(self._checked_scalar, self._checked_array_signature)
+        self._checked_scalar = None
+        self._checked_array_signature = None
+
+    def deferred_commit(self) -> Callable[[], None]:
+        """
+        Returns a function which compares later updates against the last update
+        which passed check(), even if other updates have been checked since
+        """
+        return partial(
+            self._commit, self._checked_scalar, self._checked_array_signature
+        )
+
+    def _commit(
+        self,
+        scalar: Optional[float],
+        array_signature: Optional[Tuple[str, Tuple[int, ...], int]],
+    ):
+        if scalar is not None:
+            self._last_scalar = scalar
+        if array_signature is not None:
+            self._last_array_signature = array_signature
+
+    def _check_scalar(self, value: float) -> bool:
+        last = self._last_scalar
+        if last is not None:
+            change = abs(value - last)
+            if (
+                self._absolute_deadband is not None
+                and change <= self._absolute_deadband
+            ):
+                return False
+            if (
+                self._relative_deadband is not None
+                and change <= self._relative_deadband * abs(last)
+            ):
+                return False
+        self._checked_scalar = value
+        return True
+
+    def _check_array(self, value: np.ndarray) -> bool:
+        contiguous = np.ascontiguousarray(value)
+        signature = (
+            contiguous.dtype.str,
+            contiguous.shape,
+            zlib.crc32(contiguous.data),
+        )
+        if signature == self._last_array_signature:
+            return False
+        self._checked_array_signature = signature
+        return True
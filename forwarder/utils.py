@@ -1,22 +1,140 @@
-from itertools import count
-from threading import Lock
+from threading import Lock, Thread, current_thread, local
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _Shard:
+    __slots__ = ("thread", "count")
+
+    def __init__(self, thread: Thread):
+        self.thread = thread
+        self.count = 0
 
 
 class Counter:
-    """Thread safe Counter class without lock during write"""
+    """
+    Thread safe Counter class without lock during write.
+
+    Each thread increments its own shard of the count, which no other thread
+    writes to, so increments from many threads (such as librdkafka delivery
+    callbacks) never contend. Reads sum the shards. The counts of threads
+    which have finished are folded into a single total when the count is read.
+    """
+
+    __slots__ = ("_local", "_lock", "_shards", "_finished_count", "_last_snapshot")
 
     def __init__(self):
-        self._num_read = 0
-        self._counter = count()
-        self._read_lock = Lock()
+        self._local = local()
+        self._lock = Lock()
+        self._shards: List[_Shard] = []
+        self._finished_count = 0
+        self._last_snapshot = 0
+
+    def _new_shard(self) -> _Shard:
+        shard = _Shard(current_thread())
+        with self._lock:
+            self._shards.append(shard)
+        self._local.shard = shard
+        return shard
+
+    def increment(self, amount: int = 1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard.count += amount
 
-    def increment(self):
-        # next is thread safe
-        next(self._counter)
+    def _total(self) -> int:
+        total = 0
+        running_shards = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                running_shards.append(shard)
+                total += shard.count
+            else:
+                # The thread cannot increment its shard any more
+                self._finished_count += shard.count
+        self._shards = running_shards
+        return total + self._finished_count
 
     @property
-    def value(self):
-        with self._read_lock:
-            value = next(self._counter) - self._num_read
-            self._num_read += 1
-        return value
+    def value(self) -> int:
+        with self._lock:
+            return self._total()
+
+    def snapshot_and_reset(self) -> int:
+        """
+        Returns the count since the last snapshot, for calculating rates
+        """
+        with self._lock:
+            total = self._total()
+            change = total - self._last_snapshot
+            self._last_snapshot = total
+        return change
+
+
+class LabelledCounter:
+    """
+    Family of Counters distinguished by a label, for example a topic, a PV
+    name or an error type. Counters are created the first time a label is used.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters: Dict[str, Counter] = {}
+
+    def labels(self, label: str) -> Counter:
+        counter = self._counters.get(label)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(label, Counter())
+        return counter
+
+    def increment(self, label: str, amount: int = 1):
+        self.labels(label).increment(amount)
+
+    def _counters_by_label(self) -> Dict[str, Counter]:
+        with self._lock:
+            return dict(self._counters)
+
+    @property
+    def values(self) -> Dict[str, int]:
+        return {
+            label: counter.value for label, counter in self._counters_by_label().items()
+        }
+
+    def snapshot_and_reset(self) -> Dict[str, int]:
+        """
+        Returns the count for each label since the last snapshot
+        """
+        return {
+            label: counter.snapshot_and_reset()
+            for label, counter in self._counters_by_label().items()
+        }
+
+
+class LazyProxy:
+    """
+    Stands in for an object which is only created, by calling factory, when
+    one of its attributes is first used. Used so that expensive libraries,
+    such as the EPICS clients, are only imported if they are needed.
+    """
+
+    __slots__ = ("_factory", "_instance", "_lock")
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._instance: Optional[Any] = None
+        self._lock = Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return getattr(instance, name)
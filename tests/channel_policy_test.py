@@ -0,0 +1,180 @@
+import pytest
+
+from forwarder.channel_policy import (
+    BatchSettings,
+    ChannelFilter,
+    FakeProfile,
+    RateLimit,
+    load_channel_policies,
+    parse_channel_policies,
+)
+
+
+def test_first_matching_rule_is_used():
+    policies = parse_channel_policies(
+        {
+            "channel": [
+                {"pattern": "SIM:TEMP:*", "schema": "f144", "absolute_deadband": 0.5},
+                {"pattern": "SIM:*", "relative_deadband": 0.01},
+            ]
+        }
+    )
+
+    assert policies.filter_for("SIM:TEMP:1", "f144") == ChannelFilter(
+        absolute_deadband=0.5
+    )
+    assert policies.filter_for("SIM:TEMP:1", "f142") == ChannelFilter(
+        relative_deadband=0.01
+    )
+    assert policies.filter_for("OTHER:PV", "f144") is None
+
+
+def test_rule_without_filter_settings_has_no_filter():
+    policies = parse_channel_policies({"channel": [{"pattern": "*"}]})
+
+    assert policies.policy_for("SIM:PV", "f144") is not None
+    assert policies.filter_for("SIM:PV", "f144") is None
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        {"absolute_deadband": 1.0},
+        {"pattern": ""},
+        {"pattern": "*", "absolute_deadband": -1},
+        {"pattern": "*", "relative_deadband": "large"},
+    ],
+)
+def test_invalid_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        parse_channel_policies({"channel": [rule]})
+
+
+def test_policies_are_loaded_from_toml_file(tmp_path):
+    policy_file = tmp_path / "policy.toml"
+    policy_file.write_text(
+        '[[channel]]\npattern = "SIM:*"\nsuppress_unchanged_arrays = true\n'
+    )
+
+    policies = load_channel_policies(str(policy_file))
+
+    assert policies.filter_for("SIM:WAVEFORM", "f144") == ChannelFilter(
+        suppress_unchanged_arrays=True
+    )
+
+
+def test_rate_limits_are_parsed_for_channels_and_topics():
+    policies = parse_channel_policies(
+        {
+            "channel": [
+                {"pattern": "SIM:*", "max_rate": 5, "overflow": "decimate"},
+            ],
+            "topic": [{"pattern": "motion_*", "max_rate": 100, "burst": 10}],
+        }
+    )
+
+    channel_limit = policies.rate_limit_for("SIM:PV", "f144")
+    assert channel_limit == RateLimit(max_rate=5.0, overflow="decimate")
+    assert channel_limit.capacity == 1.0
+    topic_limit = policies.topic_rate_limit_for("motion_data")
+    assert topic_limit == RateLimit(max_rate=100.0, burst=10)
+    assert topic_limit.capacity == 10.0
+    assert policies.topic_rate_limit_for("other_data") is None
+    assert policies.has_rate_limits
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"channel": [{"pattern": "*", "max_rate": 0}]},
+        {"channel": [{"pattern": "*", "max_rate": 1, "overflow": "queue"}]},
+        {"channel": [{"pattern": "*", "max_rate": 1, "burst": 0}]},
+        {"channel": [{"pattern": "*", "burst": 5}]},
+        {"topic": [{"pattern": "*"}]},
+    ],
+)
+def test_invalid_rate_limits_are_rejected(config):
+    with pytest.raises(ValueError):
+        parse_channel_policies(config)
+
+
+def test_batch_settings_are_parsed():
+    policies = parse_channel_policies(
+        {
+            "channel": [
+                {"pattern": "SIM:FAST:*", "schema": "se00", "batch_size": 500},
+                {"pattern": "SIM:*", "absolute_deadband": 0.5},
+            ]
+        }
+    )
+
+    assert policies.batching_for("SIM:FAST:1", "se00") == BatchSettings(batch_size=500)
+    assert policies.batching_for("SIM:SLOW:1", "se00") is None
+
+
+@pytest.mark.parametrize("batch_size", [0, -10, 1.5, "100", True])
+def test_invalid_batch_settings_are_rejected(batch_size):
+    with pytest.raises(ValueError):
+        parse_channel_policies(
+            {"channel": [{"pattern": "SIM:*", "batch_size": batch_size}]}
+        )
+
+
+def test_partition_spread_is_parsed():
+    policies = parse_channel_policies(
+        {"channel": [{"pattern": "SIM:FAST:*", "partition_spread": 4}]}
+    )
+
+    assert policies.partition_spread_for("SIM:FAST:1", "f144") == 4
+    assert policies.partition_spread_for("SIM:SLOW:1", "f144") is None
+    assert policies.has_partition_spread
+    assert not parse_channel_policies({}).has_partition_spread
+
+
+@pytest.mark.parametrize("partition_spread", [0, -2, 2.5, "4"])
+def test_invalid_partition_spread_is_rejected(partition_spread):
+    with pytest.raises(ValueError):
+        parse_channel_policies(
+            {"channel": [{"pattern": "SIM:*", "partition_spread": partition_spread}]}
+        )
+
+
+def test_fake_profiles_are_parsed():
+    policies = parse_channel_policies(
+        {
+            "fake": [
+                {
+                    "pattern": "SIM:WAVE:*",
+                    "rate": 10,
+                    "distribution": "normal",
+                    "array_size": 1000,
+                    "dtype": "float64",
+                },
+                {"schema": "tdct", "rate": 14},
+            ]
+        }
+    )
+
+    assert policies.fake_profile_for("SIM:WAVE:1", "f144") == FakeProfile(
+        rate=10.0, distribution="normal", array_size=1000, dtype="float64"
+    )
+    assert policies.fake_profile_for("SIM:CHOPPER", "tdct") == FakeProfile(rate=14.0)
+    assert policies.fake_profile_for("SIM:OTHER", "f144") is None
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        {"rate": 0},
+        {"distribution": "poisson"},
+        {"dtype": "string"},
+        {"low": 10, "high": 5},
+        {"low": 0.2, "high": 0.8},
+        {"std": -1},
+        {"array_size": 0},
+        {"mean": "1"},
+    ],
+)
+def test_invalid_fake_profiles_are_rejected(rule):
+    with pytest.raises(ValueError):
+        parse_channel_policies({"fake": [rule]})
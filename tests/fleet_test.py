@@ -0,0 +1,163 @@
+import logging
+from typing import List, Optional
+from unittest import mock
+
+from streaming_data_types.status_x5f2 import serialise_x5f2
+
+from forwarder.common import Channel, CommandType, ConfigUpdate, EpicsProtocol
+from forwarder.fleet import Fleet, FleetMembership, HashRing, fleet_name_from_status
+from tests.kafka.fake_consumer import FakeMessage
+
+_logger = logging.getLogger("stub_for_use_in_tests")
+_logger.addHandler(logging.NullHandler())
+
+PV_NAMES = [f"SIM:PV:{index}" for index in range(2000)]
+
+
+def _channel(name: str, topic: str = "topic", schema: str = "f144") -> Channel:
+    return Channel(name, EpicsProtocol.CA, topic, schema)
+
+
+def test_ring_spreads_keys_over_members():
+    ring = HashRing(["a", "b", "c", "d"])
+
+    owners = [ring.owner(name) for name in PV_NAMES]
+
+    for member in ("a", "b", "c", "d"):
+        assert 0.15 < owners.count(member) / len(PV_NAMES) < 0.35
+
+
+def test_only_keys_of_a_new_member_move_when_it_joins():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+
+    moved = [name for name in PV_NAMES if before.owner(name) != after.owner(name)]
+
+    assert all(after.owner(name) == "d" for name in moved)
+    assert 0.15 < len(moved) / len(PV_NAMES) < 0.35
+
+
+def test_only_keys_of_a_member_which_leaves_move():
+    before = HashRing(["a", "b", "c", "d"])
+    after = HashRing(["a", "b", "c"])
+
+    moved = [name for name in PV_NAMES if before.owner(name) != after.owner(name)]
+
+    assert all(before.owner(name) == "d" for name in moved)
+
+
+def test_fleet_members_forward_disjoint_channels_covering_the_configuration():
+    channels = tuple(_channel(name) for name in PV_NAMES[:200])
+    fleets = [Fleet(service_id) for service_id in ("a", "b", "c")]
+    assigned: List[Channel] = []
+    for fleet in fleets:
+        fleet.set_members(["a", "b", "c"])
+        assigned.extend(fleet.assigned(ConfigUpdate(CommandType.ADD, channels)).channels)  # type: ignore
+
+    assert sorted(assigned, key=str) == sorted(channels, key=str)
+
+
+def test_all_streams_of_a_pv_are_assigned_to_the_same_member():
+    fleet = Fleet("a")
+    fleet.set_members(["a", "b", "c"])
+
+    for name in PV_NAMES[:100]:
+        assert fleet.owns(_channel(name, schema="f144")) == fleet.owns(
+            _channel(name, topic="other", schema="al00")
+        )
+
+
+def test_fleet_records_changes_for_the_whole_fleet():
+    fleet = Fleet("a")
+    fleet.set_members(["a", "b"])
+
+    fleet.record(
+        ConfigUpdate(
+            CommandType.ADD,
+            (_channel("SIM:1"), _channel("SIM:2"), _channel("OTHER:1")),
+        )
+    )
+    fleet.record(ConfigUpdate(CommandType.REMOVE, (_channel("SIM:*"),)))
+
+    assert list(fleet.channels) == [_channel("OTHER:1")]
+    fleet.record(ConfigUpdate(CommandType.REMOVE_ALL, None))
+    assert not fleet.channels
+
+
+def test_channels_are_reassigned_when_members_change():
+    fleet = Fleet("a")
+    fleet.set_configuration(
+        ConfigUpdate(CommandType.ADD, tuple(_channel(name) for name in PV_NAMES[:100]))
+    )
+    assert len(fleet.assigned_configuration().channels) == 100  # type: ignore
+
+    assert fleet.set_members(["b"])
+    assert not fleet.set_members(["a", "b"])
+
+    owned = fleet.assigned_configuration().channels
+    assert 0 < len(owned) < 100  # type: ignore
+    assert all(fleet.owns(channel) for channel in owned)  # type: ignore
+
+
+def _status(service_id: str, fleet: Optional[str], interval_ms: int = 4000) -> bytes:
+    prefix = f'{{"fleet": "{fleet}", ' if fleet is not None else "{"
+    return serialise_x5f2(
+        "Forwarder",
+        "version",
+        service_id,
+        "host",
+        1,
+        interval_ms,
+        prefix + '"streams": []}',
+    )
+
+
+class FakeStatusConsumer:
+    def __init__(self):
+        self.messages: List[FakeMessage] = []
+        self.topics: List[str] = []
+
+    def subscribe(self, topics):
+        self.topics = topics
+
+    def consume(self, num_messages: int = 1, timeout: float = -1):
+        batch = self.messages[:num_messages]
+        del self.messages[:num_messages]
+        return batch
+
+    def close(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now_s = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now_s
+
+
+def test_fleet_name_is_read_from_the_start_of_the_status():
+    assert fleet_name_from_status('{"fleet": "a \\"b\\"", "streams": []}') == 'a "b"'
+    assert fleet_name_from_status('{"streams": [], "fleet": "a"}') is None
+
+
+@mock.patch("forwarder.fleet.time", new_callable=FakeClock)
+def test_peers_join_from_status_messages_and_leave_when_they_stop_reporting(clock):
+    consumer = FakeStatusConsumer()
+    membership = FleetMembership(consumer, "status", "fleet_1", "a", _logger)
+    assert consumer.topics == ["status"]
+
+    consumer.messages = [
+        FakeMessage(_status("b", "fleet_1", interval_ms=1000)),
+        FakeMessage(_status("c", "fleet_2")),
+        FakeMessage(_status("d", None)),
+        FakeMessage(b"not a status message"),
+    ]
+    assert membership.poll()
+    assert membership.members == {"a", "b"}
+    assert not membership.poll()
+
+    clock.now_s += 3.5
+    assert membership.poll()
+    assert membership.members == {"a"}
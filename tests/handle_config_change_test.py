@@ -1,30 +1,56 @@
 import logging
+import threading
+import time
+from queue import Queue
 from typing import Dict, List
 from unittest import mock
 
 import pytest
 
 from forwarder.common import Channel, CommandType, ConfigUpdate, EpicsProtocol
-from forwarder.configuration_store import ConfigurationStore
-from forwarder.handle_config_change import handle_configuration_change
+from forwarder.configuration_store import DELTA_KEY, SNAPSHOT_KEY, ConfigurationStore
+from forwarder.fleet import Fleet
+from forwarder.handle_config_change import (
+    BackgroundReconciliation,
+    ForwarderContext,
+    handle_configuration_change,
+    reconcile_configuration,
+    stop_update_handlers,
+)
+from forwarder.parse_config_update import parse_config_update
 from forwarder.update_handlers.create_update_handler import UpdateHandler
 from tests.kafka.fake_producer import FakeProducer
 
 
 class StubStatusReporter:
+    def streams_changed(self):
+        pass
+
     def report_status(self):
         pass
 
 
 class StubUpdateHandler:
+    def __init__(self):
+        self.stopped = False
+
     def stop(self):
-        pass
+        self.stopped = True
+
+
+class SlowStubUpdateHandler:
+    def stop(self):
+        time.sleep(1)
 
 
 _logger = logging.getLogger("stub_for_use_in_tests")
 _logger.addHandler(logging.NullHandler())
 
 
+def _context(producer, fleet=None) -> ForwarderContext:
+    return ForwarderContext(producer, None, None, 20000, fleet=fleet)  # type: ignore
+
+
 def _get_channel_names(update_handlers: Dict[Channel, UpdateHandler]) -> List[str]:
     return [
         channel.name for channel in update_handlers.keys() if channel.name is not None
@@ -51,7 +77,7 @@ def test_no_change_to_empty_update_handlers_when_invalid_config_update_handled(
     producer = FakeProducer()
     config_update = ConfigUpdate(CommandType.INVALID, None)
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert not update_handlers
 
 
@@ -64,7 +90,7 @@ def test_no_change_to_update_handlers_when_invalid_config_update_handled(
 
     existing_channel_name = "test_channel"
     update_handlers[Channel(existing_channel_name, EpicsProtocol.NONE, None, None)] = StubUpdateHandler()  # type: ignore
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert existing_channel_name in _get_channel_names(update_handlers)
 
@@ -78,7 +104,7 @@ def test_all_update_handlers_are_removed_when_removeall_config_update_is_handled
 
     update_handlers[Channel("test_channel_1", EpicsProtocol.NONE, None, None)] = StubUpdateHandler()  # type: ignore
     update_handlers[Channel("test_channel_2", EpicsProtocol.NONE, None, None)] = StubUpdateHandler()  # type: ignore
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert not update_handlers
 
 
@@ -96,7 +122,7 @@ def test_update_handlers_are_removed_when_remove_config_update_is_handled(
 
     update_handlers[Channel(channel_name_1, EpicsProtocol.NONE, None, None)] = StubUpdateHandler()  # type: ignore
     update_handlers[Channel(channel_name_2, EpicsProtocol.NONE, None, None)] = StubUpdateHandler()  # type: ignore
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert channel_name_2 in _get_channel_names(
         update_handlers
@@ -120,7 +146,7 @@ def test_update_handlers_can_be_removed_by_topic(
         (Channel(None, EpicsProtocol.NONE, topic_name_1, None),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert (
         list(update_handlers.keys())[0].output_topic == topic_name_2
@@ -144,7 +170,7 @@ def test_update_handlers_can_be_removed_by_schema(
         (Channel(None, EpicsProtocol.NONE, None, schema_1),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert (
         list(update_handlers.keys())[0].schema == schema_2
@@ -172,7 +198,7 @@ def test_update_handlers_can_be_removed_by_schema_and_topic(
         (Channel(None, EpicsProtocol.NONE, topic_name_2, schema_1),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 2
     assert test_channel_3 not in update_handlers.keys()
 
@@ -198,7 +224,7 @@ def test_update_handlers_can_be_removed_by_name_and_topic(
         (test_channel_3,),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 2
     assert test_channel_3 not in update_handlers.keys()
 
@@ -224,7 +250,7 @@ def test_update_handlers_can_be_removed_by_name_and_schema(
         (test_channel_3,),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 2
     assert test_channel_3 not in update_handlers.keys()
 
@@ -245,7 +271,7 @@ def test_single_character_wildcard_can_be_used_to_remove_channels_by_topic(
         (Channel(None, EpicsProtocol.NONE, "topic_?", None),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert test_channel_3 in update_handlers.keys()
 
@@ -266,7 +292,7 @@ def test_multicharacter_wildcard_can_be_used_to_remove_channels_by_topic(
         (Channel(None, EpicsProtocol.NONE, "*_topic", None),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert test_channel_3 in update_handlers.keys()
 
@@ -287,7 +313,7 @@ def test_single_character_wildcard_can_be_used_to_remove_channels_by_name(
         (Channel("channel_?", EpicsProtocol.NONE, None, None),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert test_channel_3 in update_handlers.keys()
 
@@ -310,7 +336,7 @@ def test_multicharacter_wildcard_can_be_used_to_remove_channels_by_name(
         (Channel("*_channel", EpicsProtocol.NONE, None, None),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 1
     assert test_channel_3 in update_handlers.keys()
 
@@ -333,7 +359,7 @@ def test_wildcard_cannot_be_used_to_remove_channels_by_schema(
         (Channel(None, EpicsProtocol.NONE, None, "f?42"),),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert (
         len(update_handlers) == 3
     ), "Expected no channels to be removed as ? is not treated as a wildcard when matching schemas"
@@ -352,7 +378,7 @@ def test_update_handlers_are_added_when_add_config_update_is_handled(update_hand
         ),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 2
     assert channel_name_1 in _get_channel_names(update_handlers)
     assert channel_name_2 in _get_channel_names(update_handlers)
@@ -376,7 +402,7 @@ def test_can_add_multiple_channels_with_same_name_if_protocol_topic_or_schema_ar
         ),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert len(update_handlers) == 3
     assert test_channel_1 in update_handlers.keys()
     assert test_channel_2 in update_handlers.keys()
@@ -401,7 +427,7 @@ def test_identical_configurations_are_not_added(
         ),
     )
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter)  # type: ignore
     assert (
         len(update_handlers) == 1
     ), "Only expect one channel to be added as others requested were identical"
@@ -427,7 +453,7 @@ def test_configuration_stored_when_channels_added(
     )
     config_store = mock.create_autospec(ConfigurationStore)
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter, config_store)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter, config_store)  # type: ignore
 
     config_store.save_configuration.assert_called_once()
 
@@ -446,7 +472,7 @@ def test_configuration_stored_when_channels_removed(
 
     config_store = mock.create_autospec(ConfigurationStore)
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter, config_store)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter, config_store)  # type: ignore
 
     config_store.save_configuration.assert_called_once()
 
@@ -465,7 +491,7 @@ def test_configuration_stored_when_all_channels_removed(
 
     config_store = mock.create_autospec(ConfigurationStore)
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter, config_store)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter, config_store)  # type: ignore
 
     config_store.save_configuration.assert_called_once()
 
@@ -484,6 +510,149 @@ def test_configuration_not_stored_when_command_is_invalid(
 
     config_store = mock.create_autospec(ConfigurationStore)
 
-    handle_configuration_change(config_update, 20000, None, update_handlers, producer, None, None, _logger, status_reporter, config_store)  # type: ignore
+    handle_configuration_change(config_update, update_handlers, _context(producer), _logger, status_reporter, config_store)  # type: ignore
 
     config_store.save_configuration.assert_not_called()
+
+
+def test_all_removed_handlers_are_stopped_before_status_is_reported(
+    update_handlers,
+):
+    handlers = [StubUpdateHandler() for _ in range(250)]
+    for index, handler in enumerate(handlers):
+        update_handlers[Channel(f"test_channel_{index}", EpicsProtocol.NONE, None, None)] = handler  # type: ignore
+
+    stopped_when_reported: List[bool] = []
+
+    class RecordingStatusReporter(StubStatusReporter):
+        def report_status(self):
+            stopped_when_reported.extend(handler.stopped for handler in handlers)
+
+    config_update = ConfigUpdate(CommandType.REMOVE_ALL, None)
+    handle_configuration_change(config_update, update_handlers, _context(FakeProducer()), _logger, RecordingStatusReporter())  # type: ignore
+
+    assert not update_handlers
+    assert len(stopped_when_reported) == len(handlers)
+    assert all(stopped_when_reported)
+
+
+def test_stopping_handlers_gives_up_waiting_after_timeout():
+    handlers = [SlowStubUpdateHandler(), StubUpdateHandler()]
+
+    start_time = time.monotonic()
+    not_stopped = stop_update_handlers(handlers, _logger, timeout_s=0.1, batch_size=1)  # type: ignore
+
+    assert time.monotonic() - start_time < 0.9
+    assert not_stopped == 1
+    assert handlers[1].stopped  # type: ignore
+
+
+def test_handlers_still_stopping_after_timeout_do_not_block_exit():
+    handlers = [SlowStubUpdateHandler()]
+
+    stop_update_handlers(handlers, _logger, timeout_s=0.1)  # type: ignore
+
+    stragglers = [
+        thread
+        for thread in threading.enumerate()
+        if thread.name.startswith("stop_update_handlers")
+    ]
+    assert stragglers
+    assert all(thread.daemon for thread in stragglers)
+
+
+def test_reconciling_applies_only_the_difference_to_stored_configuration(
+    update_handlers,
+):
+    kept_channel = Channel("kept_channel", EpicsProtocol.FAKE, "output_topic", "f142")
+    removed_channel = Channel("kept_*", EpicsProtocol.FAKE, "output_topic", "f142")
+    added_channel = Channel("added", EpicsProtocol.FAKE, "output_topic", "f142")
+    kept_handler = StubUpdateHandler()
+    removed_handler = StubUpdateHandler()
+    update_handlers[kept_channel] = kept_handler  # type: ignore
+    update_handlers[removed_channel] = removed_handler  # type: ignore
+    stored_configuration = ConfigUpdate(CommandType.ADD, (kept_channel, added_channel))
+    config_store = mock.create_autospec(ConfigurationStore)
+
+    reconcile_configuration(stored_configuration, update_handlers, _context(FakeProducer()), _logger, StubStatusReporter(), config_store)  # type: ignore
+
+    assert set(update_handlers.keys()) == {kept_channel, added_channel}
+    assert update_handlers[kept_channel] is kept_handler
+    assert removed_handler.stopped
+    assert not kept_handler.stopped
+    # It is already stored, so only recorded as the stored configuration
+    config_store.set_stored_configuration.assert_called_once_with(stored_configuration)
+    config_store.save_configuration.assert_not_called()
+
+
+def test_in_fleet_mode_only_assigned_channels_are_added_and_the_fleet_configuration_is_stored(
+    update_handlers,
+):
+    fleet = Fleet("a")
+    fleet.set_members(["a", "b"])
+    channels = tuple(
+        Channel(f"channel_{index}", EpicsProtocol.FAKE, "output_topic", "f142")
+        for index in range(20)
+    )
+    config_store = mock.create_autospec(ConfigurationStore)
+
+    handle_configuration_change(ConfigUpdate(CommandType.ADD, channels), update_handlers, _context(FakeProducer(), fleet), _logger, StubStatusReporter(), config_store)  # type: ignore
+
+    assert 0 < len(update_handlers) < len(channels)
+    assert all(fleet.owns(channel) for channel in update_handlers)
+    config_store.save_configuration.assert_called_once_with(dict.fromkeys(channels))
+
+
+def test_in_fleet_mode_reconciling_forwards_the_assigned_part_of_the_stored_configuration(
+    update_handlers,
+):
+    fleet = Fleet("a")
+    fleet.set_members(["a", "b"])
+    channels = tuple(
+        Channel(f"channel_{index}", EpicsProtocol.FAKE, "output_topic", "f142")
+        for index in range(20)
+    )
+    config_store = mock.create_autospec(ConfigurationStore)
+
+    reconcile_configuration(ConfigUpdate(CommandType.ADD, channels), update_handlers, _context(FakeProducer(), fleet), _logger, StubStatusReporter(), config_store)  # type: ignore
+
+    assert set(update_handlers) == {c for c in channels if fleet.owns(c)}
+    assert list(fleet.channels) == list(channels)
+    config_store.save_configuration.assert_not_called()
+
+
+def test_changes_received_while_retrieving_are_applied_and_stored_after_reconciling(
+    update_handlers,
+):
+    cached_channel = Channel("cached", EpicsProtocol.FAKE, "output_topic", "f142")
+    stored_channel = Channel("stored", EpicsProtocol.FAKE, "output_topic", "f142")
+    new_channel = Channel("new", EpicsProtocol.FAKE, "output_topic", "f142")
+    # Applied from a stale cache file on start-up
+    update_handlers[cached_channel] = StubUpdateHandler()  # type: ignore
+    store_producer = FakeProducer()
+    config_store = ConfigurationStore(
+        store_producer, consumer=None, topic="store_topic"
+    )
+    retrieved: "Queue" = Queue()
+    reconciliation = BackgroundReconciliation(retrieved, update_handlers, _context(FakeProducer()), _logger, StubStatusReporter(), config_store)  # type: ignore
+
+    reconciliation.poll()
+    reconciliation.handle_configuration_change(
+        ConfigUpdate(CommandType.ADD, (new_channel,))
+    )
+
+    assert set(update_handlers) == {cached_channel}
+    assert store_producer.messages_published == 0
+
+    stored_producer = FakeProducer()
+    ConfigurationStore(stored_producer, consumer=None, topic="store_topic").save_configuration({stored_channel: None})  # type: ignore
+    retrieved.put(stored_producer.published_payloads[0])
+    reconciliation.poll()
+
+    assert reconciliation.done
+    assert set(update_handlers) == {stored_channel, new_channel}
+    assert store_producer.published_keys == [SNAPSHOT_KEY, DELTA_KEY]
+    snapshot = parse_config_update(store_producer.published_payloads[0])
+    assert snapshot.channels == (stored_channel,)
+    delta = parse_config_update(store_producer.published_payloads[1])
+    assert (delta.command_type, delta.channels) == (CommandType.ADD, (new_channel,))
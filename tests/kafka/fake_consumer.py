@@ -0,0 +1,73 @@
+from typing import List, Optional, Tuple, Union
+
+from confluent_kafka import TopicPartition
+
+
+class FakeMessage:
+    def __init__(self, value, key: Optional[Union[str, bytes]] = None, offset: int = 0):
+        self._value = value
+        self._key = key.encode() if isinstance(key, str) else key
+        self._offset = offset
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return self._key
+
+    def offset(self) -> int:
+        return self._offset
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    """
+    Serves the given payloads as a single partition topic, starting at low_offset,
+    so that reading back from a storage topic can be tested without Kafka.
+    Offsets after the last message without a message of their own, such as
+    transaction markers, are added with trailing_offsets.
+    """
+
+    def __init__(
+        self,
+        payloads: List[Tuple[bytes, Optional[Union[str, bytes]]]],
+        low_offset: int = 0,
+        trailing_offsets: int = 0,
+    ):
+        self._messages = [
+            FakeMessage(value, key, low_offset + index)
+            for index, (value, key) in enumerate(payloads)
+        ]
+        self._low_offset = low_offset
+        self._high_offset = low_offset + len(self._messages) + trailing_offsets
+        self._position = low_offset
+        self.consume_calls = 0
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        # Without a timeout the real consumer can block forever
+        assert timeout is not None, "get_watermark_offsets called without a timeout"
+        return self._low_offset, self._high_offset
+
+    def assign(self, partitions):
+        self._position = partitions[0].offset
+
+    def seek(self, partition):
+        self._position = partition.offset
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> List[FakeMessage]:
+        self.consume_calls += 1
+        start = self._position - self._low_offset
+        batch = self._messages[start : start + num_messages]
+        self._position += len(batch)
+        if self._position >= self._low_offset + len(self._messages):
+            # Offsets without messages are skipped by the consumer
+            self._position = self._high_offset
+        return batch
+
+    def position(self, partitions):
+        return [TopicPartition(partitions[0].topic, 0, self._position)]
+
+    def close(self):
+        pass
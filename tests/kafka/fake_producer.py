@@ -1,4 +1,4 @@
-from typing import Callable, List, Optional
+from typing import Callable, Dict, List, Optional, Union
 
 
 class FakeProducer:
@@ -9,17 +9,27 @@ class FakeProducer:
     def __init__(self, produce_callback: Optional[Callable[[bytes], None]] = None):
         self.messages_published = 0
         self.published_payloads: List[bytes] = []
+        self.published_keys: List[Optional[Union[str, bytes]]] = []
+        self.published_partitions: List[Optional[int]] = []
+        # Partitions of each topic, unknown for topics not given
+        self.partition_counts: Dict[str, int] = {}
         self._produce_callback = produce_callback
 
+    def partition_count(self, topic: str) -> Optional[int]:
+        return self.partition_counts.get(topic)
+
     def produce(
         self,
         topic: str,
         payload: bytes,
         timestamp_ms: int,
-        key: Optional[str] = None,
+        key: Optional[Union[str, bytes]] = None,
+        partition: Optional[int] = None,
     ):
         self.messages_published += 1
         self.published_payloads.append(payload)
+        self.published_keys.append(key)
+        self.published_partitions.append(partition)
         if self._produce_callback is not None:
             self._produce_callback(payload)
 
@@ -0,0 +1,102 @@
+import zlib
+
+import pytest
+
+from forwarder.channel_policy import parse_channel_policies
+from forwarder.common import EpicsProtocol
+from forwarder.kafka.partitioning import (
+    PARTITIONING_KEY,
+    PARTITIONING_PRECOMPUTED,
+    Partitioning,
+    PVPartitioner,
+    create_pv_partitioner,
+    key_partition,
+)
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+from tests.kafka.fake_producer import FakeProducer
+from tests.test_helpers.ca_updates import ca_update
+
+
+def test_key_partition_matches_the_crc32_of_the_key():
+    assert key_partition(b"SIM:PV", 12) == zlib.crc32(b"SIM:PV") % 12
+
+
+def test_key_strategy_leaves_the_partition_to_librdkafka():
+    assert create_pv_partitioner(PARTITIONING_KEY, b"SIM:PV", 12) is None
+
+
+def test_partition_is_precomputed_from_the_key():
+    partitioner = create_pv_partitioner(PARTITIONING_PRECOMPUTED, b"SIM:PV", 12)
+
+    assert partitioner is not None
+    assert [partitioner.next() for _ in range(3)] == [key_partition(b"SIM:PV", 12)] * 3
+
+
+def test_unknown_partition_count_leaves_the_partition_to_librdkafka():
+    assert create_pv_partitioner(PARTITIONING_PRECOMPUTED, b"SIM:PV", None, 4) is None
+
+
+def test_spread_pv_goes_to_consecutive_partitions_in_turn():
+    start = key_partition(b"SIM:PV", 4)
+    partitioner = create_pv_partitioner(PARTITIONING_KEY, b"SIM:PV", 4, 3)
+
+    assert partitioner is not None
+    assert [partitioner.next() for _ in range(4)] == [
+        start,
+        (start + 1) % 4,
+        (start + 2) % 4,
+        start,
+    ]
+
+
+def test_spread_is_limited_to_the_number_of_partitions():
+    partitioner = create_pv_partitioner(PARTITIONING_KEY, b"SIM:PV", 2, 8)
+
+    assert partitioner is not None
+    assert sorted(partitioner.partitions) == [0, 1]
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        Partitioning(FakeProducer(), "random")  # type: ignore
+
+
+def test_only_hot_pvs_are_spread_with_key_strategy():
+    producer = FakeProducer()
+    producer.partition_counts["data"] = 8
+    policies = parse_channel_policies(
+        {"channel": [{"pattern": "SIM:FAST:*", "partition_spread": 4}]}
+    )
+    partitioning = Partitioning(producer, PARTITIONING_KEY, policies)  # type: ignore
+
+    assert partitioning.partitioner_for("SIM:SLOW:1", "f144", "data") is None
+    partitioner = partitioning.partitioner_for("SIM:FAST:1", "f144", "data")
+    assert partitioner is not None
+    assert len(partitioner.partitions) == 4
+
+
+def test_partitioning_falls_back_to_key_when_partition_count_is_unknown():
+    partitioning = Partitioning(FakeProducer(), PARTITIONING_PRECOMPUTED)  # type: ignore
+
+    assert partitioning.partitioner_for("SIM:PV", "f144", "data") is None
+
+
+def test_messages_are_published_with_encoded_key_to_partitions_in_turn():
+    producer = FakeProducer()
+    (tracker,) = create_serialiser_list(
+        producer,  # type: ignore
+        "SIM:PV",
+        "data",
+        "f142",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+        partitioner=PVPartitioner((3, 4)),
+    )
+    try:
+        for value in range(3):
+            tracker.process_ca_message(ca_update(value))
+    finally:
+        tracker.stop()
+
+    assert producer.published_keys == [b"SIM:PV"] * 3
+    assert producer.published_partitions == [3, 4, 3]
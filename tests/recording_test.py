@@ -0,0 +1,224 @@
+import time
+
+import numpy as np
+import pytest
+from p4p.client.thread import Disconnected
+from p4p.nt import NTEnum, NTScalar, NTTable
+from streaming_data_types.epics_connection_ep01 import ConnectionInfo, deserialise_ep01
+from streaming_data_types.logdata_f144 import deserialise_f144
+from streaming_data_types.utils import get_schema
+
+from forwarder.common import Channel, EpicsProtocol
+from forwarder.recording import (
+    FILE_MARKER,
+    RECORD_CA_CONNECTION,
+    RECORD_CA_UPDATE,
+    RECORD_CHANNEL,
+    RECORD_PVA_ERROR,
+    RECORD_PVA_TYPE,
+    RECORD_PVA_UPDATE,
+    Replayer,
+    UpdateRecorder,
+    decode_pva_fields,
+    encode_pva_fields,
+    read_recording,
+)
+from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
+from forwarder.update_handlers.pva_update_handler import PVAUpdateHandler
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+from tests.kafka.fake_producer import FakeProducer
+from tests.test_helpers.ca_fakes import FakeContext as CAFakeContext
+from tests.test_helpers.ca_updates import ca_update
+from tests.test_helpers.p4p_fakes import FakeContext as PVAFakeContext
+
+
+def _pva_update(value: float):
+    return NTScalar("d").wrap(value, timestamp=time.time())
+
+
+def _f144_values(producer: FakeProducer):
+    return [
+        np.asarray(deserialise_f144(payload).value).tolist()
+        for payload in producer.published_payloads
+        if get_schema(payload) == "f144"
+    ]
+
+
+def _record_ca_updates(file_name, values):
+    recorder = UpdateRecorder(file_name)
+    context = CAFakeContext()
+    producer = FakeProducer()
+    channel = Channel("SIM:PV", EpicsProtocol.CA, "data", "f144")
+    handler = CAUpdateHandler(
+        context,  # type: ignore
+        "SIM:PV",
+        create_serialiser_list(producer, "SIM:PV", "data", "f144", EpicsProtocol.CA),  # type: ignore
+        recorder=recorder.channel(channel),
+    )
+    context.call_connection_state_callback_with_fake_state_change("connected")
+    for value in values:
+        context.call_monitor_callback_with_fake_pv_update(ca_update([value, value * 2]))
+    handler.stop()
+    recorder.stop()
+    return producer
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        NTScalar("d", display=True).wrap(4.2, timestamp=1700000000.5),
+        NTScalar("ai").wrap(np.array([1, 2, 3], dtype=np.int32)),
+        NTScalar("as").wrap(["a", "bc"]),
+        NTEnum().wrap({"index": 1, "choices": ["OFF", "ON"]}),
+        NTTable([("a", "d"), ("b", "s")]).wrap([{"a": 1.0, "b": "x"}]),
+    ],
+)
+def test_pva_values_are_decoded_as_they_were_encoded(value):
+    fields = value.type().aspy()[2]
+    payload = bytearray()
+    encode_pva_fields(fields, value.todict(), payload)
+
+    decoded, offset = decode_pva_fields(fields, bytes(payload))
+
+    assert offset == len(payload)
+    np.testing.assert_equal(decoded, value.todict())
+
+
+def test_ca_updates_are_recorded_with_their_channel(tmp_path):
+    file_name = str(tmp_path / "updates.rec")
+    _record_ca_updates(file_name, [1.0, 2.0])
+
+    records = list(read_recording(file_name))
+
+    assert [record.kind for record in records] == [
+        RECORD_CHANNEL,
+        RECORD_CA_CONNECTION,
+        RECORD_CA_UPDATE,
+        RECORD_CA_UPDATE,
+    ]
+    assert records[1].payload == b"connected"
+    assert all(record.channel_id == records[0].channel_id for record in records)
+
+
+def test_replayed_ca_updates_are_forwarded_as_when_they_were_recorded(tmp_path):
+    file_name = str(tmp_path / "updates.rec")
+    recorded_producer = _record_ca_updates(file_name, [1.0, 2.0, 3.0])
+    producer = FakeProducer()
+
+    Replayer(producer, speed=None).replay(file_name)  # type: ignore
+
+    assert _f144_values(producer) == _f144_values(recorded_producer)
+    assert _f144_values(producer) == [[1.0, 2.0], [2.0, 4.0], [3.0, 6.0]]
+    ep01_messages = [
+        deserialise_ep01(payload)
+        for payload in producer.published_payloads
+        if get_schema(payload) == "ep01"
+    ]
+    assert [message.status for message in ep01_messages] == [ConnectionInfo.CONNECTED]
+
+
+def test_replayed_pva_updates_are_forwarded_as_when_they_were_recorded(tmp_path):
+    file_name = str(tmp_path / "updates.rec")
+    recorder = UpdateRecorder(file_name)
+    context = PVAFakeContext()
+    channel = Channel("SIM:PV", EpicsProtocol.PVA, "data", "f144")
+    handler = PVAUpdateHandler(
+        context,  # type: ignore
+        "SIM:PV",
+        create_serialiser_list(FakeProducer(), "SIM:PV", "data", "f144", EpicsProtocol.PVA),  # type: ignore
+        recorder=recorder.channel(channel),
+    )
+    context.call_monitor_callback_with_fake_pv_update(_pva_update(1.5))
+    context.call_monitor_callback_with_fake_pv_update(_pva_update(2.5))
+    context.call_monitor_callback_with_fake_pv_update(Disconnected())
+    handler.stop()
+    recorder.stop()
+    producer = FakeProducer()
+
+    Replayer(producer, speed=None).replay(file_name)  # type: ignore
+
+    assert [record.kind for record in read_recording(file_name)] == [
+        RECORD_CHANNEL,
+        RECORD_PVA_TYPE,
+        RECORD_PVA_UPDATE,
+        RECORD_PVA_UPDATE,
+        RECORD_PVA_ERROR,
+    ]
+    assert _f144_values(producer) == [1.5, 2.5]
+
+
+def test_updates_which_cannot_be_recorded_are_skipped(tmp_path):
+    file_name = str(tmp_path / "updates.rec")
+    recorder = UpdateRecorder(file_name)
+    channel_recorder = recorder.channel(
+        Channel("SIM:PV", EpicsProtocol.PVA, "data", "f144")
+    )
+
+    channel_recorder.pva_update(NTScalar("v").wrap(1.0))
+    recorder.stop()
+
+    assert recorder.skipped_updates == 1
+    assert [record.kind for record in read_recording(file_name)] == [RECORD_CHANNEL]
+
+
+def test_replay_is_paced_by_the_recorded_arrival_times(tmp_path):
+    file_name = str(tmp_path / "updates.rec")
+    recorder = UpdateRecorder(file_name)
+    channel_recorder = recorder.channel(
+        Channel("SIM:PV", EpicsProtocol.CA, "data", "f144")
+    )
+    channel_recorder.ca_update(ca_update([1.0, 2.0]))
+    time.sleep(0.05)
+    channel_recorder.ca_update(ca_update([2.0, 4.0]))
+    recorder.stop()
+    replayer = Replayer(FakeProducer(), speed=0.5)  # type: ignore
+
+    elapsed_s = replayer.replay(file_name)
+
+    assert elapsed_s >= 0.1
+    assert replayer.replayed_updates == 2
+
+
+def test_records_with_an_unknown_kind_or_channel_are_skipped_on_replay(
+    tmp_path, caplog
+):
+    file_name = str(tmp_path / "updates.rec")
+    recorder = UpdateRecorder(file_name)
+    channel_recorder = recorder.channel(
+        Channel("SIM:PV", EpicsProtocol.CA, "data", "f144")
+    )
+    channel_recorder.ca_update(ca_update([1.0, 2.0]))
+    recorder.write(0, 99, b"")
+    recorder.write(7, RECORD_CA_UPDATE, b"")
+    channel_recorder.ca_update(ca_update([2.0, 4.0]))
+    recorder.stop()
+    producer = FakeProducer()
+    replayer = Replayer(producer, speed=None)  # type: ignore
+
+    replayer.replay(file_name)
+
+    assert replayer.replayed_updates == 2
+    assert _f144_values(producer) == [[1.0, 2.0], [2.0, 4.0]]
+    assert len([r for r in caplog.records if "Skipping record" in r.message]) == 2
+
+
+def test_partly_written_record_at_the_end_of_a_recording_is_ignored(tmp_path):
+    file_name = str(tmp_path / "updates.rec")
+    _record_ca_updates(file_name, [1.0])
+    with open(file_name, "rb") as file:
+        contents = file.read()
+    with open(file_name, "wb") as file:
+        file.write(contents[:-3])
+
+    assert [record.kind for record in read_recording(file_name)] == [
+        RECORD_CHANNEL,
+        RECORD_CA_CONNECTION,
+    ]
+
+
+def test_file_which_is_not_a_recording_is_rejected(tmp_path):
+    file_name = tmp_path / "updates.rec"
+    file_name.write_bytes(FILE_MARKER[:-1] + b"\n")
+
+    with pytest.raises(ValueError):
+        list(read_recording(str(file_name)))
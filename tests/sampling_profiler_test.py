@@ -0,0 +1,65 @@
+import time
+from threading import Event, Thread
+
+import pytest
+
+from forwarder.sampling_profiler import SamplingProfiler
+
+
+def _busy_waiting_for_profiler(stop: Event):
+    while not stop.is_set():
+        sum(range(100))
+
+
+@pytest.fixture
+def busy_thread():
+    stop = Event()
+    thread = Thread(target=_busy_waiting_for_profiler, args=(stop,), name="busy")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+def _read_stacks(file_name: str):
+    with open(file_name) as file:
+        return [line.rsplit(" ", 1) for line in file.read().splitlines()]
+
+
+def test_profile_is_written_after_duration(tmp_path, busy_thread):
+    profiler = SamplingProfiler(str(tmp_path), sample_rate_hz=200, duration_s=0.2)
+
+    profiler.toggle()
+    time.sleep(0.1)
+    assert profiler.running
+    profiler.stop(timeout_s=5)
+
+    assert not profiler.running
+    assert profiler.last_output_file is not None
+    stacks = _read_stacks(profiler.last_output_file)
+    busy_stacks = [
+        int(count)
+        for stack, count in stacks
+        if stack.startswith("busy;") and "_busy_waiting_for_profiler" in stack
+    ]
+    assert sum(busy_stacks) > 0
+    assert not any(stack.startswith("sampling_profiler;") for stack, _ in stacks)
+
+
+def test_toggling_again_stops_profiling_early(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), sample_rate_hz=100, duration_s=60)
+
+    profiler.toggle()
+    start = time.monotonic()
+    profiler.toggle()
+    while profiler.running and time.monotonic() - start < 5:
+        time.sleep(0.01)
+
+    assert not profiler.running
+    assert time.monotonic() - start < 5
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_sample_rate_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        SamplingProfiler(str(tmp_path), sample_rate_hz=0)
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+from typing import Set
+
+import pytest
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+def _imported_modules(code: str) -> Set[str]:
+    """
+    Runs code in a new interpreter and returns the modules it imported, taken
+    from sys.modules so that modules imported with importlib are included.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"{code}\nimport sys\nprint('\\n'.join(sys.modules))",
+        ],
+        cwd=REPOSITORY_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_entry_point_does_not_import_epics_clients_or_serialisers():
+    imported = _imported_modules("import forwarder.scripts.run")
+
+    for module in (
+        "p4p",
+        "caproto.threading.client",
+        "graypy",
+        "forwarder.update_handlers.ca_update_handler",
+        "forwarder.update_handlers.pva_update_handler",
+        "forwarder.update_handlers.fake_update_handler",
+        "forwarder.update_handlers.f144_serialiser",
+    ):
+        assert module not in imported
+
+
+def test_ca_f144_serialiser_does_not_import_p4p_or_other_schemas():
+    imported = _imported_modules(
+        "from forwarder.common import EpicsProtocol\n"
+        "from forwarder.update_handlers.schema_serialiser_factory import SerialiserFactory\n"
+        "SerialiserFactory.create_serialiser(EpicsProtocol.CA, 'f144', 'SIM:PV')\n"
+        "SerialiserFactory.create_serialiser(EpicsProtocol.CA, 'al00', 'SIM:PV')\n"
+    )
+
+    assert "forwarder.update_handlers.f144_serialiser" in imported
+    assert "forwarder.update_handlers.tdct_serialiser" not in imported
+    assert "p4p" not in imported
+
+
+@pytest.mark.parametrize("protocol", ["CA", "PVA", "FAKE"])
+def test_all_registered_serialisers_can_be_resolved(protocol):
+    from forwarder.common import EpicsProtocol
+    from forwarder.update_handlers.schema_serialiser_factory import SerialiserFactory
+
+    for schema in SerialiserFactory.get_schemas(EpicsProtocol[protocol]):
+        serialiser = SerialiserFactory.create_serialiser(
+            EpicsProtocol[protocol], schema, "SIM:PV"
+        )
+        assert hasattr(serialiser, "serialise")
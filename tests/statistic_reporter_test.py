@@ -1,12 +1,13 @@
 import logging
+import queue
 from typing import Dict
 from unittest.mock import ANY, MagicMock, call
 
 from confluent_kafka import KafkaError
 
 from forwarder.kafka.kafka_producer import KafkaProducer
-from forwarder.statistics_reporter import StatisticsReporter
-from forwarder.utils import Counter
+from forwarder.statistics_reporter import BatchedSender, StatisticsReporter
+from forwarder.utils import Counter, LabelledCounter
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -157,3 +158,157 @@ def test_statistic_reporter_sends_delivery_errors():
         call("kafka_delivery_errors", 3, ANY),
     ]
     statistics_reporter._sender.send.assert_has_calls(calls, any_order=True)
+
+
+def test_statistic_reporter_sends_throttled_updates_if_counted():
+    throttled_counter = Counter()
+    throttled_counter.increment()
+    statistics_reporter = StatisticsReporter(
+        "localhost",
+        {},
+        Counter(),
+        buffer_err_counter,
+        Counter(),
+        logger,
+        update_throttled_counter=throttled_counter,
+    )
+    statistics_reporter._sender = MagicMock()
+
+    statistics_reporter.send_statistics()
+
+    statistics_reporter._sender.send.assert_has_calls(
+        [call("throttled_updates", 1, ANY)], any_order=True
+    )
+
+
+def test_statistic_reporter_sends_update_rate_since_last_send():
+    update_msg_counter = Counter()
+    statistics_reporter = StatisticsReporter(
+        "localhost", {}, update_msg_counter, Counter(), Counter(), logger
+    )
+    statistics_reporter._sender = MagicMock()
+    statistics_reporter._last_sent_s -= 2.0
+    for _ in range(10):
+        update_msg_counter.increment()
+
+    statistics_reporter.send_statistics()
+
+    (update_rate,) = [
+        sent_call.args[1]
+        for sent_call in statistics_reporter._sender.send.call_args_list
+        if sent_call.args[0] == "update_rate"
+    ]
+    assert 4.0 < update_rate <= 5.0
+    # The total is not reset by calculating the rate
+    statistics_reporter._sender.send.assert_has_calls(
+        [call("total_updates", 10, ANY)], any_order=True
+    )
+
+
+def test_producer_counts_delivery_errors_by_type():
+    class FakeProducer:
+        def produce(self, topic, payload, key, on_delivery, timestamp):
+            on_delivery(KafkaError(KafkaError._MSG_TIMED_OUT), "some error message")
+
+        def flush(self, _):
+            pass
+
+        def poll(self, _):
+            pass
+
+    delivery_err_type_counter = LabelledCounter()
+    kafka_producer = KafkaProducer(
+        FakeProducer(), update_delivery_err_type_counter=delivery_err_type_counter
+    )
+    kafka_producer.produce("IRRELEVANT_TOPIC", b"IRRELEVANT_PAYLOAD", 0, key="PV_NAME")
+    kafka_producer.close()
+
+    statistics_reporter = StatisticsReporter(
+        "localhost",
+        {},
+        Counter(),
+        Counter(),
+        Counter(),
+        logger,
+        update_delivery_err_type_counter=delivery_err_type_counter,
+    )
+    statistics_reporter._sender = MagicMock()
+    statistics_reporter.send_statistics()
+
+    statistics_reporter._sender.send.assert_has_calls(
+        [call("kafka_delivery_errors._msg_timed_out", 1, ANY)], any_order=True
+    )
+
+
+class RecordingSender(BatchedSender):
+    def __init__(self, fail: bool = False, max_pending_batches: int = 100):
+        self.sent: "queue.Queue[bytes]" = queue.Queue()
+        self.fail = fail
+        super().__init__("localhost", max_pending_batches=max_pending_batches)
+
+    def send_message(self, message):
+        if self.fail:
+            self.sent.put(b"")
+            raise ConnectionRefusedError
+        self.sent.put(message)
+
+
+def test_metrics_of_an_interval_are_sent_in_one_batch():
+    sender = RecordingSender()
+    try:
+        sender.send("metric_a", 1, 100)
+        sender.send("metric_b", 2.5, 100)
+        sender.flush()
+
+        assert sender.sent.get(timeout=5) == b"metric_a 1 100\nmetric_b 2.5 100\n"
+    finally:
+        sender.stop()
+
+
+def test_batches_are_kept_until_carbon_server_can_be_reached():
+    sender = RecordingSender(fail=True, max_pending_batches=2)
+    try:
+        for value in range(3):
+            sender.send("metric", value, 100)
+            sender.flush()
+            sender.sent.get(timeout=5)
+        sender.fail = False
+        sender.send("metric", 3, 100)
+        sender.flush()
+
+        # Only the newest two batches were kept
+        assert sender.sent.get(timeout=5) == b"metric 2 100\nmetric 3 100\n"
+        assert sender.dropped_batches > 0
+    finally:
+        sender.stop()
+
+
+def test_statistic_reporter_sends_rates_per_topic():
+    topic_counter = LabelledCounter()
+    topic_bytes_counter = LabelledCounter()
+    statistics_reporter = StatisticsReporter(
+        "localhost",
+        {},
+        Counter(),
+        Counter(),
+        Counter(),
+        logger,
+        update_topic_counter=topic_counter,
+        update_topic_bytes_counter=topic_bytes_counter,
+    )
+    statistics_reporter._sender = MagicMock()
+    statistics_reporter._last_sent_s -= 2.0
+    for _ in range(4):
+        topic_counter.increment("motion.data")
+        topic_bytes_counter.increment("motion.data", 100)
+
+    statistics_reporter.send_statistics()
+
+    sent = {
+        sent_call.args[0]: sent_call.args[1]
+        for sent_call in statistics_reporter._sender.send.call_args_list
+    }
+    assert 1.0 < sent["topics.motion_data.update_rate"] <= 2.0
+    assert 100 < sent["topics.motion_data.update_bytes_rate"] <= 200
+    assert sent["update_bytes_rate"] == sent["topics.motion_data.update_bytes_rate"]
+    statistics_reporter._sender.flush.assert_called_once()
@@ -1,11 +1,13 @@
 import json
 import logging
 from typing import Dict
+from unittest import mock
 
-from streaming_data_types.status_x5f2 import deserialise_x5f2
+from streaming_data_types.status_x5f2 import deserialise_x5f2, serialise_x5f2
 
 from forwarder.common import Channel, EpicsProtocol
-from forwarder.status_reporter import StatusReporter
+from forwarder.fleet import fleet_name_from_status
+from forwarder.status_reporter import STATUS_MODE_SUMMARY, StatusReporter
 from tests.kafka.fake_producer import FakeProducer
 
 logger = logging.getLogger("stub_for_use_in_tests")
@@ -65,3 +67,129 @@ def test_status_message_contains_service_id():
     if fake_producer.published_payloads:
         deserialised_payload = deserialise_x5f2(fake_producer.published_payloads[-1])
     assert deserialised_payload.service_id == service_id
+
+
+def _reported_channel_names(fake_producer: FakeProducer):
+    deserialised_payload = deserialise_x5f2(fake_producer.published_payloads[-1])
+    return [
+        stream["channel_name"]
+        for stream in json.loads(deserialised_payload.status_json)["streams"]
+    ]
+
+
+def test_status_is_only_updated_after_streams_change():
+    update_handlers: Dict = {
+        Channel("channel_1", EpicsProtocol.CA, "topic", "f144"): 1,
+    }
+    fake_producer = FakeProducer()
+    status_reporter = StatusReporter(update_handlers, fake_producer, "status_topic", "", "version", logger)  # type: ignore
+
+    update_handlers[Channel("channel_2", EpicsProtocol.PVA, "topic", "f144")] = 2
+    status_reporter.report_status()
+    assert _reported_channel_names(fake_producer) == ["channel_1"]
+
+    status_reporter.streams_changed()
+    status_reporter.report_status()
+    assert _reported_channel_names(fake_producer) == ["channel_1", "channel_2"]
+
+    del update_handlers[Channel("channel_1", EpicsProtocol.CA, "topic", "f144")]
+    status_reporter.streams_changed()
+    status_reporter.report_status()
+    assert _reported_channel_names(fake_producer) == ["channel_2"]
+
+
+def test_status_message_is_reused_while_streams_are_unchanged():
+    update_handlers: Dict = {
+        Channel("channel_1", EpicsProtocol.CA, "topic", "f144"): 1,
+    }
+    fake_producer = FakeProducer()
+    status_reporter = StatusReporter(update_handlers, fake_producer, "status_topic", "", "version", logger)  # type: ignore
+
+    with mock.patch(
+        "forwarder.status_reporter.serialise_x5f2", wraps=serialise_x5f2
+    ) as serialise:
+        status_reporter.report_status()
+        status_reporter.report_status()
+        assert serialise.call_count == 1
+
+        status_reporter.streams_changed()
+        status_reporter.report_status()
+        assert serialise.call_count == 2
+
+    stream = json.loads(
+        deserialise_x5f2(fake_producer.published_payloads[-1]).status_json
+    )["streams"][0]
+    assert stream == {
+        "channel_name": "channel_1",
+        "protocol": "CA",
+        "output_topic": "topic",
+        "schema": "f144",
+    }
+
+
+def _status_jsons(fake_producer: FakeProducer):
+    return [
+        json.loads(deserialise_x5f2(payload).status_json)
+        for payload in fake_producer.published_payloads
+    ]
+
+
+def test_summary_mode_lists_streams_in_chunks_only_when_they_change():
+    update_handlers: Dict = {
+        Channel(f"channel_{index}", EpicsProtocol.CA, "topic", "f144"): index
+        for index in range(5)
+    }
+    update_handlers[Channel("table", EpicsProtocol.PVA, "other", "nttable_se00")] = 5
+    fake_producer = FakeProducer()
+    status_reporter = StatusReporter(update_handlers, fake_producer, "status_topic", "", "version", logger, mode=STATUS_MODE_SUMMARY, listing_chunk_size=4)  # type: ignore
+
+    status_reporter.report_status()
+    status_reporter.report_status()
+
+    first_chunk, second_chunk, summary, repeated_summary = _status_jsons(fake_producer)
+    assert (first_chunk["chunk"], first_chunk["chunks"]) == (0, 2)
+    assert (second_chunk["chunk"], second_chunk["chunks"]) == (1, 2)
+    assert len(first_chunk["streams"]) + len(second_chunk["streams"]) == 6
+    assert summary == repeated_summary
+    assert summary["stream_count"] == 6
+    assert summary["listing_version"] == first_chunk["listing_version"]
+    assert summary["streams_per_topic"] == {"topic": 5, "other": 1}
+    assert summary["streams_per_schema"] == {"f144": 5, "nttable_se00": 1}
+
+    del update_handlers[Channel("table", EpicsProtocol.PVA, "other", "nttable_se00")]
+    status_reporter.streams_changed()
+    status_reporter.report_status()
+
+    *_, new_first_chunk, new_second_chunk, new_summary = _status_jsons(fake_producer)
+    assert new_summary["listing_version"] == summary["listing_version"] + 1
+    assert new_summary["streams_per_topic"] == {"topic": 5}
+    assert len(new_first_chunk["streams"]) + len(new_second_chunk["streams"]) == 5
+
+
+def test_summary_mode_with_no_streams_publishes_an_empty_listing():
+    fake_producer = FakeProducer()
+    status_reporter = StatusReporter({}, fake_producer, "status_topic", "", "version", logger, mode=STATUS_MODE_SUMMARY)  # type: ignore
+
+    status_reporter.report_status()
+
+    listing, summary = _status_jsons(fake_producer)
+    assert listing["streams"] == []
+    assert listing["chunks"] == 1
+    assert summary["stream_count"] == 0
+
+
+def test_fleet_name_is_the_first_field_of_every_status_message():
+    update_handlers: Dict = {
+        Channel("channel_1", EpicsProtocol.CA, "topic", "f144"): 1,
+    }
+    fake_producer = FakeProducer()
+    full_reporter = StatusReporter(update_handlers, fake_producer, "status_topic", "", "version", logger, fleet_name="fleet_1")  # type: ignore
+    summary_reporter = StatusReporter(update_handlers, fake_producer, "status_topic", "", "version", logger, mode=STATUS_MODE_SUMMARY, fleet_name="fleet_1")  # type: ignore
+
+    full_reporter.report_status()
+    summary_reporter.report_status()
+
+    for payload in fake_producer.published_payloads:
+        status_json = deserialise_x5f2(payload).status_json
+        assert fleet_name_from_status(status_json) == "fleet_1"
+        assert json.loads(status_json)["fleet"] == "fleet_1"
@@ -1,7 +1,7 @@
-from unittest import mock
+import logging
+import time
 
 import pytest
-from confluent_kafka import Consumer
 from streaming_data_types.fbschemas.forwarder_config_update_rf5k.UpdateType import (
     UpdateType,
 )
@@ -11,9 +11,16 @@ from streaming_data_types.forwarder_config_update_rf5k import (
     serialise_rf5k,
 )
 
-from forwarder.common import Channel, EpicsProtocol, config_change_to_command_type
-from forwarder.configuration_store import ConfigurationStore
+from forwarder.common import (
+    Channel,
+    CommandType,
+    ConfigUpdate,
+    EpicsProtocol,
+    config_change_to_command_type,
+)
+from forwarder.configuration_store import DELTA_KEY, SNAPSHOT_KEY, ConfigurationStore
 from forwarder.parse_config_update import parse_config_update
+from tests.kafka.fake_consumer import FakeConsumer
 from tests.kafka.fake_producer import FakeProducer
 
 DUMMY_UPDATE_HANDLER = None
@@ -36,14 +43,6 @@ STREAMS_TO_RETRIEVE = [
 ]
 
 
-class FakeKafkaMessage:
-    def __init__(self, message):
-        self._message = message
-
-    def value(self):
-        return self._message
-
-
 def assert_stored_channel_correct(outputted_channel):
     # Will only be found if key exists and as the key is the channel
     # it will only match if the values are exactly the same.
@@ -79,26 +78,18 @@ def test_when_no_pvs_stored_message_type_is_remove_all():
 
 
 def test_retrieving_stored_info_with_no_pvs_gets_message_without_streams():
-    mock_consumer = mock.create_autospec(Consumer)
-    mock_consumer.get_watermark_offsets.return_value = (0, 100)
     message = serialise_rf5k(UpdateType.REMOVEALL, [])
-    mock_consumer.consume.return_value = [FakeKafkaMessage(message)]
-    store = ConfigurationStore(
-        producer=None, consumer=mock_consumer, topic="store_topic"
-    )
+    consumer = FakeConsumer([(message, None)] * 100)
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
 
     config = parse_config_update(store.retrieve_configuration())
     assert config.channels is None
 
 
 def test_retrieving_stored_info_with_multiple_pvs_gets_streams():
-    mock_consumer = mock.create_autospec(Consumer)
-    mock_consumer.get_watermark_offsets.return_value = (0, 100)
     message = serialise_rf5k(UpdateType.ADD, STREAMS_TO_RETRIEVE)
-    mock_consumer.consume.return_value = [FakeKafkaMessage(message)]
-    store = ConfigurationStore(
-        producer=None, consumer=mock_consumer, topic="store_topic"
-    )
+    consumer = FakeConsumer([(message, None)] * 100)
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
 
     config = parse_config_update(store.retrieve_configuration())
     channels = config.channels
@@ -110,24 +101,15 @@ def test_retrieving_stored_info_with_multiple_pvs_gets_streams():
 def test_retrieve_config_find_valid_message_amongst_junk():
     message = serialise_rf5k(UpdateType.ADD, STREAMS_TO_RETRIEVE)
     messages_in_storage_topic = [
-        [FakeKafkaMessage(":: SOME JUNK MESSAGE 1 ::")],
-        [FakeKafkaMessage(":: SOME JUNK MESSAGE 2 ::")],
-        [FakeKafkaMessage(message)],
-        [FakeKafkaMessage(":: SOME JUNK MESSAGE 3 ::")],
-        [FakeKafkaMessage(":: SOME JUNK MESSAGE 4 ::")],
-    ]  # type: ignore
-
-    mock_consumer = mock.create_autospec(Consumer)
-    mock_consumer.get_watermark_offsets.return_value = (
-        0,
-        len(messages_in_storage_topic),
-    )
-
-    mock_consumer.consume.side_effect = messages_in_storage_topic
-
-    store = ConfigurationStore(
-        producer=None, consumer=mock_consumer, topic="store_topic"
-    )
+        (b":: SOME JUNK MESSAGE 1 ::", None),
+        (b":: SOME JUNK MESSAGE 2 ::", None),
+        (message, None),
+        (b":: SOME JUNK MESSAGE 3 ::", None),
+        (b":: SOME JUNK MESSAGE 4 ::", None),
+    ]
+    consumer = FakeConsumer(messages_in_storage_topic)  # type: ignore
+
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
     config = parse_config_update(store.retrieve_configuration())
     channels = config.channels
     assert_stored_channel_correct(channels[0])  # type: ignore
@@ -136,35 +118,270 @@ def test_retrieve_config_find_valid_message_amongst_junk():
 
 def test_retrieve_config_with_only_junk_as_message_in_storage_topic():
     messages_in_storage_topic = [
-        [FakeKafkaMessage(":: SOME JUNK MESSAGE 1 ::")],
-        [FakeKafkaMessage(":: SOME JUNK MESSAGE 2 ::")],
-        [FakeKafkaMessage(":: SOME JUNK MESSAGE 3 ::")],
-    ]  # type: ignore
-    mock_consumer = mock.create_autospec(Consumer)
-    mock_consumer.get_watermark_offsets.return_value = (
-        0,
-        len(messages_in_storage_topic),
+        (b":: SOME JUNK MESSAGE 1 ::", None),
+        (b":: SOME JUNK MESSAGE 2 ::", None),
+        (b":: SOME JUNK MESSAGE 3 ::", None),
+    ]
+    consumer = FakeConsumer(messages_in_storage_topic)  # type: ignore
+
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
+    with pytest.raises(RuntimeError):
+        store.retrieve_configuration()
+
+
+def test_retrieve_config_with_empty_storage_topic():
+    consumer = FakeConsumer([])
+
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
+    with pytest.raises(RuntimeError):
+        store.retrieve_configuration()
+
+
+def test_first_save_stores_a_snapshot_and_later_changes_store_only_deltas():
+    producer = FakeProducer()
+    store = ConfigurationStore(producer, consumer=None, topic="store_topic")
+    channels = dict(CHANNELS_TO_STORE)
+
+    store.save_configuration(channels)
+    new_channel = Channel("channel3", EpicsProtocol.CA, "topic3", "f144")
+    channels[new_channel] = DUMMY_UPDATE_HANDLER
+    store.save_configuration(channels)
+
+    assert producer.published_keys == [SNAPSHOT_KEY, DELTA_KEY]
+    delta = parse_config_update(producer.published_payloads[-1])
+    assert delta.command_type == CommandType.ADD
+    assert delta.channels == (new_channel,)
+
+
+def test_removing_a_channel_stores_a_remove_delta():
+    producer = FakeProducer()
+    store = ConfigurationStore(producer, consumer=None, topic="store_topic")
+    channels = dict(CHANNELS_TO_STORE)
+    store.save_configuration(channels)
+
+    removed_channel = next(iter(channels))
+    del channels[removed_channel]
+    store.save_configuration(channels)
+
+    delta = parse_config_update(producer.published_payloads[-1])
+    assert producer.published_keys[-1] == DELTA_KEY
+    assert delta.command_type == CommandType.REMOVE
+    assert delta.channels == (removed_channel,)
+
+
+def test_nothing_is_stored_when_configuration_is_unchanged():
+    producer = FakeProducer()
+    store = ConfigurationStore(producer, consumer=None, topic="store_topic")
+
+    store.save_configuration(CHANNELS_TO_STORE)
+    store.save_configuration(CHANNELS_TO_STORE)
+
+    assert producer.messages_published == 1
+
+
+def test_empty_configuration_is_only_stored_once():
+    producer = FakeProducer()
+    store = ConfigurationStore(producer, consumer=None, topic="store_topic")
+
+    store.save_configuration(CHANNELS_TO_STORE)
+    store.save_configuration({})
+    store.save_configuration({})
+
+    assert producer.messages_published == 2
+    assert parse_config_update(producer.published_payloads[-1]).channels is None
+
+
+def test_snapshot_is_stored_when_too_many_deltas_accumulate():
+    producer = FakeProducer()
+    store = ConfigurationStore(
+        producer, consumer=None, topic="store_topic", max_deltas_between_snapshots=2
     )
-    mock_consumer.consume.side_effect = messages_in_storage_topic
+    channels = {
+        Channel(f"channel{i}", EpicsProtocol.CA, "topic", "f144"): None
+        for i in range(10)
+    }
+    store.save_configuration(channels)
+    for i in range(3):
+        channels[Channel(f"new_channel{i}", EpicsProtocol.CA, "topic", "f144")] = None
+        store.save_configuration(channels)
+
+    assert producer.published_keys == [SNAPSHOT_KEY, DELTA_KEY, DELTA_KEY, SNAPSHOT_KEY]
+    snapshot = parse_config_update(producer.published_payloads[-1])
+    assert set(snapshot.channels) == set(channels)  # type: ignore
+
 
+def test_snapshot_is_stored_when_the_last_one_is_older_than_the_interval():
+    producer = FakeProducer()
     store = ConfigurationStore(
-        producer=None, consumer=mock_consumer, topic="store_topic"
+        producer, consumer=None, topic="store_topic", snapshot_interval_s=0.05
     )
+    channels = dict(CHANNELS_TO_STORE)
+    store.save_configuration(channels)
+    store.save_snapshot_if_due()
+    channels[Channel("channel3", EpicsProtocol.CA, "topic3", "f144")] = None
+    store.save_configuration(channels)
+    assert producer.published_keys == [SNAPSHOT_KEY, DELTA_KEY]
+
+    time.sleep(0.06)
+    store.save_snapshot_if_due()
+
+    assert producer.published_keys == [SNAPSHOT_KEY, DELTA_KEY, SNAPSHOT_KEY]
+    snapshot = parse_config_update(producer.published_payloads[-1])
+    assert set(snapshot.channels) == set(channels)  # type: ignore
+
+
+def test_change_is_stored_as_a_snapshot_when_the_last_one_is_too_old():
+    producer = FakeProducer()
+    store = ConfigurationStore(
+        producer, consumer=None, topic="store_topic", snapshot_interval_s=0
+    )
+    channels = dict(CHANNELS_TO_STORE)
+    store.save_configuration(channels)
+    channels[Channel("channel3", EpicsProtocol.CA, "topic3", "f144")] = None
+    store.save_configuration(channels)
+
+    assert producer.published_keys == [SNAPSHOT_KEY, SNAPSHOT_KEY]
+
+
+def test_nothing_is_stored_by_the_interval_before_the_first_save():
+    producer = FakeProducer()
+    store = ConfigurationStore(
+        producer, consumer=None, topic="store_topic", snapshot_interval_s=0
+    )
+
+    store.save_snapshot_if_due()
+
+    assert producer.messages_published == 0
+
+
+def test_retrieve_config_folds_deltas_into_last_snapshot():
+    producer = FakeProducer()
+    store = ConfigurationStore(producer, consumer=None, topic="store_topic")
+    channels = dict(CHANNELS_TO_STORE)
+    store.save_configuration(channels)
+    del channels[next(iter(channels))]
+    store.save_configuration(channels)
+    new_channel = Channel("channel3", EpicsProtocol.CA, "topic3", "f144")
+    channels[new_channel] = DUMMY_UPDATE_HANDLER
+    store.save_configuration(channels)
+
+    consumer = FakeConsumer(
+        list(zip(producer.published_payloads, producer.published_keys))
+    )
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
+    config = parse_config_update(store.retrieve_configuration())
+
+    assert config.command_type == CommandType.ADD
+    assert set(config.channels) == set(channels)  # type: ignore
+
+
+def test_retrieve_config_reads_thousands_of_offsets_in_few_batches():
+    snapshot = serialise_rf5k(UpdateType.ADD, STREAMS_TO_RETRIEVE[:1])
+    delta = serialise_rf5k(UpdateType.ADD, STREAMS_TO_RETRIEVE[1:])
+    junk = (b":: SOME JUNK MESSAGE ::", None)
+    messages_in_storage_topic = (
+        [(snapshot, SNAPSHOT_KEY)]
+        + [junk] * 3000
+        + [(delta, DELTA_KEY)]
+        + [junk] * 1000
+    )
+    consumer = FakeConsumer(messages_in_storage_topic, low_offset=12345)  # type: ignore
+
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
+    config = parse_config_update(store.retrieve_configuration())
+
+    assert set(config.channels) == set(CHANNELS_TO_STORE)  # type: ignore
+    assert consumer.consume_calls < 20
+
+
+def test_retrieve_config_when_the_last_offsets_hold_no_messages():
+    snapshot = serialise_rf5k(UpdateType.ADD, STREAMS_TO_RETRIEVE)
+    consumer = FakeConsumer([(snapshot, SNAPSHOT_KEY)], trailing_offsets=2)
+
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
+    config = parse_config_update(store.retrieve_configuration(timeout_s=1.0))
+
+    assert set(config.channels) == set(CHANNELS_TO_STORE)  # type: ignore
+
+
+def test_undecodable_delta_is_skipped_with_a_warning(caplog):
+    snapshot = serialise_rf5k(UpdateType.ADD, STREAMS_TO_RETRIEVE)
+    consumer = FakeConsumer(
+        [(snapshot, SNAPSHOT_KEY), (b":: SOME JUNK MESSAGE ::", DELTA_KEY)]
+    )
+
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
+    with caplog.at_level(logging.WARNING):
+        config = parse_config_update(store.retrieve_configuration())
+
+    assert set(config.channels) == set(CHANNELS_TO_STORE)  # type: ignore
+    assert "offset 1" in caplog.text
+
+
+def test_retrieve_config_gives_up_at_deadline():
+    class SilentConsumer(FakeConsumer):
+        def consume(self, num_messages=1, timeout=-1):
+            return []
+
+    consumer = SilentConsumer([(b":: SOME JUNK MESSAGE ::", None)] * 10)
+
+    store = ConfigurationStore(producer=None, consumer=consumer, topic="store_topic")
     with pytest.raises(RuntimeError):
-        store.retrieve_configuration()
+        store.retrieve_configuration(timeout_s=0.01)
 
 
-def test_retrieve_config_with_empty_storage_topic():
-    messages_in_storage_topic = []  # type: ignore
-    mock_consumer = mock.create_autospec(Consumer)
-    mock_consumer.get_watermark_offsets.return_value = (
-        0,
-        len(messages_in_storage_topic),
+def test_retrieved_configuration_is_stored_as_a_snapshot_and_later_changes_are_deltas(
+    tmp_path,
+):
+    producer = FakeProducer()
+    cache_file = str(tmp_path / "forwarder_config.cache")
+    store = ConfigurationStore(
+        producer, consumer=None, topic="store_topic", cache_file=cache_file
     )
-    mock_consumer.consume.side_effect = messages_in_storage_topic
 
+    store.set_stored_configuration(
+        ConfigUpdate(CommandType.ADD, tuple(CHANNELS_TO_STORE))
+    )
+    store.save_configuration(CHANNELS_TO_STORE)
+
+    assert producer.published_keys == [SNAPSHOT_KEY]
+    snapshot = parse_config_update(producer.published_payloads[-1])
+    assert set(snapshot.channels) == set(CHANNELS_TO_STORE)  # type: ignore
+    cached = parse_config_update(store.retrieve_cached_configuration())
+    assert set(cached.channels) == set(CHANNELS_TO_STORE)  # type: ignore
+
+    channels = dict(CHANNELS_TO_STORE)
+    channels[Channel("channel3", EpicsProtocol.CA, "topic3", "f144")] = None
+    store.save_configuration(channels)
+
+    assert producer.published_keys == [SNAPSHOT_KEY, DELTA_KEY]
+
+
+def test_cache_file_holds_full_configuration_after_each_change(tmp_path):
+    cache_file = str(tmp_path / "forwarder_config.cache")
+    store = ConfigurationStore(
+        FakeProducer(), consumer=None, topic="store_topic", cache_file=cache_file
+    )
+    channels = dict(CHANNELS_TO_STORE)
+    store.save_configuration(channels)
+    new_channel = Channel("channel3", EpicsProtocol.CA, "topic3", "f144")
+    channels[new_channel] = DUMMY_UPDATE_HANDLER
+    store.save_configuration(channels)
+
+    config = parse_config_update(store.retrieve_cached_configuration())
+
+    assert set(config.channels) == set(channels)  # type: ignore
+    assert [path.name for path in tmp_path.iterdir()] == ["forwarder_config.cache"]
+
+
+def test_retrieving_missing_or_invalid_cache_file_raises(tmp_path):
+    cache_file = tmp_path / "forwarder_config.cache"
     store = ConfigurationStore(
-        producer=None, consumer=mock_consumer, topic="store_topic"
+        FakeProducer(), consumer=None, topic="store_topic", cache_file=str(cache_file)
     )
     with pytest.raises(RuntimeError):
-        store.retrieve_configuration()
+        store.retrieve_cached_configuration()
+
+    cache_file.write_bytes(b":: SOME JUNK ::")
+    with pytest.raises(RuntimeError):
+        store.retrieve_cached_configuration()
@@ -24,10 +24,17 @@ class FakePV:
     def __init__(self, pv_name: str, subscription: FakeSubscription):
         self.name = pv_name
         self.subscription = subscription
+        self.subscribed_data_types: List[str] = []
+        self.read_callbacks: List[Callable] = []
 
     def subscribe(self, data_type: str) -> FakeSubscription:
+        self.subscribed_data_types.append(data_type)
         return self.subscription
 
+    def read(self, data_type: str, wait: bool, callback: Callable):
+        assert not wait, "Reads from update handlers are expected to be non-blocking"
+        self.read_callbacks.append(callback)
+
     @staticmethod
     def unsubscribe_all():
         pass
@@ -36,13 +43,16 @@ class FakePV:
 class FakeContext:
     def __init__(self):
         self.subscription = FakeSubscription()
+        self.pvs: List[FakePV] = []
         self._connection_state_callback: Optional[Callable] = None
 
     def get_pvs(
         self, *pv_names: str, connection_state_callback: Callable
     ) -> List[FakePV]:
         self._connection_state_callback = connection_state_callback
-        return [FakePV(pv_name, self.subscription) for pv_name in pv_names]
+        pvs = [FakePV(pv_name, self.subscription) for pv_name in pv_names]
+        self.pvs.extend(pvs)
+        return pvs
 
     def call_monitor_callback_with_fake_pv_update(self, pv_update: ReadNotifyResponse):
         for c in self.subscription.callback:
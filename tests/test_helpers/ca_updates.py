@@ -0,0 +1,29 @@
+import time
+from typing import Optional
+
+import numpy as np
+from caproto import ChannelType, ReadNotifyResponse, TimeStamp, timestamp_to_epics
+
+
+def ca_update(
+    value,
+    timestamp_s: Optional[float] = None,
+    channel_type: ChannelType = ChannelType.TIME_DOUBLE,
+    dtype=np.float64,
+    severity: int = 0,
+) -> ReadNotifyResponse:
+    """
+    A CA monitor update of a scalar or array value, converted to dtype unless
+    it is None, timestamped now unless a timestamp is given
+    """
+    data = np.atleast_1d(np.asarray(value, dtype=dtype))
+    if timestamp_s is None:
+        timestamp_s = time.time()
+    return ReadNotifyResponse(
+        data,
+        channel_type,
+        data.size,
+        1,
+        1,
+        metadata=(0, severity, TimeStamp(*timestamp_to_epics(timestamp_s))),
+    )
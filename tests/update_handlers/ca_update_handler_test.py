@@ -1,5 +1,6 @@
 import time
 from time import sleep
+from types import SimpleNamespace
 from typing import List
 
 import numpy as np
@@ -26,6 +27,7 @@ from streaming_data_types.timestamps_tdct import deserialise_tdct
 from streaming_data_types.utils import get_schema
 
 from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.ca_control_poller import CAControlPoller
 from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
 from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
 from tests.kafka.fake_producer import FakeProducer
@@ -293,6 +295,36 @@ def test_update_handler_publishes_periodic_update_f144(
     assert (
         len(data_messages) >= 2
     ), "Expected more than the 1 message from triggered update due to periodic updates being active"
+    alarm_messages = [
+        msg for msg in producer.published_payloads if "al00" == get_schema(msg)
+    ]
+    assert (
+        len(alarm_messages) >= 2
+    ), "Expected the cached alarm to be re-published with the periodic updates"
+
+
+def test_alarm_is_serialised_by_the_value_tracker():
+    producer = FakeProducer()
+    trackers = create_serialiser_list(
+        producer,  # type: ignore
+        "source_name",
+        "output_topic",
+        "f144",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+    )
+    assert len(trackers) == 1
+    assert trackers[0].alarm_serialiser is not None
+
+    f142_trackers = create_serialiser_list(
+        producer,  # type: ignore
+        "source_name",
+        "output_topic",
+        "f142",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+    )
+    assert f142_trackers[0].alarm_serialiser is None
 
 
 @pytest.mark.schema("f142")
@@ -508,3 +540,68 @@ def test_handler_publishes_connection_state_change(
     connect_state_output = deserialise_ep01(producer.published_payloads[-1])
     assert connect_state_output.status == state_enum
     assert connect_state_output.source_name == pv_source_name
+
+
+def _create_handler_with_control_poller(poller: CAControlPoller):
+    producer = FakeProducer()
+    context = FakeContext()
+    update_handler = CAUpdateHandler(
+        context,  # type: ignore
+        "source_name",
+        create_serialiser_list(
+            producer,  # type: ignore
+            "source_name",
+            "output_topic",
+            "f144",
+            EpicsProtocol.CA,
+        ),
+        control_poller=poller,
+    )
+    return context, update_handler
+
+
+def _control_response(units: bytes):
+    return SimpleNamespace(metadata=SimpleNamespace(units=units))
+
+
+def test_handler_with_control_poller_does_not_subscribe_to_control():
+    poller = CAControlPoller(refresh_period_ms=60_000)
+    context, update_handler = _create_handler_with_control_poller(poller)
+    try:
+        assert context.pvs[0].subscribed_data_types == ["time"]
+    finally:
+        update_handler.stop()
+        poller.stop()
+
+
+def test_handler_with_control_poller_reads_units_on_connection():
+    poller = CAControlPoller(refresh_period_ms=60_000)
+    context, update_handler = _create_handler_with_control_poller(poller)
+    try:
+        context.call_connection_state_callback_with_fake_state_change("connected")
+
+        assert len(context.pvs[0].read_callbacks) == 1
+        context.pvs[0].read_callbacks[0](_control_response(b"mm"))
+        assert update_handler._current_unit == "mm"
+    finally:
+        update_handler.stop()
+        poller.stop()
+
+
+def test_control_poller_only_refreshes_connected_handlers():
+    poller = CAControlPoller(refresh_period_ms=60_000)
+    context, update_handler = _create_handler_with_control_poller(poller)
+    try:
+        poller.refresh_all()
+        assert len(context.pvs[0].read_callbacks) == 0
+
+        context.call_connection_state_callback_with_fake_state_change("connected")
+        poller.refresh_all()
+        assert len(context.pvs[0].read_callbacks) == 2
+
+        update_handler.stop()
+        poller.refresh_all()
+        assert len(context.pvs[0].read_callbacks) == 2
+    finally:
+        update_handler.stop()
+        poller.stop()
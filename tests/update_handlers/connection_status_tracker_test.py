@@ -0,0 +1,124 @@
+import time
+
+import numpy as np
+from p4p.client.thread import Disconnected
+from p4p.nt import NTScalar
+from streaming_data_types.epics_connection_ep01 import ConnectionInfo, deserialise_ep01
+
+from forwarder.common import EpicsProtocol
+from forwarder.kafka.partitioning import PVPartitioner
+from forwarder.update_handlers.ca_update_handler import CAUpdateHandler
+from forwarder.update_handlers.connection_status_tracker import ConnectionStatusTracker
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+from tests.kafka.fake_producer import FakeProducer
+from tests.test_helpers.ca_fakes import FakeContext
+
+
+def _published_statuses(producer: FakeProducer):
+    return [deserialise_ep01(payload).status for payload in producer.published_payloads]
+
+
+def _pva_value_update():
+    update = NTScalar("i").wrap(np.int32(3))
+    update.timeStamp.secondsPastEpoch = int(time.time())
+    return update
+
+
+def test_repeated_ca_connection_states_are_only_published_once():
+    producer = FakeProducer()
+    tracker = ConnectionStatusTracker(producer)  # type: ignore
+    pv_status = tracker.register("some_pv", "some_topic")
+
+    pv_status.ca_state_changed("connected")
+    pv_status.ca_state_changed("connected")
+    pv_status.ca_state_changed("disconnected")
+
+    assert _published_statuses(producer) == [
+        ConnectionInfo.CONNECTED,
+        ConnectionInfo.DISCONNECTED,
+    ]
+
+
+def test_statuses_are_keyed_and_partitioned_like_the_updates_of_the_pv():
+    producer = FakeProducer()
+    tracker = ConnectionStatusTracker(producer)  # type: ignore
+    pv_status = tracker.register("some_pv", "some_topic", PVPartitioner((3,)))
+
+    pv_status.ca_state_changed("connected")
+    pv_status.ca_state_changed("disconnected")
+
+    assert producer.published_keys == [b"some_pv"] * 2
+    assert producer.published_partitions == [3, 3]
+
+
+def test_pva_disconnect_before_first_connection_is_not_published():
+    producer = FakeProducer()
+    tracker = ConnectionStatusTracker(producer)  # type: ignore
+    pv_status = tracker.register("some_pv", "some_topic")
+
+    pv_status.pva_update(Disconnected())
+    pv_status.pva_update(_pva_value_update())
+    pv_status.pva_update(_pva_value_update())
+    pv_status.pva_update(Disconnected())
+
+    assert _published_statuses(producer) == [
+        ConnectionInfo.CONNECTED,
+        ConnectionInfo.DISCONNECTED,
+    ]
+
+
+def test_handlers_for_same_pv_and_topic_share_status_until_all_released():
+    producer = FakeProducer()
+    tracker = ConnectionStatusTracker(producer)  # type: ignore
+    first = tracker.register("some_pv", "some_topic")
+    second = tracker.register("some_pv", "some_topic")
+
+    first.ca_state_changed("connected")
+    second.ca_state_changed("connected")
+    assert first is second
+    assert producer.messages_published == 1
+
+    first.release()
+    assert tracker.register("some_pv", "some_topic") is second
+
+
+def test_summary_publishes_current_status_of_every_connected_pv():
+    producer = FakeProducer()
+    tracker = ConnectionStatusTracker(producer)  # type: ignore
+    tracker.register("never_connected_pv", "some_topic")
+    for name in ("pv_1", "pv_2"):
+        tracker.register(name, "some_topic").ca_state_changed("connected")
+    producer.published_payloads.clear()
+
+    tracker.publish_summary()
+
+    assert {
+        deserialise_ep01(payload).source_name for payload in producer.published_payloads
+    } == {"pv_1", "pv_2"}
+
+
+def test_ca_update_handler_forwards_connection_state_to_shared_tracker():
+    producer = FakeProducer()
+    tracker = ConnectionStatusTracker(producer)  # type: ignore
+    context = FakeContext()
+    serialisers = create_serialiser_list(producer, "some_pv", "some_topic", "f144", EpicsProtocol.CA, include_connection_status=False)  # type: ignore
+    update_handler = CAUpdateHandler(context, "some_pv", serialisers, tracker.register("some_pv", "some_topic"))  # type: ignore
+
+    context.call_connection_state_callback_with_fake_state_change("connected")
+    update_handler.stop()
+
+    assert _published_statuses(producer) == [ConnectionInfo.CONNECTED]
+
+
+def test_connection_counts_are_grouped_by_status():
+    tracker = ConnectionStatusTracker(FakeProducer())  # type: ignore
+    tracker.register("pv_1", "some_topic").ca_state_changed("connected")
+    tracker.register("pv_2", "some_topic").ca_state_changed("connected")
+    tracker.register("pv_3", "some_topic").ca_state_changed("disconnected")
+    tracker.register("pv_4", "some_topic")
+
+    assert tracker.connection_counts() == {
+        "connected": 2,
+        "disconnected": 1,
+        "never_connected": 1,
+    }
@@ -0,0 +1,112 @@
+from unittest import mock
+
+import numpy as np
+from caproto import ChannelType, ReadNotifyResponse, TimeStamp
+from p4p.nt import NTScalar
+
+from forwarder.update_handlers.decoded_update import (
+    ValueConversion,
+    decode_ca_update,
+    decode_pva_update,
+    extract_ca_value,
+    extract_pva_value,
+)
+from tests.test_helpers.ca_updates import ca_update
+
+
+def test_ca_update_is_decoded():
+    update = ReadNotifyResponse(
+        np.array([42]).astype(np.int32),
+        ChannelType.TIME_INT,
+        1,
+        1,
+        1,
+        metadata=(5, 2, TimeStamp(1, 500)),
+    )
+
+    decoded = decode_ca_update(update)
+
+    assert decoded.severity == 2
+    assert decoded.status == 5
+    assert decoded.type_id == ChannelType.TIME_INT
+    assert decoded.value == 42
+
+
+def test_pva_update_is_decoded():
+    update = NTScalar("d").wrap(4.2)
+    update.timeStamp.secondsPastEpoch = 3
+    update.timeStamp.nanoseconds = 7
+    update.alarm.severity = 1
+    update.alarm.message = "HIGH_ALARM"
+
+    decoded = decode_pva_update(update)
+
+    assert decoded.timestamp_ns == 3_000_000_007
+    assert decoded.severity == 1
+    assert decoded.message == "HIGH_ALARM"
+    assert decoded.type_id == "epics:nt/NTScalar:1.0"
+    assert decoded.value == 4.2
+
+
+def test_value_is_only_extracted_once():
+    decoded = decode_pva_update(NTScalar("i").wrap(3))
+
+    with mock.patch(
+        "forwarder.update_handlers.decoded_update.extract_pva_value",
+        return_value=np.array(3),
+    ) as extract:
+        decoded.value
+        decoded.value
+
+    assert extract.call_count == 1
+
+
+def test_conversion_gives_the_same_ca_values_as_extracting_them():
+    conversion = ValueConversion()
+
+    for update in (
+        ca_update(np.array([1.5, 2.5], dtype=">f8"), dtype=None),
+        ca_update(
+            np.array([7], dtype=">i2"), channel_type=ChannelType.TIME_INT, dtype=None
+        ),
+        ca_update(np.array([1.5, 2.5], dtype="<f8"), dtype=None),
+    ):
+        value = decode_ca_update(update, conversion).value
+        expected = extract_ca_value(update)
+        assert value.dtype == expected.dtype
+        assert value.dtype.isnative
+        assert np.array_equal(value, expected)
+
+
+def test_conversion_gives_the_same_pva_values_as_extracting_them():
+    conversion = ValueConversion()
+
+    for update in (
+        NTScalar("d").wrap(4.2),
+        NTScalar("ai").wrap([1, 2, 3]),
+        NTScalar("ad").wrap([1.0, 2.0]),
+        NTScalar("s").wrap("text"),
+    ):
+        value = decode_pva_update(update, conversion).value
+        expected = extract_pva_value(update)
+        assert value.dtype == expected.dtype
+        assert np.array_equal(value, expected)
+
+
+def test_pva_type_is_only_looked_up_when_it_changes():
+    conversion = ValueConversion()
+
+    with mock.patch(
+        "forwarder.update_handlers.decoded_update._p4p_value_type_code",
+        side_effect=lambda update: update.type()["value"][-1],
+    ) as type_code:
+        for value in (1, 2, 3):
+            decode_pva_update(NTScalar("ai").wrap([value]), conversion).value
+        assert type_code.call_count == 1
+
+        decode_pva_update(NTScalar("ad").wrap([1.0]), conversion).value
+        assert type_code.call_count == 2
+
+        conversion.reset()
+        decode_pva_update(NTScalar("ad").wrap([1.0]), conversion).value
+        assert type_code.call_count == 3
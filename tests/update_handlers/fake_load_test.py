@@ -0,0 +1,170 @@
+import time
+
+import numpy as np
+import pytest
+from streaming_data_types.logdata_f144 import deserialise_f144
+from streaming_data_types.utils import get_schema
+
+from forwarder.channel_policy import FakeProfile
+from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.fake_load import FakeLoad, generate_values
+from forwarder.update_handlers.fake_update_handler import FakeUpdateHandler
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+from tests.kafka.fake_producer import FakeProducer
+
+
+def _create_handler(producer, fake_load, pv_name="SIM:PV", profile=None):
+    return FakeUpdateHandler(
+        create_serialiser_list(producer, pv_name, "data", "f144", EpicsProtocol.FAKE),  # type: ignore
+        "f144",
+        100,
+        fake_load=fake_load,
+        profile=profile,
+    )
+
+
+def _wait_for(condition, timeout_s=2.0):
+    deadline_s = time.monotonic() + timeout_s
+    while not condition() and time.monotonic() < deadline_s:
+        time.sleep(0.01)
+
+
+def test_uniform_integers_are_within_range():
+    values = generate_values(
+        FakeProfile(low=-5, high=5), np.random.default_rng(0), (100, 10)
+    )
+
+    assert values.shape == (100, 10)
+    assert values.dtype == np.int32
+    assert values.min() >= -5 and values.max() <= 5
+
+
+def test_normal_values_have_the_given_mean():
+    values = generate_values(
+        FakeProfile(distribution="normal", mean=50.0, std=2.0, dtype="float64"),
+        np.random.default_rng(0),
+        (1000, 10),
+    )
+
+    assert values.dtype == np.float64
+    assert values.mean() == pytest.approx(50.0, abs=0.1)
+
+
+def test_random_walk_continues_from_the_last_values():
+    walk = np.full((3, 1), 10.0)
+    profile = FakeProfile(distribution="random_walk", std=0.0, dtype="float64")
+    rng = np.random.default_rng(0)
+
+    values = generate_values(profile, rng, (3, 1), walk)
+
+    assert np.all(values == 10.0)
+    walk += 1.0
+    assert np.all(generate_values(profile, rng, (3, 1), walk) == 11.0)
+
+
+def test_all_fake_pvs_are_updated_from_one_thread():
+    producer = FakeProducer()
+    fake_load = FakeLoad(seed=0)
+    profile = FakeProfile(rate=50.0, array_size=4, dtype="float64")
+    handlers = [
+        _create_handler(producer, fake_load, f"SIM:PV:{index}", profile)
+        for index in range(20)
+    ]
+    try:
+        _wait_for(lambda: producer.messages_published >= 100)
+    finally:
+        for handler in handlers:
+            handler.stop()
+        fake_load.stop()
+
+    updates = [
+        deserialise_f144(payload)
+        for payload in producer.published_payloads
+        if get_schema(payload) == "f144"
+    ]
+    assert {update.source_name for update in updates} == {
+        f"SIM:PV:{index}" for index in range(20)
+    }
+    assert all(update.value.shape == (4,) for update in updates)
+
+
+def test_stopped_handler_is_not_updated():
+    producer = FakeProducer()
+    fake_load = FakeLoad()
+    handler = _create_handler(producer, fake_load, profile=FakeProfile(rate=100.0))
+    try:
+        _wait_for(lambda: producer.messages_published > 0)
+        handler.stop()
+        published = producer.messages_published
+        time.sleep(0.05)
+
+        assert published > 0
+        assert producer.messages_published == published
+    finally:
+        fake_load.stop()
+
+
+def test_handler_without_a_fake_load_has_its_own():
+    producer = FakeProducer()
+    handler = _create_handler(producer, None, profile=FakeProfile(rate=100.0))
+    try:
+        _wait_for(lambda: producer.messages_published > 0)
+    finally:
+        handler.stop()
+
+    assert producer.messages_published > 0
+
+
+def test_other_fake_pvs_are_updated_if_the_values_of_one_group_cannot_be_generated():
+    producer = FakeProducer()
+    fake_load = FakeLoad(seed=0)
+    # Not accepted in a channel policy file, as there is no integer in the range
+    bad_handler = _create_handler(
+        producer, fake_load, "SIM:BAD", FakeProfile(rate=100.0, low=0.2, high=0.8)
+    )
+    handler = _create_handler(producer, fake_load, "SIM:GOOD", FakeProfile(rate=100.0))
+
+    def _sources():
+        return [
+            deserialise_f144(payload).source_name
+            for payload in producer.published_payloads
+            if get_schema(payload) == "f144"
+        ]
+
+    try:
+        _wait_for(lambda: len(_sources()) >= 5)
+    finally:
+        handler.stop()
+        bad_handler.stop()
+        fake_load.stop()
+
+    assert len(_sources()) >= 5
+    assert set(_sources()) == {"SIM:GOOD"}
+
+
+def test_random_walks_continue_when_a_fake_pv_is_removed():
+    producer = FakeProducer()
+    # All of the fake PVs are in one batch
+    fake_load = FakeLoad(resolution_s=1.0, seed=0)
+    profile = FakeProfile(
+        rate=50.0, distribution="random_walk", mean=1000.0, std=0.1, dtype="float64"
+    )
+    handlers = [
+        _create_handler(producer, fake_load, f"SIM:PV:{index}", profile)
+        for index in range(3)
+    ]
+    try:
+        handlers[0].stop()
+        _wait_for(lambda: producer.messages_published >= 10)
+    finally:
+        for handler in handlers[1:]:
+            handler.stop()
+        fake_load.stop()
+
+    updates = [
+        deserialise_f144(payload)
+        for payload in producer.published_payloads
+        if get_schema(payload) == "f144"
+    ]
+    assert {update.source_name for update in updates} == {"SIM:PV:1", "SIM:PV:2"}
+    assert all(abs(update.value - 1000.0) < 10.0 for update in updates)
@@ -1,3 +1,6 @@
+import time
+
+import numpy as np
 import pytest
 from streaming_data_types.logdata_f142 import deserialise_f142
 from streaming_data_types.timestamps_tdct import deserialise_tdct
@@ -33,7 +36,7 @@ def test_update_handler_publishes_update():
     pv_source_name = "source_name"
     try:
         fake_update_handler = FakeUpdateHandler(create_serialiser_list(producer, pv_source_name, "output_topic", "f142", EpicsProtocol.FAKE), "f142", 100)  # type: ignore
-        fake_update_handler._timer_callback()
+        fake_update_handler.publish(np.array([5]), time.time_ns())
 
         assert got_f142
         assert pv_name == pv_source_name
@@ -58,7 +61,7 @@ def test_update_handler_publishes_tdct_update():
     pv_source_name = "source_name"
     try:
         fake_update_handler = FakeUpdateHandler(create_serialiser_list(producer, pv_source_name, "output_topic", "tdct", EpicsProtocol.FAKE), "tdct", 100)  # type: ignore
-        fake_update_handler._timer_callback()
+        fake_update_handler.publish(np.array([5]), time.time_ns())
 
         assert got_tdct
         assert pv_name == pv_source_name
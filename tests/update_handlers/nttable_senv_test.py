@@ -57,6 +57,62 @@ def test_serialise_nttable():
     assert fb_update.message_counter == 0
 
 
+def _table_update(values, timestamps, labels=("value", "timestamp")):
+    table = NTTable.buildType(columns=[("column0", "ad"), ("column1", "aL")])
+    return Value(
+        table,
+        {
+            "labels": list(labels),
+            "value": {"column0": values, "column1": timestamps},
+        },
+    )
+
+
+def test_serialise_nttable_rounds_float_values():
+    serialiser = nttable_senv_PVASerialiser("some_pv")
+    timestamps = np.arange(50, 54, dtype=np.uint64)
+
+    first, _ = serialiser.serialise(
+        _table_update(np.array([0.4, 1.6, -2.5, 3.5]), timestamps)
+    )
+    second, _ = serialiser.serialise(
+        _table_update(np.array([9.9, 10.1]), timestamps[:2])
+    )
+
+    assert deserialise_senv(first).values.tolist() == [0, 2, -2, 4]
+    assert deserialise_senv(second).values.tolist() == [10, 10]
+
+
+def test_serialise_nttable_follows_changed_labels():
+    serialiser = nttable_senv_PVASerialiser("some_pv")
+    values = np.array([1.0, 2.0])
+    timestamps = np.array([100, 200], dtype=np.uint64)
+    serialiser.serialise(_table_update(values, timestamps))
+
+    message, _ = serialiser.serialise(
+        _table_update(
+            timestamps.astype(np.float64),
+            values.astype(np.uint64),
+            labels=("timestamp", "value"),
+        )
+    )
+
+    fb_update = deserialise_senv(message)
+    assert fb_update.values.tolist() == [1, 2]
+    assert fb_update.value_ts.tolist() == [100, 200]
+
+
+def test_serialise_nttable_rejects_tables_without_required_columns():
+    serialiser = nttable_senv_PVASerialiser("some_pv")
+
+    with pytest.raises(RuntimeError):
+        serialiser.serialise(
+            _table_update(
+                np.array([1.0]), np.array([1], dtype=np.uint64), labels=("a", "b")
+            )
+        )
+
+
 def test_update_handler_publishes_senv_alarm_update(context, producer, pv_source_name):
     pv_timestamp_s = time()  # seconds from unix epoch
     values: NDArray = np.arange(-50, 50, 11, dtype=np.float32)
@@ -0,0 +1,229 @@
+import threading
+import time
+from unittest import mock
+
+from streaming_data_types.logdata_f142 import deserialise_f142
+
+from forwarder.channel_policy import ChannelFilter, parse_channel_policies
+from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.rate_limiter import RateLimiters
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+from forwarder.utils import Counter
+from tests.kafka.fake_producer import FakeProducer
+from tests.test_helpers.ca_updates import ca_update
+
+
+class FakeClock:
+    def __init__(self):
+        self.now_s = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now_s
+
+
+def _create_rate_limiters(config, counter=None):
+    # The flush timer is not used in the tests, flush() is called directly
+    return RateLimiters(
+        parse_channel_policies(config), counter, flush_period_ms=3_600_000
+    )
+
+
+def _create_tracker(producer, rate_limiters, pv_name="SIM:PV", topic="topic"):
+    (tracker,) = create_serialiser_list(
+        producer,
+        pv_name,
+        topic,
+        "f142",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+        rate_limiter=rate_limiters.limiter_for(pv_name, "f142", topic),
+    )
+    return tracker
+
+
+def _published_values(producer):
+    return [deserialise_f142(payload).value for payload in producer.published_payloads]
+
+
+@mock.patch("forwarder.update_handlers.rate_limiter.time", new_callable=FakeClock)
+def test_updates_over_the_limit_are_dropped_and_counted(clock):
+    counter = Counter()
+    rate_limiters = _create_rate_limiters(
+        {"channel": [{"pattern": "*", "max_rate": 1, "burst": 2}]}, counter
+    )
+    producer = FakeProducer()
+    tracker = _create_tracker(producer, rate_limiters)
+    try:
+        for value in range(5):
+            tracker.process_ca_message(ca_update(value))
+        clock.now_s += 1.0
+        tracker.process_ca_message(ca_update(5))
+
+        assert _published_values(producer) == [0, 1, 5]
+        assert counter.value == 3
+    finally:
+        tracker.stop()
+        rate_limiters.stop()
+
+
+@mock.patch("forwarder.update_handlers.rate_limiter.time", new_callable=FakeClock)
+def test_deadband_is_relative_to_the_last_published_value_not_a_dropped_one(clock):
+    rate_limiters = _create_rate_limiters(
+        {"channel": [{"pattern": "*", "max_rate": 1, "burst": 1}]}
+    )
+    producer = FakeProducer()
+    (tracker,) = create_serialiser_list(
+        producer,  # type: ignore
+        "SIM:PV",
+        "topic",
+        "f142",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+        channel_filter=ChannelFilter(absolute_deadband=1.0),
+        rate_limiter=rate_limiters.limiter_for("SIM:PV", "f142", "topic"),
+    )
+    try:
+        tracker.process_ca_message(ca_update(0.0))
+        tracker.process_ca_message(ca_update(5.0))
+        clock.now_s += 1.0
+        tracker.process_ca_message(ca_update(5.5))
+
+        assert _published_values(producer) == [0.0, 5.5]
+    finally:
+        tracker.stop()
+        rate_limiters.stop()
+
+
+@mock.patch("forwarder.update_handlers.rate_limiter.time", new_callable=FakeClock)
+def test_deadband_is_relative_to_a_kept_latest_update_once_it_is_published(clock):
+    rate_limiters = _create_rate_limiters(
+        {"channel": [{"pattern": "*", "max_rate": 1, "overflow": "keep_latest"}]}
+    )
+    producer = FakeProducer()
+    (tracker,) = create_serialiser_list(
+        producer,  # type: ignore
+        "SIM:PV",
+        "topic",
+        "f142",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+        channel_filter=ChannelFilter(absolute_deadband=1.0),
+        rate_limiter=rate_limiters.limiter_for("SIM:PV", "f142", "topic"),
+    )
+    try:
+        tracker.process_ca_message(ca_update(0.0))
+        tracker.process_ca_message(ca_update(5.0))
+        clock.now_s += 1.0
+        rate_limiters.flush()
+        clock.now_s += 1.0
+        tracker.process_ca_message(ca_update(5.5))
+
+        assert _published_values(producer) == [0.0, 5.0]
+    finally:
+        tracker.stop()
+        rate_limiters.stop()
+
+
+@mock.patch("forwarder.update_handlers.rate_limiter.time", new_callable=FakeClock)
+def test_decimate_does_not_allow_bursts(clock):
+    rate_limiters = _create_rate_limiters(
+        {"channel": [{"pattern": "*", "max_rate": 2, "overflow": "decimate"}]}
+    )
+    producer = FakeProducer()
+    tracker = _create_tracker(producer, rate_limiters)
+    try:
+        # Ten updates a second for one second
+        for value in range(10):
+            tracker.process_ca_message(ca_update(value))
+            clock.now_s += 0.1
+
+        assert _published_values(producer) == [0, 5]
+    finally:
+        tracker.stop()
+        rate_limiters.stop()
+
+
+@mock.patch("forwarder.update_handlers.rate_limiter.time", new_callable=FakeClock)
+def test_keep_latest_publishes_last_throttled_update_when_allowed(clock):
+    rate_limiters = _create_rate_limiters(
+        {"channel": [{"pattern": "*", "max_rate": 1, "overflow": "keep_latest"}]}
+    )
+    producer = FakeProducer()
+    tracker = _create_tracker(producer, rate_limiters)
+    try:
+        for value in range(3):
+            tracker.process_ca_message(ca_update(value))
+        rate_limiters.flush()
+        assert _published_values(producer) == [0]
+
+        clock.now_s += 1.0
+        rate_limiters.flush()
+        assert _published_values(producer) == [0, 2]
+
+        clock.now_s += 1.0
+        rate_limiters.flush()
+        assert _published_values(producer) == [0, 2]
+    finally:
+        tracker.stop()
+        rate_limiters.stop()
+
+
+@mock.patch("forwarder.update_handlers.rate_limiter.time", new_callable=FakeClock)
+def test_keep_latest_update_is_not_published_after_a_newer_update(clock):
+    rate_limiters = _create_rate_limiters(
+        {
+            "channel": [
+                {"pattern": "*", "max_rate": 1, "burst": 1, "overflow": "keep_latest"}
+            ]
+        }
+    )
+    producer = FakeProducer()
+    tracker = _create_tracker(producer, rate_limiters)
+    limiter = tracker._rate_limiter
+    publishing = threading.Event()
+
+    def _slow_publish(message, timestamp_ns):
+        publishing.set()
+        time.sleep(0.1)
+        return tracker._publish_and_cache(message, timestamp_ns)
+
+    limiter.set_publisher(_slow_publish)  # type: ignore
+    try:
+        tracker.process_ca_message(ca_update(0))
+        tracker.process_ca_message(ca_update(1))
+        clock.now_s += 1.0
+        flush_thread = threading.Thread(target=rate_limiters.flush)
+        flush_thread.start()
+        publishing.wait()
+        clock.now_s += 1.0
+        tracker.process_ca_message(ca_update(2))
+        flush_thread.join()
+
+        assert _published_values(producer) == [0, 1, 2]
+    finally:
+        tracker.stop()
+        rate_limiters.stop()
+
+
+@mock.patch("forwarder.update_handlers.rate_limiter.time", new_callable=FakeClock)
+def test_topic_limit_is_shared_by_channels(clock):
+    rate_limiters = _create_rate_limiters(
+        {"topic": [{"pattern": "noisy_*", "max_rate": 1, "burst": 2}]}
+    )
+    producer = FakeProducer()
+    trackers = [
+        _create_tracker(producer, rate_limiters, f"SIM:PV{index}", "noisy_topic")
+        for index in range(3)
+    ]
+    other_tracker = _create_tracker(producer, rate_limiters, "SIM:OTHER", "topic")
+    try:
+        for value, tracker in enumerate(trackers):
+            tracker.process_ca_message(ca_update(value))
+        other_tracker.process_ca_message(ca_update(10))
+
+        assert _published_values(producer) == [0, 1, 10]
+        assert rate_limiters.limiter_for("SIM:OTHER", "f142", "topic") is None
+    finally:
+        for tracker in trackers + [other_tracker]:
+            tracker.stop()
+        rate_limiters.stop()
@@ -0,0 +1,217 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from caproto import ChannelType
+from streaming_data_types.array_1d_se00 import deserialise_se00
+from streaming_data_types.utils import get_schema
+
+from forwarder.channel_policy import BatchSettings
+from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.batch_flusher import BatchFlusher
+from forwarder.update_handlers.se00_serialiser import se00_CASerialiser
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+from tests.kafka.fake_producer import FakeProducer
+from tests.test_helpers.ca_updates import ca_update
+
+
+def test_batch_is_published_when_full():
+    serialiser = se00_CASerialiser("source_name", batch_size=3, batch_period_ms=60_000)
+    start_s = 1_700_000_000.0
+
+    results = [
+        serialiser.serialise(ca_update(float(i), start_s + i * 0.01)) for i in range(3)
+    ]
+
+    assert results[0] == (None, None)
+    assert results[1] == (None, None)
+    message, timestamp = results[2]
+    assert message is not None
+    data = deserialise_se00(message)
+    assert data.name == "source_name"
+    assert data.message_counter == 0
+    assert data.values.tolist() == [0.0, 1.0, 2.0]
+    assert len(data.value_ts) == 3
+    assert data.value_ts[0] == timestamp
+    assert data.timestamp_unix_ns == timestamp
+
+
+def test_messages_are_numbered():
+    serialiser = se00_CASerialiser("source_name", batch_size=1, batch_period_ms=60_000)
+
+    counters = [
+        deserialise_se00(
+            serialiser.serialise(ca_update(1.0, time.time()))[0]
+        ).message_counter
+        for _ in range(3)
+    ]
+
+    assert counters == [0, 1, 2]
+
+
+def test_flush_only_publishes_batches_older_than_the_period():
+    serialiser = se00_CASerialiser("source_name", batch_size=10, batch_period_ms=50)
+    serialiser.serialise(ca_update(1.0, time.time()))
+
+    assert serialiser.flush() == (None, None)
+    time.sleep(0.06)
+    message, _ = serialiser.flush()
+    assert message is not None
+    assert deserialise_se00(message).values.tolist() == [1.0]
+    assert serialiser.flush(force=True) == (None, None)
+
+
+def test_arrays_are_rejected():
+    serialiser = se00_CASerialiser("source_name")
+
+    with pytest.raises(RuntimeError):
+        serialiser.serialise(ca_update([1.0, 2.0], time.time()))
+
+
+def test_batch_with_old_type_is_published_when_type_changes():
+    serialiser = se00_CASerialiser("source_name", batch_size=10, batch_period_ms=60_000)
+    serialiser.serialise(ca_update(1.5, time.time()))
+
+    message, _ = serialiser.serialise(
+        ca_update(2, time.time(), ChannelType.TIME_LONG, dtype=np.int32)
+    )
+
+    assert message is not None
+    assert deserialise_se00(message).values.tolist() == [1.5]
+    message, _ = serialiser.flush(force=True)
+    assert deserialise_se00(message).values.tolist() == [2]
+
+
+def _se00_values(producer: FakeProducer):
+    return [
+        deserialise_se00(message).values.tolist()
+        for message in producer.published_payloads
+        if get_schema(message) == "se00"
+    ]
+
+
+def test_tracker_flushes_batch_in_the_background_and_on_stop():
+    producer = FakeProducer()
+    (tracker,) = create_serialiser_list(
+        producer,  # type: ignore
+        "source_name",
+        "output_topic",
+        "se00",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+        batch_settings=BatchSettings(batch_size=100, batch_period_ms=20),
+    )
+    try:
+        tracker.process_ca_message(ca_update(1.0, time.time()))
+        deadline = time.monotonic() + 2.0
+        while not _se00_values(producer) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        tracker.process_ca_message(ca_update(2.0, time.time()))
+    finally:
+        tracker.stop()
+
+    assert _se00_values(producer) == [[1.0], [2.0]]
+
+
+def test_batches_of_many_trackers_are_flushed_from_one_thread():
+    producer = FakeProducer()
+    batch_flusher = BatchFlusher()
+    threads_before = threading.active_count()
+    trackers = [
+        create_serialiser_list(
+            producer,  # type: ignore
+            f"source_name_{index}",
+            "output_topic",
+            "se00",
+            EpicsProtocol.CA,
+            include_connection_status=False,
+            batch_settings=BatchSettings(batch_size=100, batch_period_ms=20),
+            batch_flusher=batch_flusher,
+        )[0]
+        for index in range(20)
+    ]
+    try:
+        assert threading.active_count() == threads_before + 1
+        for tracker in trackers:
+            tracker.process_ca_message(ca_update(1.0, time.time()))
+        deadline = time.monotonic() + 2.0
+        while len(_se00_values(producer)) < 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        for tracker in trackers:
+            tracker.stop()
+        batch_flusher.stop()
+
+    assert _se00_values(producer) == [[1.0]] * 20
+
+
+def test_batches_are_not_republished_by_periodic_updates():
+    producer = FakeProducer()
+    (tracker,) = create_serialiser_list(
+        producer,  # type: ignore
+        "source_name",
+        "output_topic",
+        "se00",
+        EpicsProtocol.CA,
+        periodic_update_ms=10,
+        include_connection_status=False,
+        batch_settings=BatchSettings(batch_size=1, batch_period_ms=60_000),
+    )
+    try:
+        tracker.process_ca_message(ca_update(1.0, time.time()))
+        time.sleep(0.05)
+    finally:
+        tracker.stop()
+
+    assert _se00_values(producer) == [[1.0]]
+
+
+class _FirstPublishBlockingProducer(FakeProducer):
+    """
+    Blocks the first se00 publish until released, so another thread can try
+    to publish while it is in progress
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.publishing = threading.Event()
+        self.release = threading.Event()
+
+    def produce(self, topic, payload, *args, **kwargs):
+        if get_schema(payload) == "se00" and not self.publishing.is_set():
+            self.publishing.set()
+            self.release.wait(timeout=5)
+        super().produce(topic, payload, *args, **kwargs)
+
+
+def test_batch_flushed_while_an_update_arrives_is_published_first():
+    producer = _FirstPublishBlockingProducer()
+    (tracker,) = create_serialiser_list(
+        producer,  # type: ignore
+        "source_name",
+        "output_topic",
+        "se00",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+        batch_settings=BatchSettings(batch_size=3, batch_period_ms=60_000),
+    )
+    start_s = time.time()
+    try:
+        tracker.process_ca_message(ca_update(0.0, start_s))
+        flushing_thread = threading.Thread(
+            target=tracker.flush_batch, kwargs={"force": True}
+        )
+        flushing_thread.start()
+        assert producer.publishing.wait(timeout=5)
+        release_timer = threading.Timer(0.1, producer.release.set)
+        release_timer.start()
+        # Completes a batch while the flushed batch is being published
+        for value in range(1, 4):
+            tracker.process_ca_message(ca_update(float(value), start_s + value * 1e-3))
+        flushing_thread.join()
+        release_timer.join()
+    finally:
+        tracker.stop()
+
+    assert _se00_values(producer) == [[0.0], [1.0, 2.0, 3.0]]
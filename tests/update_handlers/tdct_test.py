@@ -1,11 +1,16 @@
 import numpy as np
 import pytest
+from caproto import ChannelType, ReadNotifyResponse, TimeStamp
 from numpy.typing import NDArray
 from p4p.nt import NTScalar
 from streaming_data_types.timestamps_tdct import deserialise_tdct
 
 from forwarder.common import EpicsProtocol
-from forwarder.update_handlers.tdct_serialiser import tdct_PVASerialiser
+from forwarder.update_handlers.tdct_serialiser import (
+    _TimestampBuffer,
+    tdct_CASerialiser,
+    tdct_PVASerialiser,
+)
 
 from .pva_update_handler_test import update_handler_publishes_alarm_update
 
@@ -88,3 +93,42 @@ def test_tdct_serialiser_handles_empty_array():
 
 def test_update_handler_publishes_tdct_alarm_update(context, producer, pv_source_name):
     return update_handler_publishes_alarm_update(context, producer, pv_source_name)
+
+
+def test_timestamp_buffer_is_reused_and_grown():
+    timestamp_buffer = _TimestampBuffer()
+
+    first = timestamp_buffer.offset(np.array([1, 2, 3], dtype=np.int32), 10)
+    second = timestamp_buffer.offset(np.array([-1, 0], dtype=np.int32), 10)
+
+    assert second.dtype == np.uint64
+    assert second.tolist() == [9, 10]
+    assert np.shares_memory(first, second)
+    larger = timestamp_buffer.offset(np.arange(1000, dtype=np.int32), 10)
+    assert larger.tolist() == list(range(10, 1010))
+
+
+def test_tdct_ca_serialiser_converts_big_endian_relative_timestamps():
+    input_relative_timestamps = np.array([-3, 0, 100], dtype=">i4")
+    update = ReadNotifyResponse(
+        input_relative_timestamps,
+        ChannelType.TIME_LONG,
+        input_relative_timestamps.size,
+        1,
+        1,
+        metadata=(0, 0, TimeStamp(1_600_000_000, 10)),
+    )
+    serialiser = tdct_CASerialiser("tst_source")
+
+    first_message, origin_time = serialiser.serialise(update)
+    second_message, _ = serialiser.serialise(update)
+
+    assert origin_time is not None
+    published_data = deserialise_tdct(first_message)
+    assert published_data.timestamps.tolist() == [
+        origin_time - 3,
+        origin_time,
+        origin_time + 100,
+    ]
+    assert published_data.sequence_counter == 0
+    assert deserialise_tdct(second_message).sequence_counter == 1
@@ -2,12 +2,14 @@ from datetime import datetime, timedelta
 from unittest import mock
 
 from forwarder.kafka.kafka_producer import KafkaProducer
+from forwarder.update_handlers.schema_serialisers import CASerialiser
 from forwarder.update_handlers.serialiser_tracker import SerialiserTracker
 
 
 def create_handler():
     mock_producer = mock.MagicMock(spec=KafkaProducer)
-    mock_serialiser = mock.MagicMock()
+    # Specced so that it is not taken for a batching serialiser
+    mock_serialiser = mock.MagicMock(spec=CASerialiser)
     handler = SerialiserTracker(
         mock_serialiser, mock_producer, "::SOME_PV::", "::SOME_TOPIC::"
     )
@@ -68,3 +70,25 @@ def test_out_of_order_timestamps_ignored():
 
     assert mock_producer.produce.call_count == 2
     handler.stop()
+
+
+def test_alarm_timestamps_are_checked_separately_from_value_timestamps():
+    mock_producer = mock.MagicMock(spec=KafkaProducer)
+    now_ns = datetime.now().timestamp() * 1e9
+    mock_serialiser = mock.MagicMock(spec=CASerialiser)
+    mock_serialiser.serialise.return_value = (b"value", now_ns)
+    mock_alarm_serialiser = mock.MagicMock()
+    mock_alarm_serialiser.serialise.return_value = (b"alarm", now_ns - 1e9)
+    handler = SerialiserTracker(
+        mock_serialiser,
+        mock_producer,
+        "::SOME_PV::",
+        "::SOME_TOPIC::",
+        alarm_serialiser=mock_alarm_serialiser,
+    )
+
+    handler.process_ca_message(mock.MagicMock())
+
+    published = [call.args[1] for call in mock_producer.produce.call_args_list]
+    assert published == [b"value", b"alarm"]
+    handler.stop()
@@ -0,0 +1,91 @@
+from streaming_data_types.logdata_f144 import deserialise_f144
+from streaming_data_types.utils import get_schema
+
+from forwarder.channel_policy import ChannelFilter
+from forwarder.common import EpicsProtocol
+from forwarder.update_handlers.decoded_update import decode_ca_update
+from forwarder.update_handlers.serialiser_tracker import create_serialiser_list
+from forwarder.update_handlers.update_filter import UpdateFilter
+from tests.kafka.fake_producer import FakeProducer
+from tests.test_helpers.ca_updates import ca_update
+
+
+def _accepted(update_filter: UpdateFilter, values):
+    accepted = []
+    for value in values:
+        accepted.append(update_filter.check(decode_ca_update(ca_update(value))))
+        if accepted[-1]:
+            update_filter.commit()
+    return accepted
+
+
+def test_absolute_deadband_drops_small_changes():
+    update_filter = UpdateFilter(ChannelFilter(absolute_deadband=0.5))
+
+    assert _accepted(update_filter, [1.0, 1.2, 1.5, 1.6, 0.9]) == [
+        True,
+        False,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_relative_deadband_is_relative_to_last_forwarded_value():
+    update_filter = UpdateFilter(ChannelFilter(relative_deadband=0.1))
+
+    assert _accepted(update_filter, [100.0, 109.0, 111.0, 123.0]) == [
+        True,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_unchanged_arrays_are_suppressed():
+    update_filter = UpdateFilter(ChannelFilter(suppress_unchanged_arrays=True))
+
+    assert _accepted(
+        update_filter, [[1.0, 2.0], [1.0, 2.0], [1.0, 3.0], [1.0, 2.0]]
+    ) == [True, False, True, True]
+
+
+def test_reset_forwards_next_value():
+    update_filter = UpdateFilter(ChannelFilter(absolute_deadband=10))
+    _accepted(update_filter, [1.0])
+
+    update_filter.reset()
+
+    assert _accepted(update_filter, [1.0]) == [True]
+
+
+def test_values_which_are_not_committed_are_not_compared_against():
+    update_filter = UpdateFilter(ChannelFilter(absolute_deadband=0.5))
+    _accepted(update_filter, [1.0])
+
+    assert update_filter.check(decode_ca_update(ca_update(2.0)))
+    # 2.0 was not published, so 2.2 is compared with 1.0
+    assert _accepted(update_filter, [2.2]) == [True]
+
+
+def test_filtered_values_are_not_published_but_alarm_changes_are():
+    producer = FakeProducer()
+    (tracker,) = create_serialiser_list(
+        producer,  # type: ignore
+        "source_name",
+        "output_topic",
+        "f144",
+        EpicsProtocol.CA,
+        include_connection_status=False,
+        channel_filter=ChannelFilter(absolute_deadband=1.0),
+    )
+    try:
+        tracker.process_ca_message(ca_update(5.0))
+        tracker.process_ca_message(ca_update(5.1))
+        tracker.process_ca_message(ca_update(5.2, severity=1))
+
+        schemas = [get_schema(message) for message in producer.published_payloads]
+        assert schemas == ["f144", "al00", "al00"]
+        assert deserialise_f144(producer.published_payloads[0]).value == 5.0
+    finally:
+        tracker.stop()
@@ -0,0 +1,76 @@
+from threading import Thread
+
+from forwarder.utils import Counter, LabelledCounter, LazyProxy
+
+
+def _increment_from_threads(counter: Counter, threads: int, increments: int):
+    def _increment():
+        for _ in range(increments):
+            counter.increment()
+
+    workers = [Thread(target=_increment) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def test_counter_counts_increments_from_all_threads():
+    counter = Counter()
+
+    _increment_from_threads(counter, threads=8, increments=10_000)
+    counter.increment(5)
+
+    assert counter.value == 80_005
+
+
+def test_counter_keeps_counts_of_finished_threads():
+    counter = Counter()
+    _increment_from_threads(counter, threads=3, increments=10)
+    assert counter.value == 30
+
+    _increment_from_threads(counter, threads=2, increments=10)
+
+    assert counter.value == 50
+    # The shards of the finished threads have been folded into one count
+    assert len(counter._shards) == 0
+
+
+def test_snapshot_gives_count_since_last_snapshot():
+    counter = Counter()
+    counter.increment(3)
+
+    assert counter.snapshot_and_reset() == 3
+    assert counter.snapshot_and_reset() == 0
+    counter.increment()
+    assert counter.snapshot_and_reset() == 1
+    assert counter.value == 4
+
+
+def test_labelled_counter_counts_each_label_separately():
+    counter = LabelledCounter()
+    counter.increment("topic_a")
+    counter.increment("topic_a")
+    counter.labels("topic_b").increment(4)
+
+    assert counter.values == {"topic_a": 2, "topic_b": 4}
+    assert counter.snapshot_and_reset() == {"topic_a": 2, "topic_b": 4}
+    counter.increment("topic_b")
+    assert counter.snapshot_and_reset() == {"topic_a": 0, "topic_b": 1}
+
+
+def test_lazy_proxy_creates_object_on_first_use_only():
+    created = []
+
+    def _create():
+        created.append(object())
+        return "forwarder"
+
+    proxy = LazyProxy(_create)
+    assert not proxy.created
+    assert not created
+
+    assert proxy.upper() == "FORWARDER"
+    assert proxy.startswith("for")
+    assert proxy.created
+    assert len(created) == 1